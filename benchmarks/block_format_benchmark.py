@@ -0,0 +1,75 @@
+#!/usr/bin/env python3.6
+"""
+Block format micro benchmark, per write size: write of a buffer built by copying the pattern (as writes were before
+the pattern registry) against zero-copy write of registry's payload with stamped headers, and read verification
+Run from repository root: python3 -m benchmarks.block_format_benchmark
+2018 samuels (c)
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'client'))
+from block_format import BLOCK_SIZE, HEADER, build_headers, verify_blocks, write_blocks  # noqa: E402
+from pattern_registry import PATTERNS  # noqa: E402
+
+__author__ = 'samuels'
+
+WRITE_SIZES = [4096 * 2 ** i for i in range(0, 9, 2)]  # 4KB..1MB
+PATTERN_ID = 1
+FILE_ID = 0xa3f0c
+TID = 12
+WRITER_ID = 0x5eed
+
+
+def copy_write(fd, offset, size):
+    headers = build_headers(offset, size, PATTERN_ID, FILE_ID, TID, WRITER_ID)
+    payload = PATTERNS.payload(PATTERN_ID)
+    buf = bytearray()
+    for header_offset in range(0, len(headers), HEADER.size):
+        buf += headers[header_offset:header_offset + HEADER.size]
+        buf += payload
+    os.lseek(fd, offset, os.SEEK_SET)
+    os.write(fd, buf)
+
+
+def zero_copy_write(fd, offset, size):
+    write_blocks(fd, offset, build_headers(offset, size, PATTERN_ID, FILE_ID, TID, WRITER_ID),
+                 PATTERNS.payload(PATTERN_ID))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Block format benchmark')
+    parser.add_argument('--megabytes', type=int, default=256, help="Data written and verified per measurement")
+    parser.add_argument('--path', type=str, default=os.devnull, help="File to write to, /dev/null measures CPU only")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    fd = os.open(args.path, os.O_RDWR | os.O_CREAT)
+    print("{0:>9} | {1:>17} | {2:>20} | {3:>13}".format("size", "copy write [MB/s]", "zero-copy write [MB/s]",
+                                                         "verify [MB/s]"))
+    try:
+        for size in WRITE_SIZES:
+            number = max(args.megabytes * 2 ** 20 // size, 1)
+            buf = bytearray()
+            for header_offset in range(0, size // BLOCK_SIZE * HEADER.size, HEADER.size):
+                buf += build_headers(size, size, PATTERN_ID, FILE_ID, TID, WRITER_ID)[header_offset:
+                                                                                      header_offset + HEADER.size]
+                buf += PATTERNS.payload(PATTERN_ID)
+            buf = bytes(buf)
+            assert verify_blocks(buf, size, size, FILE_ID, TID, PATTERNS) == (0, [])
+            copy_time = timeit.timeit(lambda: copy_write(fd, size, size), number=number)
+            zero_copy_time = timeit.timeit(lambda: zero_copy_write(fd, size, size), number=number)
+            verify_time = timeit.timeit(lambda: verify_blocks(buf, size, size, FILE_ID, TID, PATTERNS), number=number)
+            megabytes = number * size / 2 ** 20
+            print("{0:>9} | {1:>17.0f} | {2:>22.0f} | {3:>13.0f}".format(
+                size, megabytes / copy_time, megabytes / zero_copy_time, megabytes / verify_time))
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3.6
+"""
+Wire codecs micro benchmark: encode/decode cost and bytes on the wire per operation type
+Run from repository root: python3 -m benchmarks.codec_benchmark
+2018 samuels (c)
+"""
+import argparse
+import timeit
+import uuid
+
+from utils import wire_codec
+
+__author__ = 'samuels'
+
+TIMESTAMP = '2018/03/11 14:22:31.123456'
+TARGET = '/' + 'd' * 64 + '/' + 'f' * 40
+
+
+def sample_job(action, data):
+    data = dict(data, target=TARGET)
+    return [[uuid.uuid4().hex, {'action': action, 'data': data}]]
+
+
+def sample_result(action, data):
+    return {'message': 'jobs_done',
+            'results': [[uuid.uuid4().hex, {'result': 'success', 'action': action, 'target': TARGET,
+                                            'timestamp': TIMESTAMP, 'data': dict(data, duration=0.000123)}]]}
+
+
+SAMPLES = {
+    'mkdir': ({}, {'dirsize': 0}),
+    'touch': ({}, {'dirsize': 4096}),
+    'stat': ({'tid': 12, 'uuid': 'a3f0c'}, {'tid': 12, 'uuid': 'a3f0c'}),
+    'read': ({'tid': 12, 'uuid': 'a3f0c', 'offset': 1048576, 'chunk_size': 4096, 'write_tid': 9},
+             {'tid': 12, 'uuid': 'a3f0c', 'offset': 1048576, 'chunk_size': 4096}),
+    'write': ({'tid': 12, 'uuid': 'a3f0c', 'offset': 1048576, 'data_pattern_len': 4096, 'io_type': 'random'},
+              {'tid': 12, 'uuid': 'a3f0c', 'pattern_id': 1, 'chunk_size': 4096,
+               'hash': 1283627371831, 'offset': 1048576, 'io_type': 'random'}),
+    'rename': ({'tid': 12, 'uuid': 'a3f0c', 'rename_dest': 'r' * 64},
+               {'tid': 12, 'uuid': 'a3f0c', 'rename_dest': 'r' * 64}),
+    'truncate': ({'tid': 12, 'uuid': 'a3f0c'}, {'tid': 12, 'uuid': 'a3f0c', 'size': 4096}),
+}
+
+
+# Messages which don't survive key translation unless the codec escapes what it doesn't translate itself: integer
+# keys at any depth, integer actions. JSON turns integer keys into strings, it's not checked on these
+ROUND_TRIP_SAMPLES = (
+    {'data': {3: 'x', 0: 'y', -1: 'z', 30: 'w', 'action': 5}},
+    {'action': 2, 'message': 'jobs_done', 'results': [[7, {'action': 'read', 'data': {1: [{2: 'a'}]}}]]},
+    {'action': -3, 'timestamp': TIMESTAMP, -1: None},
+)
+
+
+def check_round_trip():
+    for name in wire_codec.supported_codecs():
+        codec = wire_codec.get_codec(name)
+        if codec is wire_codec.JsonCodec:
+            continue
+        for message in ROUND_TRIP_SAMPLES:
+            decoded = codec.decode(codec.encode(message))
+            assert decoded == message and [type(k) for k in decoded] == [type(k) for k in message], \
+                f"{name} doesn't round trip {message}: {decoded}"
+
+
+def measure(codec, message, number):
+    payload = codec.encode(message)
+    assert codec.decode(payload) == wire_codec.JsonCodec.decode(wire_codec.JsonCodec.encode(message))
+    encode_time = timeit.timeit(lambda: codec.encode(message), number=number) / number
+    decode_time = timeit.timeit(lambda: codec.decode(payload), number=number) / number
+    return len(payload), encode_time * 1e6, decode_time * 1e6
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Wire codecs benchmark')
+    parser.add_argument('--number', type=int, default=20000, help="Encode/decode calls per measurement")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    check_round_trip()
+    print("{0:>9} | {1:>6} | {2:>16} | {3:>6} | {4:>9} | {5:>9}".format(
+        "op", "kind", "codec", "bytes", "enc [us]", "dec [us]"))
+    for action, (job_data, result_data) in SAMPLES.items():
+        for kind, message in (('job', sample_job(action, job_data)), ('result', sample_result(action, result_data))):
+            for name in wire_codec.supported_codecs():
+                size, encode_time, decode_time = measure(wire_codec.get_codec(name), message, args.number)
+                print("{0:>9} | {1:>6} | {2:>16} | {3:>6} | {4:>9.2f} | {5:>9.2f}".format(
+                    action, kind, name, size, encode_time, decode_time))
+
+
+if __name__ == '__main__':
+    main()
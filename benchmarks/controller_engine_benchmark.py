@@ -0,0 +1,175 @@
+#!/usr/bin/env python3.6
+"""
+Controller engines benchmark: max jobs/sec and dispatch latency of threaded vs. asyncio engine.
+Controller is driven by fake clients which "execute" every job instantly and report success, so the only
+bottleneck is the Controller itself.
+Dispatch latency is measured on the client side, as the time between sending back a result and receiving the
+next job, with a single credit per client worker. Controller's CPU time is read from /proc, per job it's the cost of
+scheduling and (de)serializing, whatever the number of connections.
+With --broker, every fake client has its workers go through a per-host Broker, as dynamo_starter.py --broker does.
+Run from repository root: python3 -m benchmarks.controller_engine_benchmark
+2018 samuels (c)
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from datetime import datetime
+
+import zmq
+
+from client.broker import run_broker
+from config import CTRL_MSG_PORT
+from tree import dirtree
+from utils import wire_codec
+
+__author__ = 'samuels'
+
+FAKE_RESULT_DATA = {
+    'mkdir': {'dirsize': 0},
+    'touch': {'dirsize': 4096},
+    'read': {'hash': 'ef46db3751d8e999', 'chunk_size': 0, 'offset': 0},
+    'write': {'pattern_id': 1, 'chunk_size': 4096, 'hash': 1283627371831, 'offset': 0},
+    'truncate': {'size': 0},
+}
+BROKER_ENDPOINT = 'ipc:///tmp/dynamo_benchmark_broker_{0}'
+
+
+def fake_result(work):
+    data = dict(work['data'])
+    data.update(FAKE_RESULT_DATA.get(work['action'], {}))
+    data['duration'] = 0
+    return {'result': 'success', 'action': work['action'], 'target': work['data']['target'],
+            'timestamp': datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S.%f'), 'data': data}
+
+
+def run_fake_clients(num_workers, credits, duration, results_queue, endpoint):
+    """
+    Serves `num_workers` DEALER sockets in a single poll loop
+    """
+    context = zmq.Context()
+    codec = wire_codec.get_codec(wire_codec.supported_codecs()[0])
+    poller = zmq.Poller()
+    sockets = []
+    for i in range(num_workers):
+        sock = context.socket(zmq.DEALER)
+        sock.identity = "{0}:0x{1:x}:{2}".format(socket.gethostname(), os.getpid(), i).encode()
+        sock.connect(endpoint)
+        sock.send_multipart([b'json', wire_codec.JsonCodec.encode({'message': 'connect', 'credits': credits,
+                                                                    'codecs': [codec.name]})])
+        poller.register(sock, zmq.POLLIN)
+        sockets.append(sock)
+    sent_at = {}
+    latencies = []
+    done = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for sock, _ in poller.poll(100):
+            codec_name, payload = sock.recv_multipart()
+            now = time.monotonic()
+            if sock in sent_at:
+                latencies.append(now - sent_at.pop(sock))
+            jobs = wire_codec.get_codec(codec_name).decode(payload)
+            results = [(job_id, fake_result(work)) for job_id, work in jobs]
+            sock.send_multipart([codec_name, wire_codec.get_codec(codec_name).encode(
+                {'message': 'jobs_done', 'results': results})])
+            sent_at[sock] = time.monotonic()
+            done += len(results)
+    for sock in sockets:
+        sock.close(linger=0)
+    context.term()
+    results_queue.put((done, latencies))
+
+
+def run_controller(engine, stop_event, workload):
+    ready_event = multiprocessing.Event()
+    ready_event.set()
+    if engine == 'asyncio':
+        from server.asyncio_controller import AsyncioController as Controller
+    else:
+        from server.async_controller import Controller
+    Controller(stop_event, dirtree.DirTree(), {'workload': workload}, ready_event).run()
+
+
+def cpu_time(pid):
+    """
+    Returns: float, user and system CPU seconds the process used so far
+    """
+    with open(f'/proc/{pid}/stat') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def measure(engine, num_clients, workers_per_client, credits, duration, workload, broker):
+    """
+    Returns: tuple, (jobs/s, p50 dispatch latency [ms], p99 dispatch latency [ms], Controller's CPU seconds per second)
+    """
+    stop_event = multiprocessing.Event()
+    controller = multiprocessing.Process(target=run_controller, args=(engine, stop_event, workload))
+    controller.start()
+    time.sleep(2)
+    brokers_stop_event = multiprocessing.Event()
+    brokers = []
+    endpoints = []
+    for i in range(num_clients):
+        if broker:
+            endpoint = BROKER_ENDPOINT.format(i)
+            brokers.append(multiprocessing.Process(target=run_broker, args=('localhost', brokers_stop_event),
+                                                   kwargs={'jobs_endpoint': endpoint,
+                                                           'logs_endpoint': endpoint + '_logs'}))
+            endpoints.append(endpoint)
+        else:
+            endpoints.append("tcp://localhost:{0}".format(CTRL_MSG_PORT))
+    for broker_process in brokers:
+        broker_process.start()
+    results_queue = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=run_fake_clients,
+                                       args=(workers_per_client, credits, duration, results_queue, endpoint))
+               for endpoint in endpoints]
+    started_cpu_time = cpu_time(controller.pid)
+    for client in clients:
+        client.start()
+    results = [results_queue.get() for _ in clients]
+    controller_cpu = (cpu_time(controller.pid) - started_cpu_time) / duration
+    stop_event.set()
+    brokers_stop_event.set()
+    for process in clients + brokers:
+        process.join()
+    controller.join(5)
+    if controller.is_alive():
+        controller.terminate()
+    total_jobs = sum(done for done, _ in results)
+    latencies = sorted(latency for _, client_latencies in results for latency in client_latencies)
+    if not latencies:
+        return total_jobs / duration, 0, 0, controller_cpu
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return total_jobs / duration, p50 * 1000, p99 * 1000, controller_cpu
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Controller engines benchmark')
+    parser.add_argument('--engines', type=str, nargs='+', default=['threaded', 'asyncio'])
+    parser.add_argument('--clients', type=int, default=4, help="Fake client processes")
+    parser.add_argument('--workers', type=int, default=32, help="Worker sockets per fake client")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per measurement")
+    parser.add_argument('--workload', type=str, default='workload1')
+    parser.add_argument('--broker', action='store_true', help="Fake clients' workers go through a per-host Broker")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    os.makedirs('logs', exist_ok=True)
+    print("{0:>9} | {1:>14} | {2:>14} | {3:>14} | {4:>20} | {5:>20}".format(
+        "engine", "max jobs/s", "controller CPU", "CPU/job [us]", "p50 dispatch [ms]", "p99 dispatch [ms]"))
+    for engine in args.engines:
+        rate, _, _, cpu = measure(engine, args.clients, args.workers, 256, args.duration, args.workload, args.broker)
+        _, p50, p99, _ = measure(engine, args.clients, args.workers, 1, args.duration, args.workload, args.broker)
+        print("{0:>9} | {1:>14.0f} | {2:>13.0f}% | {3:>14.1f} | {4:>20.2f} | {5:>20.2f}".format(
+            engine, rate, cpu * 100, cpu / max(rate, 1) * 1e6, p50, p99))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3.6
+"""
+Random directory sampling benchmark: random.choice() over dict keys copy vs. IndexedDict
+Run from repository root: python3 -m benchmarks.dir_sampling_benchmark
+2018 samuels (c)
+"""
+import argparse
+import random
+import timeit
+
+import xxhash
+
+from tree.indexed_dict import IndexedDict
+
+__author__ = 'samuels'
+
+
+def dict_pick(nodes):
+    return random.choice(list(nodes.keys()))
+
+
+def indexed_dict_pick(nodes):
+    return nodes.random_key()
+
+
+def churn(nodes, nids, num_ops):
+    """
+    Deletes random directory and adds it back, like a dir going out of sync and back
+    """
+    for i in range(num_ops):
+        nid = nids[i % len(nids)]
+        name = nodes.pop(nid)
+        nodes[nid] = name
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Random directory sampling benchmark')
+    parser.add_argument('--dirs', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--picks', type=int, default=200, help="Random picks per measurement")
+    parser.add_argument('--ops', type=int, default=100000, help="Delete + insert operations per measurement")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    print("{0:>8} | {1:>13} | {2:>18} | {3:>13} | {4:>18}".format("dirs", "dict pick/s", "IndexedDict pick/s",
+                                                                  "dict churn/s", "IndexedDict churn/s"))
+    for num_dirs in args.dirs:
+        nids = [xxhash.xxh64(str(i)).hexdigest() for i in range(num_dirs)]
+        plain = {nid: nid for nid in nids}
+        indexed = IndexedDict(plain)
+        random.shuffle(nids)
+        dict_time = timeit.timeit(lambda: dict_pick(plain), number=args.picks)
+        indexed_time = timeit.timeit(lambda: indexed_dict_pick(indexed), number=args.picks)
+        dict_churn_time = timeit.timeit(lambda: churn(plain, nids, args.ops), number=1)
+        indexed_churn_time = timeit.timeit(lambda: churn(indexed, nids, args.ops), number=1)
+        print("{0:>8} | {1:>13.0f} | {2:>18.0f} | {3:>13.0f} | {4:>18.0f}".format(
+            num_dirs, args.picks / dict_time, args.picks / indexed_time, args.ops / dict_churn_time,
+            args.ops / indexed_churn_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3.6
+"""
+Per-file ExtentMap benchmark: random writes, truncates and read range picks of a file with thousands of extents
+Run from repository root: python3 -m benchmarks.extent_map_benchmark
+2018 samuels (c)
+"""
+import argparse
+import itertools
+import random
+import sys
+import timeit
+
+from tree.extents import ExtentMap
+
+__author__ = 'samuels'
+
+PATTERNS = [b'', b'1234999988884321', b'0123456789ABCDEF']
+WRITE_SIZES = [4096 * 2 ** i for i in range(9)]  # 4KB..1MB, as clients write
+
+
+def extent_map_size(extents):
+    return sys.getsizeof(extents) + sum(sys.getsizeof(column) for column in
+                                        (extents.starts, extents.ends, extents.tids, extents.pattern_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ExtentMap benchmark')
+    parser.add_argument('--extents', type=int, default=10000, help="Extents of the file")
+    parser.add_argument('--ops', type=int, default=10000, help="Operations per measurement")
+    args = parser.parse_args()
+    file_size = args.extents * WRITE_SIZES[-1]
+    extents = ExtentMap()
+    tids = itertools.count(1)
+    while len(extents) < args.extents:
+        extents.write(random.randrange(file_size), random.choice(WRITE_SIZES), next(tids),
+                      random.randrange(1, len(PATTERNS)))
+    print(f"{len(extents)} extents, {extent_map_size(extents) / len(extents):.1f} bytes per extent")
+
+    def write():
+        extents.write(random.randrange(file_size), random.choice(WRITE_SIZES), next(tids),
+                      random.randrange(1, len(PATTERNS)))
+
+    def truncate_and_rewrite():
+        size = file_size - random.choice(WRITE_SIZES)
+        extents.truncate(size)
+        extents.write(size, file_size - size, next(tids), 1)
+
+    def read():
+        extents.random_extent()
+
+    print("{0:>20} | {1:>12}".format("operation", "ops/s"))
+    for title, operation in (("write", write), ("truncate + write", truncate_and_rewrite), ("pick read extent", read)):
+        elapsed = timeit.timeit(operation, number=args.ops)
+        print("{0:>20} | {1:>12.0f}".format(title, args.ops / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3.6
+"""
+File descriptors cache benchmark: 4KB reads and writes of random files, opening the file for every op against keeping
+descriptors open. Run it on the export's mount point, the gain there is the OPEN/CLOSE round trips saved
+Run from repository root: python3 -m benchmarks.fd_cache_benchmark --path /mnt/test_workdir
+2018 samuels (c)
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'client'))
+from config import DYNAMO_FD_CACHE_SIZE  # noqa: E402
+from fd_cache import FD_CACHE_MODES, FDCache  # noqa: E402
+
+__author__ = 'samuels'
+
+IO_SIZE = 4096
+FILE_SIZE = 1024 * 1024
+BUF = bytes(IO_SIZE)
+
+
+def run(fd_cache, mount_point, targets, ops):
+    """
+    Returns: float, ops/s
+    """
+    started = time.perf_counter()
+    for _ in range(ops):
+        target = targets[int(random.random() * len(targets))]
+        offset = int(random.random() * (FILE_SIZE // IO_SIZE)) * IO_SIZE
+        if random.random() < 0.5:
+            with fd_cache.open(mount_point, target, os.O_RDONLY) as fd:
+                os.pread(fd, IO_SIZE, offset)
+        else:
+            with fd_cache.open(mount_point, target, os.O_RDWR) as fd:
+                os.pwrite(fd, BUF, offset)
+    return ops / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='File descriptors cache benchmark')
+    parser.add_argument('--path', type=str, help="Directory the files are created in, a temporary one if not set")
+    parser.add_argument('--files', type=int, nargs='+', default=[16, DYNAMO_FD_CACHE_SIZE * 4],
+                        help="Numbers of files ops are spread over")
+    parser.add_argument('--ops', type=int, default=20000, help="Operations per measurement")
+    parser.add_argument('--cache_size', type=int, default=DYNAMO_FD_CACHE_SIZE)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=args.path) as mount_point:
+        targets = []
+        for i in range(max(args.files)):
+            target = f'/file{i}'
+            with open(mount_point + target, 'wb') as f:
+                f.truncate(FILE_SIZE)
+            targets.append(target)
+        print("{0:>7} | {1:>7} | {2:>10} | {3:>9}".format("files", "mode", "ops/s", "hit rate"))
+        for files in args.files:
+            for mode in FD_CACHE_MODES:
+                fd_cache = FDCache(mode, args.cache_size)
+                rate = run(fd_cache, mount_point, targets[:files], args.ops)
+                fd_cache.close()
+                hit_rate = fd_cache.hits / max(fd_cache.hits + fd_cache.misses, 1)
+                print("{0:>7} | {1:>7} | {2:>10.0f} | {3:>8.0%}".format(files, mode, rate, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
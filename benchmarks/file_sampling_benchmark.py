@@ -0,0 +1,47 @@
+#!/usr/bin/env python3.6
+"""
+Random file selection benchmark: random.choice()/random.sample() over dict values copy vs. Directory
+Run from repository root: python3 -m benchmarks.file_sampling_benchmark
+2018 samuels (c)
+"""
+import argparse
+import random
+import timeit
+
+from config import MAX_FILES_PER_DIR
+from tree.dirtree import Directory
+from utils.shell_utils import StringUtils
+
+__author__ = 'samuels'
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Random file selection benchmark')
+    parser.add_argument('--files', type=int, nargs='+', default=[100, 1000, MAX_FILES_PER_DIR])
+    parser.add_argument('--picks', type=int, default=10000, help="Random picks per measurement")
+    parser.add_argument('--sample', type=int, default=10, help="Files per batch sample")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    print("{0:>8} | {1:>12} | {2:>12} | {3:>14} | {4:>14}".format("files", "dict pick/s", "Directory/s",
+                                                                  "dict sample/s", "Directory/s"))
+    for num_files in args.files:
+        directory = Directory(StringUtils.random_string_generator())
+        plain = {}
+        for _ in range(num_files):
+            name = directory.touch()
+            plain[name] = directory.get_file_by_name(name)
+        k = min(args.sample, num_files)
+        dict_pick = timeit.timeit(lambda: random.choice(list(plain.values())), number=args.picks)
+        directory_pick = timeit.timeit(directory.get_random_file, number=args.picks)
+        dict_sample = timeit.timeit(lambda: random.sample(list(plain.values()), k), number=args.picks)
+        directory_sample = timeit.timeit(lambda: directory.get_random_files(k), number=args.picks)
+        print("{0:>8} | {1:>12.0f} | {2:>12.0f} | {3:>14.0f} | {4:>14.0f}".format(
+            num_files, args.picks / dict_pick, args.picks / directory_pick, args.picks / dict_sample,
+            args.picks / directory_sample))
+
+
+if __name__ == '__main__':
+    main()
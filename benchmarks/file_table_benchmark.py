@@ -0,0 +1,172 @@
+#!/usr/bin/env python3.6
+"""
+Files model memory benchmark: File objects in per directory dicts vs. FileTable columns
+Half of the files are confirmed on disk, as the Controller would see them after a while, then all of those are written
+once. Names are generated by the table, as DirTree has them, File objects keep the same names
+Run from repository root: python3 -m benchmarks.file_table_benchmark
+2018 samuels (c)
+"""
+import argparse
+import datetime
+import timeit
+import tracemalloc
+import uuid
+
+import xxhash
+
+from config import MAX_FILES_PER_DIR
+from tree.dirtree import Directory, ONDISK_FILES
+from tree.file_table import FileTable
+from tree.indexed_dict import IndexedDict
+
+__author__ = 'samuels'
+
+
+class ObjectFile(object):
+    """
+    File as it was modelled before FileTable
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.data_pattern = 0
+        self.data_pattern_len = 0
+        self.data_pattern_hash = 'ef46db3751d8e999'
+        self.data_pattern_offset = 0
+        self.uuid = uuid.uuid4().hex[-5:]
+        self.tid = 0
+        self.last_actions = []
+        self.creation_time = None
+        self.modify_time = datetime.datetime.now()
+        self.ondisk = False
+        self.size = 0
+
+
+class ObjectDirectory(object):
+    def __init__(self):
+        self.files_dict = IndexedDict()
+        self.ondisk_files = IndexedDict()
+        self.pending_files = IndexedDict()
+
+    def touch(self, name):
+        file_hash = xxhash.xxh64(name).hexdigest()
+        self.files_dict[file_hash] = self.pending_files[file_hash] = ObjectFile(name)
+
+    def mark_ondisk(self, name):
+        file_hash = xxhash.xxh64(name).hexdigest()
+        f = self.pending_files.pop(file_hash)
+        f.ondisk = True
+        f.creation_time = datetime.datetime.now()
+        self.ondisk_files[file_hash] = f
+
+
+def fill_objects(names):
+    directories = []
+    for i in range(0, len(names), MAX_FILES_PER_DIR):
+        directory = ObjectDirectory()
+        for name in names[i:i + MAX_FILES_PER_DIR]:
+            directory.touch(name)
+        for name in names[i:i + MAX_FILES_PER_DIR:2]:
+            directory.mark_ondisk(name)
+        directories.append(directory)
+    return directories
+
+
+def write_objects(directories):
+    for directory in directories:
+        for f in directory.ondisk_files.values():
+            f.data_pattern = 1
+            f.data_pattern_offset = 0
+            f.data_pattern_len = 65536
+            f.data_pattern_hash = '8d3cb3c2d1f01c26'
+            f.tid += 1
+
+
+def fill_table(table, names):
+    directories = []
+    names_iterator = iter(names)  # shared by all directories, as DirTree's generator is
+    for i in range(0, len(names), MAX_FILES_PER_DIR):
+        directory = Directory(names_iterator, table)
+        for _ in names[i:i + MAX_FILES_PER_DIR]:
+            directory.touch()
+        for name in names[i:i + MAX_FILES_PER_DIR:2]:
+            f = directory.get_file_by_name(name)
+            directory.mark_ondisk(f)
+            f.creation_time = datetime.datetime.now()
+        directories.append(directory)
+    return directories
+
+
+def write_table(directories):
+    for directory in directories:
+        for f in directory.iter_files(ONDISK_FILES):
+            f.tid += 1
+            f.record_write(0, 65536, 1, f.tid)
+
+
+def measure_memory(fill, *args):
+    """
+    Returns: tuple, (bytes allocated by fill() which are still in use, its result)
+    """
+    tracemalloc.start()
+    result = fill(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Files model memory benchmark')
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000, help="Random on-disk file picks + name lookups")
+    return parser.parse_args()
+
+
+def report(model, size, written_size, files, rate):
+    print("{0:>12} | {1:>14.1f} | {2:>18.1f} | {3:>18.0f}".format(model, size / files, written_size / files, rate))
+
+
+def main():
+    args = get_args()
+    table = FileTable()
+    names_generator = table.names()
+    names = [next(names_generator) for _ in range(args.files)]
+    names_size = sum(len(name.encode('utf8')) for name in names)
+    print(f"{args.files} files, {names_size / args.files:.1f} bytes average name length")
+    print("{0:>12} | {1:>14} | {2:>18} | {3:>18}".format("model", "bytes per file", "written, per file",
+                                                          "pick + lookup/s"))
+    # File objects keep references to names, which are already allocated here, so their size is added
+    size, directories = measure_memory(fill_objects, names)
+    size += sum(name.__sizeof__() for name in names)
+    written_size, _ = measure_memory(write_objects, directories)
+
+    def objects_lookup():
+        directory = directories[0]
+        f = directory.ondisk_files.random_value()
+        directory.files_dict[xxhash.xxh64(f.name).hexdigest()].tid += 1
+
+    elapsed = timeit.timeit(objects_lookup, number=args.lookups)
+    report("objects", size, size + written_size, args.files, args.lookups / elapsed)
+    del directories
+    size, directories = measure_memory(fill_table, table, names)
+    written_size, _ = measure_memory(write_table, directories)
+
+    def table_lookup():
+        directory = directories[0]
+        f = directory.get_random_file(ONDISK_FILES)
+        directory.get_file_by_name(f.name).tid += 1
+
+    elapsed = timeit.timeit(table_lookup, number=args.lookups)
+    report("table, File", size, size + written_size, args.files, args.lookups / elapsed)
+
+    def table_rows_lookup():
+        directory = directories[0]
+        row = directory.get_random_row(ONDISK_FILES)
+        table.tid[directory.find_row(table.name(row))] += 1
+
+    elapsed = timeit.timeit(table_rows_lookup, number=args.lookups)
+    report("table, rows", size, size + written_size, args.files, args.lookups / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3.6
+"""
+In-flight jobs tracking benchmark: uuid4 ids in per worker dicts vs. compact ids in JobTable
+Measures memory held by in-flight jobs tracking (without jobs work dicts, which are the same for both) and
+create + dispatch + complete rate
+Run from repository root: python3 -m benchmarks.job_table_benchmark
+2018 samuels (c)
+"""
+import argparse
+import timeit
+import tracemalloc
+import uuid
+from collections import deque
+
+from server.job_generator import JobTable
+
+__author__ = 'samuels'
+
+WORK = {'action': 'stat', 'data': {'target': '/dir/file'}}
+
+
+class UuidJob(object):
+    def __init__(self, work):
+        self.id = uuid.uuid4().hex
+        self.work = work
+
+
+def fill_uuid(num_jobs, num_workers):
+    client_workers = {worker_id: {} for worker_id in range(num_workers)}
+    for i in range(num_jobs):
+        job = UuidJob(WORK)
+        client_workers[i % num_workers][job.id] = job
+    return client_workers
+
+
+def fill_table(num_jobs, num_workers):
+    table = JobTable()
+    for i in range(num_jobs):
+        table.assign(table.new_job(WORK), i % num_workers)
+    return table
+
+
+def cycle_uuid(num_jobs, num_workers, in_flight):
+    client_workers = {worker_id: {} for worker_id in range(num_workers)}
+    pending = deque()
+    for i in range(num_jobs):
+        job = UuidJob(WORK)
+        worker_id = i % num_workers
+        client_workers[worker_id][job.id] = job
+        pending.append((worker_id, job.id))
+        if len(pending) > in_flight:
+            worker_id, job_id = pending.popleft()
+            client_workers[worker_id].pop(job_id)
+
+
+def cycle_table(num_jobs, num_workers, in_flight):
+    table = JobTable()
+    pending = deque()
+    for i in range(num_jobs):
+        job = table.new_job(WORK)
+        worker_id = i % num_workers
+        table.assign(job, worker_id)
+        pending.append((worker_id, job.id))
+        if len(pending) > in_flight:
+            worker_id, job_id = pending.popleft()
+            table.pop(job_id, worker_id)
+
+
+def measure_memory(fill, num_jobs, num_workers):
+    tracemalloc.start()
+    tracked = fill(num_jobs, num_workers)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tracked
+    return size
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='In-flight jobs tracking benchmark')
+    parser.add_argument('--jobs', type=int, default=1000000, help="In-flight jobs for memory measurement")
+    parser.add_argument('--cycles', type=int, default=200000, help="Jobs dispatched for speed measurement")
+    parser.add_argument('--workers', type=int, default=320)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    print("{0:>8} | {1:>22} | {2:>16}".format("ids", "MB per 1M in-flight", "jobs/s"))
+    for name, fill, cycle in (('uuid4', fill_uuid, cycle_uuid), ('compact', fill_table, cycle_table)):
+        size = measure_memory(fill, args.jobs, args.workers)
+        elapsed = timeit.timeit(lambda: cycle(args.cycles, args.workers, args.workers * 8), number=1)
+        print("{0:>8} | {1:>22.1f} | {2:>16.0f}".format(name, size / args.jobs * 1e6 / 2 ** 20,
+                                                          args.cycles / elapsed))
+
+
+if __name__ == '__main__':
+    main()
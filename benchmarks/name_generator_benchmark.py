@@ -0,0 +1,40 @@
+#!/usr/bin/env python3.6
+"""
+Names generation benchmark: random.choice() per character vs. NameGenerator batches
+Run from repository root: python3 -m benchmarks.name_generator_benchmark
+2018 samuels (c)
+"""
+import argparse
+import itertools
+import timeit
+
+from utils.name_generator import NameGenerator, DEFAULT_BATCH_SIZE
+from utils.shell_utils import StringUtils
+
+__author__ = 'samuels'
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Names generation benchmark')
+    parser.add_argument('--names', type=int, default=100000, help="Names per measurement")
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH_SIZE, help="NameGenerator batch size")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    generators = [
+        ("random.choice 16-64", StringUtils.random_string_generator()),
+        ("NameGenerator 16-64", NameGenerator(batch_size=args.batch)),
+        ("NameGenerator 64", NameGenerator(min_length=64, max_length=64, batch_size=args.batch)),
+        ("prefix/suffix", NameGenerator(prefix='dyn_', suffix='.dat', batch_size=args.batch)),
+        ("unique", NameGenerator(unique=True, batch_size=args.batch)),
+    ]
+    print("{0:>20} | {1:>12}".format("generator", "names/s"))
+    for title, generator in generators:
+        elapsed = timeit.timeit(lambda: list(itertools.islice(generator, args.names)), number=1)
+        print("{0:>20} | {1:>12.0f}".format(title, args.names / elapsed))
+
+
+if __name__ == '__main__':
+    main()
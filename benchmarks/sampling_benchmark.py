@@ -0,0 +1,63 @@
+#!/usr/bin/env python3.6
+"""
+Weighted sampling micro benchmark: per call cumulative weights + bisect vs. batched alias table draws
+Run from repository root: python3 -m benchmarks.sampling_benchmark
+2018 samuels (c)
+"""
+import argparse
+import random
+import timeit
+from bisect import bisect
+
+from server.async_controller import load_workload
+from server.sampling import WeightedSampler
+
+__author__ = 'samuels'
+
+
+def weighted_choice(choices):
+    values, weights = zip(*choices)
+    total = 0
+    cum_weights = []
+    for w in weights:
+        total += w
+        cum_weights.append(total)
+    x = random.random() * total
+    i = bisect(cum_weights, x)
+    return values[i]
+
+
+def run_weighted_choice(file_operations, io_types, num_jobs):
+    for _ in range(num_jobs):
+        weighted_choice(file_operations)
+        weighted_choice(io_types)
+
+
+def run_sampler(file_operations, io_types, num_jobs):
+    next_action = WeightedSampler(file_operations)
+    next_io_type = WeightedSampler(io_types)
+    for _ in range(num_jobs):
+        next_action()
+        next_io_type()
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Weighted sampling benchmark')
+    parser.add_argument('--jobs', type=int, default=1000000, help="Jobs (action + io type draws) per measurement")
+    parser.add_argument('--workload', type=str, default='workload1')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    workload = load_workload(args.workload)
+    file_operations = list(workload['file_ops'].items())
+    io_types = list(workload['io_types'].items())
+    print("{0:>16} | {1:>12} | {2:>12}".format("method", "jobs/s", "us/job"))
+    for name, method in (('weighted_choice', run_weighted_choice), ('alias sampler', run_sampler)):
+        elapsed = timeit.timeit(lambda: method(file_operations, io_types, args.jobs), number=1)
+        print("{0:>16} | {1:>12.0f} | {2:>12.3f}".format(name, args.jobs / elapsed, elapsed / args.jobs * 1e6))
+
+
+if __name__ == '__main__':
+    main()
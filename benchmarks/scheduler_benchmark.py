@@ -0,0 +1,70 @@
+#!/usr/bin/env python3.6
+"""
+Worker selection micro benchmark: sorted() least loaded lookup vs. WorkerScheduler
+Run from repository root: python3 -m benchmarks.scheduler_benchmark
+2018 samuels (c)
+"""
+import argparse
+import random
+import timeit
+
+from server.scheduler import WorkerScheduler
+
+__author__ = 'samuels'
+
+MAX_JOBS_PER_WORKER = 100000
+
+
+def sorted_next_worker(client_workers):
+    if client_workers:
+        worker_id, work = sorted(client_workers.items(), key=lambda x: len(x[1]))[0]
+        if len(work) < MAX_JOBS_PER_WORKER:
+            return worker_id
+    return None
+
+
+def run_sorted(num_workers, num_jobs):
+    client_workers = {worker_id: {} for worker_id in range(num_workers)}
+    in_flight = []
+    for job_id in range(num_jobs):
+        worker_id = sorted_next_worker(client_workers)
+        client_workers[worker_id][job_id] = None
+        in_flight.append((worker_id, job_id))
+        if len(in_flight) > num_workers * 4:
+            done_worker_id, done_job_id = in_flight.pop(random.randrange(len(in_flight)))
+            del client_workers[done_worker_id][done_job_id]
+
+
+def run_scheduler(num_workers, num_jobs):
+    scheduler = WorkerScheduler(initial_window=MAX_JOBS_PER_WORKER)
+    for worker_id in range(num_workers):
+        scheduler.add_worker(worker_id, MAX_JOBS_PER_WORKER)
+    in_flight = []
+    for _ in range(num_jobs):
+        worker_id = scheduler.next_worker()
+        scheduler.job_assigned(worker_id)
+        in_flight.append(worker_id)
+        if len(in_flight) > num_workers * 4:
+            scheduler.job_done(in_flight.pop(random.randrange(len(in_flight))))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Worker selection benchmark')
+    parser.add_argument('--jobs', type=int, default=20000, help="Jobs to dispatch per measurement")
+    parser.add_argument('--workers', type=int, nargs='+', default=[32, 320, 1920, 3840],
+                        help="Worker counts to measure")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    print("{0:>8} | {1:>16} | {2:>16}".format("workers", "sorted jobs/s", "scheduler jobs/s"))
+    for num_workers in args.workers:
+        sorted_time = timeit.timeit(lambda: run_sorted(num_workers, args.jobs), number=1)
+        scheduler_time = timeit.timeit(lambda: run_scheduler(num_workers, args.jobs), number=1)
+        print("{0:>8} | {1:>16.0f} | {2:>16.0f}".format(num_workers, args.jobs / sorted_time,
+                                                         args.jobs / scheduler_time))
+
+
+if __name__ == '__main__':
+    main()
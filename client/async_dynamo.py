@@ -0,0 +1,150 @@
+"""
+Client load generator which keeps many jobs in flight: jobs run on a thread pool, the socket is served by a poll loop
+2018 samuels (c)
+"""
+import fcntl
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import zmq
+
+from config import DYNAMO_QUEUE_DEPTH
+from dynamo import Dynamo, build_message, timestamp
+from locking import FLock
+
+__author__ = 'samuels'
+
+
+class AsyncDynamo(Dynamo):
+    """
+    Same jobs and results as Dynamo, but instead of running one job at a time, up to `queue_depth` jobs are running on
+    the thread pool: file system calls release the GIL, so they're all waiting on the server at once. Only the loop's
+    thread touches the socket - ZMQ sockets aren't thread safe - pool threads queue their results and wake the loop up
+    through a pipe, which is polled together with the socket. Results go back as they complete, batched the same way.
+    Jobs the Controller sent over the queue depth wait in the local queue, so its credits still bound memory use.
+
+    Jobs of the same file don't run at once, as they don't in Dynamo: a job whose target (or rename destination) is
+    a path some running job works on waits in the local queue, and so do jobs of that path queued after it, so jobs of
+    a path run in the order they came in. Results are stamped again as they're queued for the loop, so they go back
+    in timestamp order - the Controller's reorder buffer expects every worker's results in that order.
+    """
+
+    def __init__(self, mount_points, controller, server, nodes, domains, **kwargs):
+        super().__init__(mount_points, controller, server, nodes, domains, **kwargs)
+        self._queue_depth = kwargs.get('queue_depth') or DYNAMO_QUEUE_DEPTH
+        self._executor = ThreadPoolExecutor(self._queue_depth)
+        # Native locks of the process don't exclude its own threads, open file ones do
+        self.flock = FLock(self.locking_db, kwargs.get('locking_type'), per_fd=True)
+        self._jobs = deque()  # jobs waiting for a free slot, or for running jobs of their paths
+        self._running = 0
+        self._busy_paths = set()  # paths of running jobs
+        self._done = deque()  # (job_id, paths, result) of completed jobs, appended by pool threads
+        self._done_lock = threading.Lock()  # keeps _done in results timestamp order
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        for fd in (self._wakeup_read, self._wakeup_write):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def run(self):
+        self.logger.info(f"Dynamo {self._socket.identity} started, queue depth {self._queue_depth}")
+        poller = zmq.Poller()
+        poller.register(self._socket, zmq.POLLIN)
+        poller.register(self._wakeup_read, zmq.POLLIN)
+        try:
+            self._send({'message': 'connect', 'codecs': self._offered_codecs, 'credits': self._credits})
+            self.logger.debug(f"Client {self._socket.identity} sent back 'connect' message.")
+            while True:
+                try:
+                    # Blocking on both socket and pool's results, but not longer than oldest pending result may wait
+                    timeout = max(self._results_deadline - time.monotonic(), 0) * 1000 if self._results else None
+                    events = dict(poller.poll(timeout))
+                    if self._socket in events:
+                        while self._socket.poll(0, zmq.POLLIN):
+                            self._jobs.extend(self._recv())
+                    if self._wakeup_read in events:
+                        self._drain_wakeups()
+                    self._collect_results()
+                    self._start_jobs()
+                    if self._results and (not self._running or time.monotonic() >= self._results_deadline):
+                        self._flush_results()
+                except zmq.ZMQError as zmq_error:
+                    self.logger.warn(f"Failed to send message due to: {zmq_error}")
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            self.logger.exception(e)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._collect_results()
+            self._flush_results()
+            self._disconnect()
+            self._close_fd_cache()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+
+    def _start_jobs(self):
+        if not self._jobs or self._running >= self._queue_depth:
+            return
+        held = deque()
+        held_paths = set()
+        while self._jobs and self._running < self._queue_depth:
+            job_id, work = self._jobs.popleft()
+            paths = self._job_paths(work)
+            if self._busy_paths.isdisjoint(paths) and held_paths.isdisjoint(paths):
+                self._busy_paths.update(paths)
+                self._running += 1
+                self._executor.submit(self._run_job, job_id, paths, work)
+            else:
+                held.append((job_id, work))
+                held_paths.update(paths)
+        if held:
+            held.extend(self._jobs)
+            self._jobs = held
+
+    @staticmethod
+    def _job_paths(work):
+        """
+        Returns: tuple of str, paths job works on, relative to the mount point
+        """
+        data = work['data']
+        if work['action'] == 'rename':
+            return data['target'], '/'.join([data['target'].rpartition('/')[0], data['rename_dest']])
+        if work['action'] == 'rename_exist':
+            return data['target'], data['rename_source'], data['rename_dest']
+        return data['target'],
+
+    def _run_job(self, job_id, paths, work):
+        """
+        Runs on a pool thread
+        """
+        try:
+            result = self._do_work(work)
+        except Exception as e:  # _do_work() turns job's errors into failed results, that's a bug
+            self.logger.exception(e)
+            # Job still gets its result, the Controller holds a credit and a jobs table slot until it does
+            result = build_message('failed', work.get('action'), {}, None, error_message=str(e),
+                                   path=work.get('data', {}).get('target'))
+        with self._done_lock:
+            result['timestamp'] = timestamp()
+            self._done.append((job_id, paths, result))
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:  # pipe is full of wake ups already
+            pass
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _collect_results(self):
+        while self._done:
+            job_id, paths, result = self._done.popleft()
+            self._running -= 1
+            self._busy_paths.difference_update(paths)
+            self.logger.debug(f"Going to send {job_id}: {result}")
+            self._add_result(job_id, result)
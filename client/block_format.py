@@ -0,0 +1,184 @@
+"""
+Self-describing data blocks: every 4KB block of written data is stamped with a header, so reads are verified by the
+client, and a bad block tells where it came from. Blocks payload comes from the pattern registry
+2018 samuels (c)
+"""
+import os
+import struct
+
+import xxhash
+
+__author__ = 'samuels'
+
+BLOCK_SIZE = 4096  # blocks are aligned to file offsets, writes are whole blocks
+BLOCK_MAGIC = b'DYNB'
+# checksum (low 32 bits of xxhash64 of the rest of the header), magic, file id, block's file offset, tid of the write
+# job, writer id, data pattern id, reserved. Checksum comes first, as data_generators.Transformers.md5 has it
+HEADER = struct.Struct('<I4sIqIIHH')
+CHECKSUM = struct.Struct('<I')
+ZERO_BLOCK = bytes(BLOCK_SIZE)
+MAX_BLOCK_ERRORS = 16  # bad blocks reported per read
+IOV_MAX = os.sysconf('SC_IOV_MAX') if 'SC_IOV_MAX' in os.sysconf_names else 1024
+
+# Block errors
+NOT_ZERO = 'not_zero'  # block of a range which was never written has data
+ZERO = 'zero'  # written block reads as zeros: lost write or hole
+BAD_MAGIC = 'bad_magic'  # not a block header: data from elsewhere or corrupted header
+BAD_CHECKSUM = 'bad_checksum'  # corrupted header
+BAD_PAYLOAD = 'bad_payload'  # block's data doesn't match its pattern
+WRONG_FILE = 'wrong_file'  # block of another file
+WRONG_OFFSET = 'wrong_offset'  # block of another offset of the file: misplaced block
+WRONG_TID = 'wrong_tid'  # block of an older or newer write: stale block
+SHORT_READ = 'short_read'  # file ends before the range does
+
+
+def align_up(offset):
+    return -(-offset // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def align_down(offset):
+    return offset - offset % BLOCK_SIZE
+
+
+def build_headers(offset, length, pattern_id, file_id, tid, writer_id):
+    """
+    Args:
+        offset: int, file offset of the first block, aligned to BLOCK_SIZE
+        length: int, bytes, multiple of BLOCK_SIZE
+        pattern_id: int, id of blocks payload in the pattern registry all clients share
+        file_id: int, 32 bits
+        tid: int, tid of the write job
+        writer_id: int, 32 bits, see writer_id()
+
+    Returns: bytearray, headers of all the blocks one after another
+    """
+    headers = bytearray(length // BLOCK_SIZE * HEADER.size)
+    view = memoryview(headers)
+    for header_offset, block_offset in zip(range(0, len(headers), HEADER.size), range(offset, offset + length,
+                                                                                       BLOCK_SIZE)):
+        HEADER.pack_into(headers, header_offset, 0, BLOCK_MAGIC, file_id, block_offset, tid, writer_id, pattern_id, 0)
+        checksum = xxhash.xxh64(view[header_offset + CHECKSUM.size:header_offset + HEADER.size]).intdigest()
+        CHECKSUM.pack_into(headers, header_offset, checksum & 0xffffffff)
+    return headers
+
+
+def write_blocks(fd, offset, headers, payload):
+    """
+    Writes blocks as header and payload pairs of a gather list, no buffer of the whole write is built
+
+    Args:
+        fd: int
+        offset: int, file offset of the first block
+        headers: bytearray, see build_headers()
+        payload: bytes, block payload all the blocks share, see PatternRegistry.payload()
+
+    Returns: int, bytes written
+    """
+    view = memoryview(headers)
+    iov = []
+    for header_offset in range(0, len(headers), HEADER.size):
+        iov.append(view[header_offset:header_offset + HEADER.size])
+        iov.append(payload)
+    os.lseek(fd, offset, os.SEEK_SET)
+    written = 0
+    for first in range(0, len(iov), IOV_MAX):
+        chunk = iov[first:first + IOV_MAX]
+        chunk_size = sum(len(buf) for buf in chunk)
+        chunk_written = os.writev(fd, chunk)
+        if chunk_written < chunk_size:  # short write, rest of the chunk is written the slow way
+            rest = memoryview(b''.join(chunk))[chunk_written:]
+            while rest:
+                rest = rest[os.write(fd, rest):]
+        written += chunk_size
+    return written
+
+
+def read_blocks(fd, offset, length):
+    """
+    Args:
+        fd: int
+        offset: int
+        length: int, bytes to read
+
+    Returns: bytes, data read at `offset`, short only if the file ends before the range does
+    """
+    chunks = []
+    while length:
+        chunk = os.pread(fd, length, offset)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        offset += len(chunk)
+        length -= len(chunk)
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+def verify_blocks(buf, offset, length, file_id, tid, registry):
+    """
+    Args:
+        buf: bytes, data read at `offset`, aligned to BLOCK_SIZE; last block might be cut short by the file's end
+        offset: int
+        length: int, bytes which were asked for
+        file_id: int
+        tid: int, tid of the write which wrote all blocks of the range, 0 if it was never written and reads as zeros
+        registry: PatternRegistry
+
+    Returns: tuple, (number of bad blocks, list of dict - first MAX_BLOCK_ERRORS bad blocks: 'offset', 'error', and
+             fields of block's header if it has one)
+    """
+    errors = []
+    bad_blocks = 0
+    view = memoryview(buf)
+    # Blocks are compared with startswith() of the whole buffer: memcmp, no slices copied
+    for block_offset in range(0, len(buf), BLOCK_SIZE):
+        block_size = min(BLOCK_SIZE, len(buf) - block_offset)
+        error = header = None
+        zeros = ZERO_BLOCK if block_size == BLOCK_SIZE else ZERO_BLOCK[:block_size]
+        if not tid:
+            if not buf.startswith(zeros, block_offset):
+                error = NOT_ZERO
+        elif buf.startswith(zeros, block_offset):
+            error = ZERO
+        elif block_size >= HEADER.size:
+            header = HEADER.unpack_from(buf, block_offset)
+            checksum, magic, block_file_id, block_file_offset, block_tid, _, pattern_id, _ = header
+            if magic != BLOCK_MAGIC:
+                error, header = BAD_MAGIC, None
+            elif xxhash.xxh64(view[block_offset + CHECKSUM.size:block_offset + HEADER.size]).intdigest() & \
+                    0xffffffff != checksum:
+                error, header = BAD_CHECKSUM, None
+            elif pattern_id not in registry or not buf.startswith(
+                    registry.payload(pattern_id)[:block_size - HEADER.size], block_offset + HEADER.size):
+                error = BAD_PAYLOAD
+            elif block_file_id != file_id:
+                error = WRONG_FILE
+            elif block_file_offset != offset + block_offset:
+                error = WRONG_OFFSET
+            elif block_tid != tid:
+                error = WRONG_TID
+        if error:
+            bad_blocks += 1
+            if len(errors) < MAX_BLOCK_ERRORS:
+                errors.append(_block_error(offset + block_offset, error, header))
+    if len(buf) < length:
+        bad_blocks += 1
+        errors.append(_block_error(offset + len(buf), SHORT_READ, None))
+    return bad_blocks, errors
+
+
+def _block_error(offset, error, header):
+    block_error = {'offset': offset, 'error': error}
+    if header:
+        _, _, block_error['file_id'], block_error['block_offset'], block_error['tid'], block_error['writer_id'], \
+            block_error['pattern'], _ = header
+    return block_error
+
+
+def writer_id(identity):
+    """
+    Args:
+        identity: bytes, client's identity, host name and process id
+
+    Returns: int, 32 bits id blocks are stamped with
+    """
+    return xxhash.xxh32(identity).intdigest()
@@ -0,0 +1,98 @@
+"""
+Per-host client broker: all client workers of the host talk to the Controller over a single connection
+2018 samuels (c)
+"""
+import os
+import socket
+
+import zmq
+
+from config import CTRL_MSG_PORT, PUBSUB_LOGGER_PORT, BROKER_JOBS_ENDPOINT, BROKER_LOGS_ENDPOINT
+
+__author__ = 'samuels'
+
+BROKER_MAX_MESSAGES_PER_POLL = 128  # Max messages relayed one way before the other ways get their turn
+POLL_TIMEOUT = 100  # ms
+LINGER = 1000  # ms messages to the Controller may take to go out once broker is stopped
+
+
+class Broker(object):
+    """
+    Workers connect their DEALER sockets to broker's ROUTER over ipc://, and broker relays their messages upstream
+    through its own DEALER socket with worker's identity frame in front: the Controller's ROUTER gets them as
+    [broker id, worker id, codec, payload], and goes on scheduling, reordering and requeueing jobs of every worker as
+    of a worker of its own, see wire_codec.split_route(). Jobs come back with the same two identity frames, the
+    Controller's ROUTER takes the first, broker's ROUTER routes by the second. Frames are relayed as they are, nothing
+    is decoded here.
+
+    Workers' log records are relayed from broker's SUB socket to its PUB socket the same way, so the host has two
+    TCP connections to the Controller, and the Controller's ROUTER one identity, instead of as many as workers.
+    """
+
+    def __init__(self, controller, stop_event, jobs_endpoint=BROKER_JOBS_ENDPOINT, logs_endpoint=BROKER_LOGS_ENDPOINT):
+        """
+        Args:
+            controller: str, Controller's host name
+            stop_event: multiprocessing.Event, set once all the workers are done
+            jobs_endpoint: str
+            logs_endpoint: str
+        """
+        self._controller_ip = socket.gethostbyname(controller)
+        self._stop_event = stop_event
+        self._jobs_endpoint = jobs_endpoint
+        self._logs_endpoint = logs_endpoint
+        # Mustn't contain wire_codec.ROUTE_SEPARATOR
+        self.identity = "{0}:broker:0x{1:x}".format(socket.gethostname(), os.getpid()).encode()
+
+    def run(self):
+        context = zmq.Context()
+        upstream = context.socket(zmq.DEALER)
+        upstream.identity = self.identity
+        upstream.connect("tcp://{0}:{1}".format(self._controller_ip, CTRL_MSG_PORT))
+        workers = context.socket(zmq.ROUTER)
+        workers.bind(self._jobs_endpoint)
+        logs_in = context.socket(zmq.SUB)
+        logs_in.setsockopt(zmq.SUBSCRIBE, b'')
+        logs_in.bind(self._logs_endpoint)
+        logs_out = context.socket(zmq.PUB)
+        logs_out.connect("tcp://{0}:{1}".format(self._controller_ip, PUBSUB_LOGGER_PORT))
+        poller = zmq.Poller()
+        for sock in (workers, upstream, logs_in):
+            poller.register(sock, zmq.POLLIN)
+        try:
+            while not self._stop_event.is_set():
+                events = dict(poller.poll(POLL_TIMEOUT))
+                if workers in events:
+                    self._relay(workers, upstream)
+                if upstream in events:
+                    self._relay(upstream, workers)
+                if logs_in in events:
+                    self._relay(logs_in, logs_out)
+            # Workers are done, their last results and disconnect messages go out before we do
+            while self._relay(workers, upstream) or self._relay(logs_in, logs_out):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for sock in (workers, logs_in):
+                sock.close(linger=0)
+            upstream.close(linger=LINGER)
+            logs_out.close(linger=LINGER)
+            context.term()
+
+    @staticmethod
+    def _relay(source, destination, max_messages=BROKER_MAX_MESSAGES_PER_POLL):
+        """
+        Returns: int, number of messages relayed
+        """
+        for relayed in range(max_messages):
+            try:
+                message = source.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return relayed
+            destination.send_multipart(message)
+        return max_messages
+
+
+def run_broker(controller, stop_event, **kwargs):
+    Broker(controller, stop_event, **kwargs).run()
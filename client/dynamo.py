@@ -5,38 +5,47 @@ Client load generator
 
 import os
 import random
+import time
 import zmq
 import sys
 import socket
 import redis
 
+from collections import deque
 from datetime import datetime
 from config.redis_config import redis_config
 from locking import FLock
+from block_format import writer_id
+from fd_cache import FDCache, OPEN_PER_OP
 
 sys.path.append(os.path.join(os.path.expanduser('~'), 'qa', 'dynamo'))
 from logger import pubsub_logger
-from config import CTRL_MSG_PORT
+from config import CTRL_MSG_PORT, RESULT_BATCH_MAX_SIZE, RESULT_BATCH_MAX_DELAY, DYNAMO_MAX_CREDITS, \
+    BROKER_JOBS_ENDPOINT, BROKER_LOGS_ENDPOINT, DYNAMO_FD_CACHE, DYNAMO_FD_CACHE_SIZE, \
+    DYNAMO_FD_CACHE_TTL
 from response_actions import response_action, DynamoException
 from config import error_codes
+from utils import wire_codec
 
 
 def timestamp():
     return datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S.%f')
 
 
-def build_message(result, action, data, time_stamp, error_code=None, error_message=None, path=None, line=None):
+def build_message(result, action, data, time_stamp, error_code=None, error_message=None, path=None, line=None,
+                  mount_point=None):
     """
     Result message format: Success message format: {'result', 'action', 'target', 'data:{'dirsize, }', 'timestamp'}
-    Failure message format: {'result', 'action', 'error_code', 'error_message', 'path', 'linenumber', 'timestamp',
-    'data:{}'}
+    Failure message format: {'result', 'action', 'error_code', 'error_message', 'target', 'mount_point', 'linenumber',
+    'timestamp', 'data:{}'}
+    Target is job's target in both, relative to the mount point
     """
     if result == 'success':
         message = {'result': result, 'action': action, 'target': path,
                    'timestamp': time_stamp, 'data': data}
     else:
         message = {'result': result, 'action': action, 'error_code': error_code, 'error_message': error_message,
-                   'target': path, 'linenum': line,
+                   'target': path, 'mount_point': mount_point, 'linenum': line,
                    'timestamp': time_stamp, 'data': data}
     return message
 
@@ -44,7 +53,9 @@ def build_message(result, action, data, time_stamp, error_code=None, error_messa
 class Dynamo(object):
     def __init__(self, mount_points, controller, server, nodes, domains, **kwargs):
         try:
-            self.logger = pubsub_logger.PUBLogger(controller).logger
+            # Behind the host's broker (see broker.py) both jobs and log records go through it
+            broker = kwargs.get('broker')
+            self.logger = pubsub_logger.PUBLogger(controller, endpoint=BROKER_LOGS_ENDPOINT if broker else None).logger
             self.logger.info(f"PUB Logger {self.logger} is started")
             self.mount_points = mount_points
             self._server = server  # Server Cluster hostname
@@ -58,12 +69,31 @@ class Dynamo(object):
             # all for us.
             # We'll use client host name + process ID to identify the socket
             self._socket.identity = "{0}:0x{1:x}".format(socket.gethostname(), os.getpid()).encode()
-            self.logger.info("Setting up connection to Controller Server...")
-            self._socket.connect("tcp://{0}:{1}".format(self._controller_ip, CTRL_MSG_PORT))
+            self.writer_id = writer_id(self._socket.identity)  # written blocks are stamped with it
+            if broker:
+                self.logger.info("Setting up connection to Controller Server through the broker...")
+                self._socket.connect(BROKER_JOBS_ENDPOINT)
+            else:
+                self.logger.info("Setting up connection to Controller Server...")
+                self._socket.connect("tcp://{0}:{1}".format(self._controller_ip, CTRL_MSG_PORT))
             # Initialising connection to Redis (our byte-range locking DB)
             self.logger.info("Setting up Redis connection...")
             self.locking_db = redis.StrictRedis(**redis_config)
             self.flock = FLock(self.locking_db, kwargs.get('locking_type'))
+            fd_cache_ttl = kwargs.get('fd_cache_ttl')
+            self.fd_cache = FDCache(kwargs.get('fd_cache') or DYNAMO_FD_CACHE,
+                                    kwargs.get('fd_cache_size') or DYNAMO_FD_CACHE_SIZE,
+                                    DYNAMO_FD_CACHE_TTL if fd_cache_ttl is None else fd_cache_ttl)
+            # Codecs offered to Controller on connect, preferred one first. Until Controller picks one, we're talking
+            # JSON, afterwards we're replying with the codec of the last jobs batch we got.
+            self._offered_codecs = wire_codec.supported_codecs()
+            if kwargs.get('codec') in self._offered_codecs:
+                self._offered_codecs.remove(kwargs['codec'])
+                self._offered_codecs.insert(0, kwargs['codec'])
+            self._codec = wire_codec.DEFAULT_CODEC
+            self._credits = kwargs.get('credits') or DYNAMO_MAX_CREDITS  # Max outstanding jobs we can accept
+            self._results = []  # Results waiting to be sent back in a batch
+            self._results_deadline = 0
             self.logger.info(f"Dynamo {self._socket.identity} init done")
         except Exception as e:
             self.logger.error(f"Connection error: {e}")
@@ -73,44 +103,77 @@ class Dynamo(object):
         try:
             msg = None
             job_id = None
+            jobs = deque()
             # Send a connect message
-            self._socket.send_json({'message': 'connect'})
+            self._send({'message': 'connect', 'codecs': self._offered_codecs, 'credits': self._credits})
             self.logger.debug(f"Client {self._socket.identity} sent back 'connect' message.")
-            # Poll the socket for incoming messages. This will wait up to
-            # 0.1 seconds before returning False. The other way to do this
-            # is is to use zmq.NOBLOCK when reading from the socket,
-            # catching zmq.AGAIN and sleeping for 0.1.
             while True:
                 try:
-                    # Note that we can still use send_json()/recv_json() here,
-                    # the DEALER socket ensures we don't have to deal with
+                    # The DEALER socket ensures we don't have to deal with
                     # client ids at all.
-                    # self.logger.debug(f"Blocking waiting for response form socket {self._socket.identity}")
-                    job_id, work = self._socket.recv_json()
+                    # Jobs are arriving in batches: [[job_id, work], ...]. Once local batch is done, we're
+                    # picking up the next one without blocking, and only when there is nothing left to do
+                    # pending results are flushed and we block on socket.
+                    if not jobs:
+                        if self._socket.poll(0, zmq.POLLIN):
+                            jobs.extend(self._recv())
+                        else:
+                            self._flush_results()
+                            # self.logger.debug(f"Blocking waiting for response form socket {self._socket.identity}")
+                            jobs.extend(self._recv())
+                    job_id, work = jobs.popleft()
                     # self.logger.debug(f"Job: {job_id} received from socket {self._socket.identity}")
                     msg = self._do_work(work)
                     self.logger.debug(f"Going to send {job_id}: {msg}")
-                    self._socket.send_json(
-                        {'message': 'job_done',
-                         'result': msg,
-                         'job_id': job_id})
-                    self.logger.debug(f"{job_id} sent")
+                    self._add_result(job_id, msg)
                 except zmq.ZMQError as zmq_error:
                     self.logger.warn(f"Failed to send message due to: {zmq_error}. Message {job_id} lost!")
                 except TypeError:
-                    self.logger.error(f"JSON Serialisation error: msg: {msg}")
+                    self.logger.error(f"Serialisation error: msg: {msg}")
         except KeyboardInterrupt:
             pass
         except Exception as e:
             self.logger.exception(e)
         finally:
+            self._flush_results()
             self._disconnect()
+            self._close_fd_cache()
+
+    def _add_result(self, job_id, result):
+        """
+        Results are sent back in batches, batch is sent once it's full or its oldest result waits too long
+        """
+        if not self._results:
+            self._results_deadline = time.monotonic() + RESULT_BATCH_MAX_DELAY
+        self._results.append((job_id, result))
+        if len(self._results) >= RESULT_BATCH_MAX_SIZE or time.monotonic() >= self._results_deadline:
+            self._flush_results()
+
+    def _flush_results(self):
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        self._send({'message': 'jobs_done', 'results': results})
+        self.logger.debug(f"{len(results)} results sent")
 
     def _disconnect(self):
         """
         Send the Controller a disconnect message and end the run loop
         """
-        self._socket.send_json({'message': 'disconnect'})
+        self._send({'message': 'disconnect'})
+
+    def _close_fd_cache(self):
+        if self.fd_cache.mode != OPEN_PER_OP:
+            self.logger.info(f"Descriptors cache: {self.fd_cache.hits} hits, {self.fd_cache.misses} misses")
+        self.fd_cache.close()
+
+    def _send(self, message):
+        self._socket.send_multipart([self._codec.name.encode('utf8'), self._codec.encode(message)])
+
+    def _recv(self):
+        codec_name, payload = self._socket.recv_multipart()
+        self._codec = wire_codec.get_codec(codec_name)
+        return self._codec.decode(payload)
 
     def _do_work(self, work):
         """
@@ -129,17 +192,17 @@ class Dynamo(object):
                 raise DynamoException(error_codes.NO_TARGET,
                                       "{0}".format("Target not specified", work['data']['target']))
             response = response_action(action, mount_point, work['data'],
-                                       dst_mount_point=mount_point, flock=self.flock)
+                                       dst_mount_point=mount_point, flock=self.flock, writer_id=self.writer_id,
+                                       fd_cache=self.fd_cache)
             if response:
                 data = response
         except OSError as os_error:
             return build_message('failed', action, data, timestamp(), error_code=os_error.errno,
-                                 error_message=os_error.strerror,
-                                 path='/'.join([mount_point, work['data']['target']]),
-                                 line=sys.exc_info()[-1].tb_lineno)
+                                 error_message=os_error.strerror, path=work['data']['target'],
+                                 line=sys.exc_info()[-1].tb_lineno, mount_point=mount_point)
         except Exception as unhandled_error:
             self.logger.exception(unhandled_error)
             return build_message('failed', action, data, timestamp(), error_message=unhandled_error.args[0],
-                                 path=''.join([mount_point, work['data']['target']]),
-                                 line=sys.exc_info()[-1].tb_lineno)
+                                 path=work['data']['target'], line=sys.exc_info()[-1].tb_lineno,
+                                 mount_point=mount_point)
         return build_message('success', action, data, timestamp(), path=work['data']['target'])
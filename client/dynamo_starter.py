@@ -1,6 +1,7 @@
 #!/usr/bin/env python3.6
 
 import argparse
+import multiprocessing
 import os
 import traceback
 import time
@@ -8,8 +9,13 @@ import sys
 from concurrent.futures import ProcessPoolExecutor
 from generic_mounter import Mounter
 from dynamo import Dynamo
+from async_dynamo import AsyncDynamo
+from broker import run_broker
+from fd_cache import FD_CACHE_MODES
 from logger import pubsub_logger
-from config import MAX_WORKERS_PER_CLIENT
+from config import MAX_WORKERS_PER_CLIENT, DYNAMO_MAX_CREDITS, DYNAMO_QUEUE_DEPTH, DYNAMO_FD_CACHE, \
+    DYNAMO_FD_CACHE_SIZE, DYNAMO_FD_CACHE_TTL
+from utils import wire_codec
 
 
 def futures_validator(futures, logger):
@@ -27,8 +33,11 @@ def futures_validator(futures, logger):
             raise e
 
 
-def run_worker(mount_points, controller, server, nodes, domains, **kwargs):
-    worker = Dynamo(mount_points, controller, server, nodes, domains, **kwargs)
+ENGINES = {'sync': Dynamo, 'async': AsyncDynamo}
+
+
+def run_worker(engine, mount_points, controller, server, nodes, domains, **kwargs):
+    worker = ENGINES[engine](mount_points, controller, server, nodes, domains, **kwargs)
     worker.run()
 
 
@@ -50,6 +59,23 @@ def get_args():
     parser.add_argument('--end_vip', type=str, help="End VIP address range")
     parser.add_argument('-l', '--locking', type=str, help='Locking Type', choices=['native', 'application', 'off'],
                         default="native")
+    parser.add_argument('--codec', type=str, choices=wire_codec.supported_codecs(),
+                        help="Preferred wire codec to offer to Controller")
+    parser.add_argument('--credits', type=int, default=DYNAMO_MAX_CREDITS,
+                        help="Max outstanding jobs each worker advertises it can accept")
+    parser.add_argument('--engine', type=str, choices=sorted(ENGINES), default='sync',
+                        help="sync: worker runs one job at a time, async: worker keeps queue_depth jobs in flight")
+    parser.add_argument('--queue_depth', type=int, default=DYNAMO_QUEUE_DEPTH, help="Jobs in flight per async worker")
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS_PER_CLIENT, help="Worker processes")
+    parser.add_argument('--broker', action='store_true',
+                        help="Workers talk to the Controller through a broker process, over its single connection")
+    parser.add_argument('--fd_cache', type=str, choices=FD_CACHE_MODES, default=DYNAMO_FD_CACHE,
+                        help="open: workers open the file for every op, cached: workers keep file descriptors open")
+    parser.add_argument('--fd_cache_size', type=int, default=DYNAMO_FD_CACHE_SIZE,
+                        help="Max idle file descriptors each worker keeps open")
+    parser.add_argument('--fd_cache_ttl', type=float, default=DYNAMO_FD_CACHE_TTL,
+                        help="Seconds a cached descriptor is used before checking its path still leads to its file, "
+                             "0 checks it on every op. Unsafe when several workers work on the same files")
     args = parser.parse_args()
     return args
 
@@ -73,10 +99,22 @@ def run():
         raise
     # Start a few worker processes
     futures = []
-    with ProcessPoolExecutor(MAX_WORKERS_PER_CLIENT) as executor:
-        for i in range(MAX_WORKERS_PER_CLIENT):
-            futures.append(executor.submit(run_worker, mounter.mount_points, args.controller, args.server, args.nodes,
-                                           args.domains, **dict(locking_type=args.locking)))
+    if args.broker:
+        logger.info("Starting client broker...")
+        broker_stop = multiprocessing.Event()
+        broker = multiprocessing.Process(target=run_broker, args=(args.controller, broker_stop))
+        broker.start()
+    with ProcessPoolExecutor(args.workers) as executor:
+        for i in range(args.workers):
+            futures.append(executor.submit(run_worker, args.engine, mounter.mount_points, args.controller,
+                                           args.server, args.nodes, args.domains,
+                                           **dict(locking_type=args.locking, codec=args.codec, credits=args.credits,
+                                                  queue_depth=args.queue_depth, broker=args.broker,
+                                                  fd_cache=args.fd_cache, fd_cache_size=args.fd_cache_size,
+                                                  fd_cache_ttl=args.fd_cache_ttl)))
+    if args.broker:
+        broker_stop.set()
+        broker.join()
     futures_validator(futures, logger)
     logger.info('all done')
 
@@ -0,0 +1,180 @@
+"""
+Per-worker LRU cache of open file descriptors, so file ops don't reopen their target every time
+2018 samuels (c)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import DYNAMO_FD_CACHE_SIZE, DYNAMO_FD_CACHE_TTL
+
+__author__ = 'samuels'
+
+OPEN_PER_OP = 'open'  # every op opens its target and closes it once done
+CACHED = 'cached'  # descriptors are kept open between ops, up to cache's capacity
+FD_CACHE_MODES = (OPEN_PER_OP, CACHED)
+
+
+class FDCache(object):
+    """
+    Descriptors are keyed by (target, mount point), target being job's path relative to the mount point, so a file
+    which is reached through several VIPs is invalidated through all of them. Cached descriptors are opened O_RDWR
+    whatever op opened them, so one serves reads, writes and truncates alike.
+
+    Other workers rename and delete files as well, so a cached descriptor is checked to still be the file its path leads
+    to before every op, a stat() instead of an open() and a close(). A ttl makes a descriptor which was checked less
+    than ttl seconds ago be used as is - unsafe when several workers work on the same files: ops of a file another
+    worker just renamed over or deleted go to the old file for up to ttl seconds, writes are lost and reads fail
+    verification. An op which fails (ESTALE, ENOENT...) drops its descriptor, the next op reopens the path. Descriptor
+    of a file which went away is closed, and the op fails with ENOENT as it would have without the cache. Worker's own
+    delete, rename, rename_exist and truncate invalidate their files' descriptors (see invalidate()) before anything
+    else: over NFS, removing a file the client still has open leaves a .nfsXXXX file behind.
+
+    A descriptor is in use by one job at a time: open() takes it out of the cache and puts it back once the job is
+    done, a concurrent job on the same file (AsyncDynamo's pool threads) opens one of its own. So lseek() and open
+    file description locks of a descriptor are never shared between jobs.
+    """
+
+    def __init__(self, mode=OPEN_PER_OP, capacity=DYNAMO_FD_CACHE_SIZE, ttl=DYNAMO_FD_CACHE_TTL):
+        """
+        Args:
+            mode: str, one of FD_CACHE_MODES
+            capacity: int, max idle descriptors kept open
+            ttl: float, seconds a checked descriptor is used without checking it again, 0 checks it on every op,
+                see the class docstring before setting it
+        """
+        if mode not in FD_CACHE_MODES:
+            raise ValueError(f"Unknown descriptors cache mode {mode}")
+        self.mode = mode
+        self._capacity = capacity
+        self._ttl = ttl
+        # (target, mount point) -> (fd, st_dev, st_ino, checked at) of idle descriptors, LRU first
+        self._fds = OrderedDict()
+        self._in_use = {}  # (target, mount point) -> number of its descriptors jobs are using
+        self._stale = set()  # keys in use which were invalidated, their descriptors are closed once jobs are done
+        self._mount_points = set()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @contextmanager
+    def open(self, mount_point, target, flags):
+        """
+        Args:
+            mount_point: str
+            target: str, path relative to the mount point, '/dir/file'
+            flags: int, os.open() flags of an op which opens the file every time
+
+        Returns: int, open file descriptor, for the `with` block only
+        """
+        path = ''.join([mount_point, target])
+        if self.mode == OPEN_PER_OP:
+            fd = os.open(path, flags)
+            try:
+                yield fd
+            finally:
+                os.close(fd)
+            return
+        key = (target, mount_point)
+        entry = self._checkout(key)
+        try:
+            entry = self._validate(path, entry)
+        except OSError:
+            self._checkin(key, None)
+            raise
+        reuse = False
+        try:
+            yield entry[0]
+            reuse = True
+        finally:
+            # Descriptor of a failed op isn't trusted anymore
+            self._checkin(key, entry if reuse else None)
+            if not reuse:
+                os.close(entry[0])
+
+    def invalidate(self, target):
+        """
+        Closes idle descriptors of the file, descriptors of it which are in use are closed once their jobs are done
+
+        Args:
+            target: str, path relative to the mount point
+        """
+        if self.mode == OPEN_PER_OP:
+            return
+        fds = []
+        with self._lock:
+            for mount_point in self._mount_points:
+                key = (target, mount_point)
+                entry = self._fds.pop(key, None)
+                if entry:
+                    fds.append(entry[0])
+                if key in self._in_use:
+                    self._stale.add(key)
+        for fd in fds:
+            os.close(fd)
+
+    def close(self):
+        with self._lock:
+            fds = [entry[0] for entry in self._fds.values()]
+            self._fds.clear()
+        for fd in fds:
+            os.close(fd)
+
+    def _checkout(self, key):
+        """
+        Returns: tuple, (fd, st_dev, st_ino, checked at) of file's idle descriptor, None if there is none
+        """
+        with self._lock:
+            self._mount_points.add(key[1])
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            entry = self._fds.pop(key, None)
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def _validate(self, path, entry):
+        """
+        Returns: tuple, (fd, st_dev, st_ino, checked at) of a descriptor of the file the path leads to now, as far as
+            the last ttl seconds go
+        """
+        now = time.monotonic()
+        if entry:
+            if now - entry[3] < self._ttl:
+                return entry
+            try:
+                path_stat = os.stat(path)
+            except OSError:
+                os.close(entry[0])
+                raise
+            if (path_stat.st_dev, path_stat.st_ino) == entry[1:3]:
+                return entry[0], entry[1], entry[2], now
+            os.close(entry[0])  # file was renamed or deleted, and another one took its name
+        fd = os.open(path, os.O_RDWR)
+        fd_stat = os.fstat(fd)
+        return fd, fd_stat.st_dev, fd_stat.st_ino, now
+
+    def _checkin(self, key, entry):
+        """
+        Puts back a descriptor the job is done with, None if there is none to put back
+        """
+        fds = []
+        with self._lock:
+            in_use = self._in_use[key] - 1
+            stale = key in self._stale
+            if in_use:
+                self._in_use[key] = in_use
+            else:
+                del self._in_use[key]
+                self._stale.discard(key)
+            if entry:
+                if stale or key in self._fds:
+                    fds.append(entry[0])
+                else:
+                    self._fds[key] = entry
+                    while len(self._fds) > self._capacity:
+                        fds.append(self._fds.popitem(last=False)[1][0])
+        for fd in fds:
+            os.close(fd)
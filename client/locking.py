@@ -7,9 +7,15 @@ import json
 import os
 import errno
 import socket
+import struct
 import xxhash
 from enum import Enum
 
+F_OFD_SETLK = getattr(fcntl, 'F_OFD_SETLK', 37)  # Linux only, Python has them since 3.9
+F_OFD_SETLKW = getattr(fcntl, 'F_OFD_SETLKW', 38)
+FLOCK = struct.Struct('@hhqqi4x')  # struct flock: l_type, l_whence, l_start, l_len, l_pid
+LOCK_TYPES = {fcntl.LOCK_SH: fcntl.F_RDLCK, fcntl.LOCK_EX: fcntl.F_WRLCK, fcntl.LOCK_UN: fcntl.F_UNLCK}
+
 
 class LockType(Enum):
     EXCLUSIVE = fcntl.LOCK_EX
@@ -24,13 +30,20 @@ class LockException(OSError):
 
 
 class FLock(object):
-    def __init__(self, locking_db, locking_type="native"):
+    def __init__(self, locking_db, locking_type="native", per_fd=False):
+        """
+        Args:
+            locking_db: redis.StrictRedis, for application locking
+            locking_type: str, 'native', 'application' or 'off'
+            per_fd: bool, native locks are owned by the open file rather than the process, so jobs running on threads
+                    of the same process exclude each other (see ofd_lockf)
+        """
         self.locking_db = locking_db
         self.pid = os.getpid()
         self.host = socket.gethostname()
 
         if locking_type == "native":
-            self.lockf = fcntl.lockf
+            self.lockf = ofd_lockf if per_fd else fcntl.lockf
         elif locking_type == "application":
             self.lockf = self._lock
         else:
@@ -86,5 +99,17 @@ class FLock(object):
         pass
 
 
+def ofd_lockf(fd, lock_type, length=0, offset=0, whence=0):
+    """
+    Same as fcntl.lockf(), but with open file description lock: it's owned by the open file, not by the process, so
+    threads of one process holding their own open files conflict with each other, and closing a file doesn't release
+    locks other threads hold on it
+
+    Raises: OSError, EAGAIN or EACCES if the range is locked and lock_type has LOCK_NB
+    """
+    command = F_OFD_SETLK if lock_type & fcntl.LOCK_NB or lock_type == fcntl.LOCK_UN else F_OFD_SETLKW
+    fcntl.fcntl(fd, command, FLOCK.pack(LOCK_TYPES[lock_type & ~fcntl.LOCK_NB], whence, offset, length, 0))
+
+
 def is_overlap(start1, end1, start2, end2):
     return end1 >= start2 and end2 >= start1
@@ -0,0 +1,70 @@
+"""
+Registry of data patterns by small integer ids: preallocated, immutable block payloads written as zero-copy slices
+2018 samuels (c)
+"""
+import random
+
+import xxhash
+
+from block_format import BLOCK_SIZE, HEADER
+
+__author__ = 'samuels'
+
+NO_PATTERN = 0  # pattern id of data which was never written: zeros
+
+
+class PatternRegistry(object):
+    """
+    Block payload - what follows block's header, see block_format - of every pattern is built once, when the registry
+    is, and shared by all the writes: a write only packs its headers and hands them, as memoryview slices, with the
+    payload to writev().
+    Pattern ids are what the blocks are stamped with and all that Controller keeps of a write's data, with the
+    pattern's data hash for a write of the given length; both are the same on every client, as the patterns are.
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns: list of bytes, pattern ids are their 1-based positions, id 0 is NO_PATTERN
+        """
+        self.patterns = (b'',) + tuple(patterns)
+        self._payloads = [b''] + [(pattern * (BLOCK_SIZE // len(pattern) + 1))[HEADER.size:BLOCK_SIZE]
+                                  for pattern in patterns]
+        self._hashes = {}  # (pattern id, length) -> data hash
+
+    def __len__(self):
+        return len(self.patterns) - 1
+
+    def __contains__(self, pattern_id):
+        return NO_PATTERN < pattern_id < len(self.patterns)
+
+    def random_id(self):
+        return 1 + int(random.random() * len(self))
+
+    def payload(self, pattern_id):
+        """
+        Returns: bytes, payload of a block of the pattern: pattern repeated from block's start, without the header's
+                 bytes. Immutable, so writes pass it to the kernel as is
+        """
+        return self._payloads[pattern_id]
+
+    def data_hash(self, pattern_id, length):
+        """
+        Args:
+            pattern_id: int
+            length: int, bytes written, multiple of BLOCK_SIZE
+
+        Returns: int, xxhash of the payloads of `length` bytes of the pattern's blocks
+        """
+        try:
+            return self._hashes[pattern_id, length]
+        except KeyError:
+            hasher = xxhash.xxh64()
+            payload = self._payloads[pattern_id]
+            for _ in range(length // BLOCK_SIZE):
+                hasher.update(payload)
+            data_hash = self._hashes[pattern_id, length] = hasher.intdigest()
+            return data_hash
+
+
+PATTERNS = PatternRegistry([b'1234999988884321', b'0123456789ABCDEF'])
@@ -10,7 +10,9 @@ import mmap
 from timeit import default_timer as timer
 
 sys.path.append('/qa/dynamo')
-from config import error_codes
+from config import error_codes, TOUCH_FILE_SIZE
+from block_format import align_down, align_up, build_headers, read_blocks, verify_blocks, write_blocks
+from pattern_registry import PATTERNS
 
 __author__ = "samuels"
 
@@ -59,6 +61,7 @@ PADDING = [0, ZERO_PADDING_START]
 OFFSETS_LIST = [0, INLINE, KB1, KB4, MB1, MB512, GB1, GB256, GB512, TB1]
 DATA_PATTERNS_LIST = [DATA_PATTERN_A, DATA_PATTERN_B, DATA_PATTERN_C, DATA_PATTERN_D, DATA_PATTERN_E, DATA_PATTERN_F,
                       DATA_PATTERN_G, DATA_PATTERN_H, DATA_PATTERN_I]
+WRITE_SIZES = [KB4, KB8, KB16, KB32, KB64, KB128, KB256, KB512, MB1]
 # DATA_PATTERNS_LIST = [DATA_PATTERN_I]
 
 
@@ -66,14 +69,6 @@ class DynamoException(EnvironmentError):
     pass
 
 
-class DataPatterns:
-    def __init__(self):
-        self.data_patterns_dict = {}
-
-        for _ in range(1000):
-            pass
-
-
 def profiler(f):
     """
     Profiler decorator to measure duration of file operations
@@ -122,6 +117,7 @@ def delete(mount_point, incoming_data, **kwargs):
     outgoing_data = {}
     flock = kwargs['flock']
     f_path = ''.join([mount_point, incoming_data['target']])
+    kwargs['fd_cache'].invalidate(incoming_data['target'])
     with open(f_path, 'rb') as fp:
         flock.release(fp.fileno(), 0, os.path.getsize(f_path))
     os.remove(f_path)
@@ -135,7 +131,7 @@ def touch(mount_point, incoming_data, **kwargs):
     # File will be only created if not exists otherwise EEXIST error returned
     flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
     fd = os.open(''.join([mount_point, incoming_data['target']]), flags)
-    os.write(fd, b'\0')
+    os.write(fd, b'\0' * TOUCH_FILE_SIZE)
     os.close(fd)
     outgoing_data['dirsize'] = 4096  # This field is deprecated since we're counting dir size on server side
     # outgoing_data['uuid'] = incoming_data['uuid']
@@ -154,14 +150,17 @@ def read(mount_point, incoming_data, **kwargs):
     outgoing_data = {}
     flock = kwargs['flock']
     offset = incoming_data['offset']
-    chunk_size = incoming_data['repeats']
-    f_path = ''.join([mount_point, incoming_data['target']])
-    with open(f_path, 'rb') as f:
-        f.seek(offset)
-        flock.lockf(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB, chunk_size, offset, 0)
-        buf = f.read(chunk_size)
-        flock.lockf(f.fileno(), fcntl.LOCK_UN, chunk_size, offset)
-        outgoing_data['hash'] = xxhash.xxh64(buf).intdigest()
+    chunk_size = incoming_data['chunk_size']
+    with kwargs['fd_cache'].open(mount_point, incoming_data['target'], os.O_RDONLY) as fd:
+        flock.lockf(fd, fcntl.LOCK_SH | fcntl.LOCK_NB, chunk_size, offset, 0)
+        buf = read_blocks(fd, offset, chunk_size)
+        flock.lockf(fd, fcntl.LOCK_UN, chunk_size, offset)
+        # Only bad blocks go back to Controller
+        bad_blocks, block_errors = verify_blocks(buf, offset, chunk_size, int(incoming_data['uuid'], 16),
+                                                 incoming_data['write_tid'], PATTERNS)
+        if bad_blocks:
+            outgoing_data['bad_blocks'] = bad_blocks
+            outgoing_data['block_errors'] = block_errors
         outgoing_data['offset'] = offset
         outgoing_data['chunk_size'] = chunk_size
         outgoing_data['uuid'] = incoming_data['uuid']
@@ -173,38 +172,27 @@ def read(mount_point, incoming_data, **kwargs):
 def write(mount_point, incoming_data, **kwargs):
     outgoing_data = {}
     flock = kwargs['flock']
-    io_mode = 'rb+'
+    # Writes are whole blocks, see block_format
     if incoming_data['io_type'] == 'sequential':
-        offset = incoming_data['offset'] + incoming_data['data_pattern_len']
+        offset = align_up(incoming_data['offset'] + incoming_data['data_pattern_len'])
     else:
         # speed up thing by replacing python's slow randint():
         # https://eli.thegreenplace.net/2018/slow-and-fast-methods-for-generating-random-integers-in-python/
-        offset = int(random.random() * MAX_FILE_SIZE)
-    pattern_index = int(random.random() * len(DATA_PATTERNS_LIST))
-    data_pattern = DATA_PATTERNS_LIST[pattern_index]
-    pattern_to_write = data_pattern['pattern'] * data_pattern['repeats']
-    data_hash = data_pattern['checksum']
-    file_path = ''.join([mount_point, incoming_data['target']])
-    if not os.path.exists(file_path):
-        io_mode = 'w+b'
-    with open(file_path, io_mode) as f:
-        flock.lockf(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB, data_pattern['repeats'], offset, 0)
-        f.seek(offset)
-        f.write(pattern_to_write)
-        # f.flush()
-        # os.fsync(f.fileno())
-        flock.lockf(f.fileno(), fcntl.LOCK_UN, data_pattern['repeats'], offset)
-        #  Checking if original data pattern and pattern on disk are the same
-        # f.seek(offset)
-        # buf = f.read(len(pattern_to_write))
-        # read_hash = xxhash.xxh64(buf).intdigest()
-        # if read_hash != data_hash:
-        #     outgoing_data['dynamo_error'] = error_codes.HASHERR
-        #     outgoing_data['bad_hash'] = read_hash
-        # fcntl.lockf(f.fileno(), fcntl.LOCK_UN, data_pattern['repeats'], offset)
-    outgoing_data['data_pattern'] = data_pattern['pattern'].decode()
-    outgoing_data['chunk_size'] = data_pattern['repeats']
-    outgoing_data['hash'] = data_hash
+        offset = align_down(int(random.random() * MAX_FILE_SIZE))
+    pattern_id = PATTERNS.random_id()
+    chunk_size = WRITE_SIZES[int(random.random() * len(WRITE_SIZES))]
+    headers = build_headers(offset, chunk_size, pattern_id, int(incoming_data['uuid'], 16), incoming_data['tid'],
+                            kwargs['writer_id'])
+    # Never creates the file: write which lost the race to a rename or delete has to fail with ENOENT, as the model
+    # expects, instead of bringing back a file which isn't there anymore
+    with kwargs['fd_cache'].open(mount_point, incoming_data['target'], os.O_RDWR) as fd:
+        flock.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, chunk_size, offset, 0)
+        # Headers and registry's payload go to the file as is, nothing is copied
+        write_blocks(fd, offset, headers, PATTERNS.payload(pattern_id))
+        flock.lockf(fd, fcntl.LOCK_UN, chunk_size, offset)
+    outgoing_data['pattern_id'] = pattern_id
+    outgoing_data['chunk_size'] = chunk_size  # bytes written
+    outgoing_data['hash'] = PATTERNS.data_hash(pattern_id, chunk_size)
     outgoing_data['offset'] = offset
     outgoing_data['uuid'] = incoming_data['uuid']
     outgoing_data['io_type'] = incoming_data['io_type']
@@ -214,11 +202,13 @@ def write(mount_point, incoming_data, **kwargs):
 
 def rename(mount_point, incoming_data, **kwargs):
     outgoing_data = {}
-    fullpath = incoming_data['target'].split('/')[1:]
-    dirpath = fullpath[0]
-    fname = fullpath[1]
+    dirpath, _, fname = incoming_data['target'].lstrip('/').rpartition('/')
     dst_mount_point = kwargs['dst_mount_point']
     outgoing_data['rename_dest'] = incoming_data['rename_dest']
+    # Destination is replaced if it's there
+    fd_cache = kwargs['fd_cache']
+    fd_cache.invalidate(incoming_data['target'])
+    fd_cache.invalidate('/'.join([incoming_data['target'].rpartition('/')[0], incoming_data['rename_dest']]))
     os.rename('/'.join([mount_point, dirpath, fname]),
               '/'.join([dst_mount_point, dirpath, incoming_data['rename_dest']]))
     outgoing_data['uuid'] = incoming_data['uuid']
@@ -230,13 +220,13 @@ def rename_exist(mount_point, incoming_data, **kwargs):
     outgoing_data = {}
     src_path = incoming_data['rename_source']
     dst_path = incoming_data['rename_dest']
-    src_dirpath = src_path.split('/')[1]
-    src_fname = src_path.split('/')[2]
-    dst_dirpath = dst_path.split('/')[1]
-    dst_fname = dst_path.split('/')[2]
+    src_dirpath, _, src_fname = src_path.lstrip('/').rpartition('/')
+    dst_dirpath, _, dst_fname = dst_path.lstrip('/').rpartition('/')
     if src_fname == dst_fname:
         raise DynamoException(error_codes.SAMEFILE, "Error: Trying to move file into itself.", src_path)
     dst_mount_point = kwargs['dst_mount_point']
+    kwargs['fd_cache'].invalidate(src_path)
+    kwargs['fd_cache'].invalidate(dst_path)
     shutil.move('/'.join([mount_point, src_dirpath, src_fname]),
                 '/'.join([dst_mount_point, dst_dirpath, dst_fname]))
     outgoing_data['rename_source'] = src_path
@@ -251,27 +241,14 @@ def truncate(mount_point, incoming_data, **kwargs):
     flock = kwargs['flock']
     padding = random.choice(PADDING)
     offset = random.choice(OFFSETS_LIST) + padding
-    fp = None
-    try:
-        fp = open(''.join([mount_point, incoming_data['target']]), 'r+b')
-        # flock.lockf(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-        fp.truncate(offset)
-        fp.flush()
-        os.fsync(fp.fileno())
-        # flock.lockf(fp.fileno(), fcntl.LOCK_UN)
-        fp.close()
-    except (IOError, OSError) as env_error:
-        if fp:
-            try:
-                fcntl.lockf(fp.fileno(), fcntl.LOCK_UN)
-            except OSError as os_err:
-                if os_err.errno == errno.ENOLCK:
-                    pass
-                else:
-                    fp.close()
-                    raise os_err
-            fp.close()
-        raise env_error
+    fd_cache = kwargs['fd_cache']
+    with fd_cache.open(mount_point, incoming_data['target'], os.O_RDWR) as fd:
+        # flock.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.ftruncate(fd, offset)
+        os.fsync(fd)
+        # flock.lockf(fd, fcntl.LOCK_UN)
+    # Next op reopens the file, so the client revalidates its size and drops its cached pages past it
+    fd_cache.invalidate(incoming_data['target'])
     outgoing_data['size'] = offset
     outgoing_data['uuid'] = incoming_data['uuid']
     outgoing_data['tid'] = incoming_data['tid']
@@ -287,7 +264,7 @@ def read_direct(mount_point, incoming_data, **kwargs):
         fd = os.open(f_path, os.O_RDONLY | os.O_DIRECT)
         mmap_buf = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
         offset = incoming_data['offset']
-        chunk_size = incoming_data['repeats']
+        chunk_size = incoming_data['chunk_size']
         mmap_buf.seek(offset)
         flock.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, chunk_size, offset)
         buf = mmap_buf.read(chunk_size)
@@ -2,7 +2,11 @@ CTRL_MSG_PORT = 5557
 CLIENT_MSG_PORT = 5558
 CLIENT_PROXY_FRONTEND = 6000
 PUBSUB_LOGGER_PORT = 5559
+BROKER_JOBS_ENDPOINT = 'ipc:///tmp/dynamo_broker_jobs'  # Client broker's socket for the host's workers jobs
+BROKER_LOGS_ENDPOINT = 'ipc:///tmp/dynamo_broker_logs'  # Client broker's socket for the host's workers log records
 MAX_FILES_PER_DIR = 10000
+TOUCH_FILE_SIZE = 1  # Zero bytes client's touch writes to a new file
+UNWRITTEN_READ_SIZE = 4096  # Bytes read from the head of files which were never written
 
 SET_SSH_PATH = "/zebra/qa/qa-util-scripts/set-ssh-client"
 DYNAMO_PATH = '~/qa/dynamo'
@@ -10,3 +14,33 @@ DYNAMO_BIN_PATH = '~/qa/dynamo/client/dynamo_starter.py'
 MAX_WORKERS_PER_CLIENT = 32
 CLIENT_MOUNT_POINT = "/mnt/test_workdir"
 FILE_NAMES_PATH = "filenames.dat"
+JOB_BATCH_MAX_SIZE = 64  # Max jobs Controller packs into one message to a client worker
+JOB_BATCH_MAX_DELAY = 0.005  # Max seconds a job may wait in Controller for its batch to fill up
+RESULT_BATCH_MAX_SIZE = 64  # Max results client worker packs into one message to the Controller
+RESULT_BATCH_MAX_DELAY = 0.05  # Max seconds a result may wait in client worker for its batch to fill up
+DYNAMO_MAX_CREDITS = 256  # Max outstanding jobs client worker advertises it can accept
+DYNAMO_QUEUE_DEPTH = 32  # Jobs async client worker keeps in flight on its thread pool
+DYNAMO_FD_CACHE = 'open'  # 'open': client worker opens the file for every op, 'cached': keeps descriptors open
+DYNAMO_FD_CACHE_SIZE = 128  # Max idle file descriptors client worker keeps open in 'cached' mode
+# Seconds a cached descriptor is used without checking its path still leads to its file. 0 checks it on every op: with
+# several workers on the same files, ops may otherwise go to a file another worker renamed over or deleted
+DYNAMO_FD_CACHE_TTL = 0
+CONTROLLER_INITIAL_WINDOW = 8  # Jobs Controller allows in flight on newly connected client worker
+CONTROLLER_MIN_WINDOW = 2  # Window never shrinks below this number of jobs
+TARGET_QUEUE_DELAY = 0.5  # Seconds of work (at observed completion rate) Controller keeps queued on each client worker
+WINDOW_UPDATE_INTERVAL = 1.0  # Seconds between client workers windows updates
+JOB_BUFFER_SIZE = 256  # Max jobs Controller generates ahead of demand
+JOB_BUFFER_REFILL_SIZE = 16  # Jobs generated at once when dispatch finds the jobs buffer empty
+REORDER_BUFFER_SIZE = 10000  # Max results Controller holds back to process them in timestamp order
+REORDER_MAX_DELAY = 1.0  # Max seconds a result is held back waiting for other client workers to catch up
+REORDER_RELEASE_INTERVAL = 0.01  # Min seconds between reorder watermark updates
+JOB_SLOT_BITS = 24  # Low bits of a job id are its slot in Controller's jobs table, so up to 16M live jobs
+TOMBSTONE_GRACE_PERIOD = 30  # Seconds deleted/renamed away files are kept, so late results still find them
+TOMBSTONE_COMPACTION_BATCH = 1000  # Max expired tombstones reclaimed in one compaction pass
+TOMBSTONE_COMPACTION_INTERVAL = 0.1  # Min seconds between Controller's compaction passes
+CHECKPOINT_PATH = "checkpoint"  # Directory of Controller's DirTree snapshots and journals of results applied since
+CHECKPOINT_INTERVAL = 600  # Seconds between DirTree snapshots
+CHECKPOINT_JOURNAL_FLUSH_INTERVAL = 1.0  # Max seconds an applied result may stay in the journal's write buffer
+MAX_ACTIVE_DIRS = 10  # No new directories while DirTree has more, unless workload's namespace sets max_dirs
+NAMESPACE_VERIFIER_WORKERS = 32  # Parallel scandir() calls of namespace verifier, spread over all mount points
+NAMESPACE_VERIFIER_SETTLE_TIME = 1.0  # Seconds before checkpoint's last update, entries changed since aren't verified
@@ -20,12 +20,15 @@ from config.redis_config import redis_config
 from logger.pubsub_logger import SUBLogger
 from logger.server_logger import ConsoleLogger
 from server.async_controller import Controller
+from server.asyncio_controller import AsyncioController
+from server import checkpoint
 from tree import dirtree
 from utils import ssh_utils
 from utils.shell_utils import ShellUtils
 
 stop_event = Event()
 logger = ConsoleLogger(__name__).logger
+CONTROLLER_ENGINES = {'threaded': Controller, 'asyncio': AsyncioController}
 
 
 def get_args():
@@ -45,6 +48,20 @@ def get_args():
                                                                             'smb3'], help='Mount type')
     parser.add_argument('-l', '--locking', type=str, help='Locking Type', choices=['native', 'application', 'off'],
                         default="native")
+    parser.add_argument('--engine', type=str, choices=list(CONTROLLER_ENGINES.keys()), default='threaded',
+                        help="Controller messaging engine")
+    parser.add_argument('--client_engine', type=str, choices=['sync', 'async'], default='sync',
+                        help="Client workers engine, async worker keeps queue_depth jobs in flight")
+    parser.add_argument('--client_workers', type=int, default=config.MAX_WORKERS_PER_CLIENT,
+                        help="Worker processes per client")
+    parser.add_argument('--queue_depth', type=int, default=config.DYNAMO_QUEUE_DEPTH,
+                        help="Jobs in flight per async client worker")
+    parser.add_argument('--client_broker', action='store_true',
+                        help="Client workers talk to the Controller through a broker per client host")
+    parser.add_argument('--client_fd_cache', type=str, choices=['open', 'cached'], default=config.DYNAMO_FD_CACHE,
+                        help="open: client workers open the file for every op, cached: keep file descriptors open")
+    parser.add_argument('--resume', action="store_true",
+                        help="Resume test run from its last checkpoint, directory tree state included")
     args = parser.parse_args()
     return args
 
@@ -55,7 +72,7 @@ def load_config():
     return test_config
 
 
-def wait_clients_to_start(clients):
+def wait_clients_to_start(clients, workers):
     cmd_line = "ps aux | grep dynamo | grep -v grep | wc -l"
     while True:
         total_processes = 0
@@ -64,7 +81,7 @@ def wait_clients_to_start(clients):
             logger.info(f"SSH command response with {int(outp)} processes on client {client}")
             num_processes_per_client = int(outp)
             total_processes += num_processes_per_client
-        if total_processes >= config.MAX_WORKERS_PER_CLIENT * len(clients):
+        if total_processes >= workers * len(clients):
             break
         time.sleep(1)
     logger.info(f"All {len(clients)} clients started. {total_processes // len(clients)} processes per client")
@@ -98,19 +115,25 @@ def deploy_clients(clients, access):
         ShellUtils.run_shell_remote_command_no_exception(client, 'chmod +x {}'.format(config.DYNAMO_BIN_PATH))
 
 
-def run_clients(cluster, clients, export, mtype, start_vip, end_vip, locking_type):
+def run_clients(cluster, clients, export, mtype, start_vip, end_vip, locking_type, engine='sync',
+                workers=config.MAX_WORKERS_PER_CLIENT, queue_depth=config.DYNAMO_QUEUE_DEPTH, broker=False,
+                fd_cache=config.DYNAMO_FD_CACHE):
     #  Will explicitly pass public IP of the controller to clients since we won't rely on DNS existence
     controller = socket.gethostbyname(socket.gethostname())
     dynamo_cmd_line = "{} --controller {} --server {} --export {} --mtype {} --start_vip {} --end_vip {} " \
-                      "--locking {}".format(config.DYNAMO_BIN_PATH, controller, cluster, export, mtype, start_vip,
-                                            end_vip, locking_type)
+                      "--locking {} --engine {} --workers {} --queue_depth {} --fd_cache {}".format(
+                          config.DYNAMO_BIN_PATH, controller, cluster, export, mtype, start_vip, end_vip, locking_type,
+                          engine, workers, queue_depth, fd_cache)
+    if broker:
+        dynamo_cmd_line += " --broker"
     for client in clients:
         ShellUtils.run_shell_remote_command_background(client, dynamo_cmd_line)
-    wait_clients_to_start(clients)
+    wait_clients_to_start(clients, workers)
 
 
-def run_controller(event, dir_tree, test_config, clients_ready_event):
-    Controller(event, dir_tree, test_config, clients_ready_event).run()
+def run_controller(event, dir_tree, test_config, clients_ready_event, engine='threaded'):
+    CONTROLLER_ENGINES[engine](event, dir_tree, test_config, clients_ready_event,
+                               checkpoint_path=config.CHECKPOINT_PATH).run()
 
 
 def run_sub_logger(ip):
@@ -146,7 +169,17 @@ def main():
     except IOError as io_error:
         if io_error.errno == errno.ENOENT:
             pass
-    dir_tree = dirtree.DirTree(file_names)
+    run_args = {'cluster': args.cluster, 'export': args.export, 'mtype': args.mtype}
+    if args.resume:
+        checkpoint_run_args = checkpoint.load_run_args()
+        if checkpoint_run_args != run_args:
+            raise ValueError(f"Checkpoint is of a test run with {checkpoint_run_args}, can't resume with {run_args}")
+        logger.info("Restoring directory tree from checkpoint")
+        dir_tree = checkpoint.load(logger, file_names=file_names)
+    else:
+        checkpoint.clear()
+        checkpoint.save_run_args(run_args)
+        dir_tree = dirtree.DirTree(file_names)
     logger.debug(f"{__name__} Logger initialised {logger}")
     atexit.register(cleanup, clients=args.clients)
     clients_list = args.clients
@@ -169,11 +202,13 @@ def main():
     time.sleep(10)
     deploy_clients(clients_list, test_config['access']['client'])
     logger.info(f"Done deploying clients: {clients_list}")
-    run_clients(args.cluster, clients_list, args.export, args.mtype, args.start_vip, args.end_vip, args.locking)
+    run_clients(args.cluster, clients_list, args.export, args.mtype, args.start_vip, args.end_vip, args.locking,
+                args.client_engine, args.client_workers, args.queue_depth, args.client_broker, args.client_fd_cache)
     clients_ready_event.set()
     logger.info("Dynamo started on all clients ....")
     logger.info("Starting controller")
-    controller_process = Process(target=run_controller, args=(stop_event, dir_tree, test_config, clients_ready_event))
+    controller_process = Process(target=run_controller, args=(stop_event, dir_tree, test_config, clients_ready_event,
+                                                              args.engine))
     controller_process.start()
     controller_process.join()
     logger.info('All done')
@@ -23,12 +23,18 @@ formatters = {
 
 
 class PUBLogger:
-    def __init__(self, host, port=config.PUBSUB_LOGGER_PORT):
+    def __init__(self, host, port=config.PUBSUB_LOGGER_PORT, endpoint=None):
+        """
+        Args:
+            host: str, Controller's host
+            port: int
+            endpoint: str, connect there instead of Controller's host, e.g. to client broker, see client/broker.py
+        """
         self._logger = logging.getLogger(socket.gethostname())
         self._logger.setLevel(logging.DEBUG)
         self.ctx = zmq.Context()
         self.pub = self.ctx.socket(zmq.PUB)
-        self.pub.connect('tcp://{0}:{1}'.format(host, port))
+        self.pub.connect(endpoint or 'tcp://{0}:{1}'.format(host, port))
         # create console handler and set level to info
         # handler = logging.StreamHandler(sys.stdout)
         self._handler = PUBHandler(self.pub)
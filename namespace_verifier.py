@@ -0,0 +1,61 @@
+#!/usr/bin/env python3.6
+"""
+Namespace verifier runner: diffs mounted export against DirTree restored from the test run's checkpoint
+Diff records are streamed as JSON lines, exit status is 1 if there are any
+2018 samuels (c)
+"""
+import argparse
+import json
+import sys
+import time
+
+from config import CHECKPOINT_PATH, NAMESPACE_VERIFIER_WORKERS, NAMESPACE_VERIFIER_SETTLE_TIME
+from logger.server_logger import ConsoleLogger
+from server import checkpoint
+from tree.verifier import NamespaceVerifier
+
+__author__ = 'samuels'
+
+logger = ConsoleLogger(__name__).logger
+
+
+def get_args():
+    """
+    Supports the command-line arguments listed below.
+    """
+    parser = argparse.ArgumentParser(description='Namespace verifier')
+    parser.add_argument('mount_points', type=str, nargs='+', help="Mount points of the export, one per VIP")
+    parser.add_argument('--checkpoint', type=str, default=CHECKPOINT_PATH, help="Test run's checkpoint directory")
+    parser.add_argument('--workers', type=int, default=NAMESPACE_VERIFIER_WORKERS, help="Parallel directory listings")
+    parser.add_argument('--settle_time', type=float, default=NAMESPACE_VERIFIER_SETTLE_TIME,
+                        help="Entries changed later than this many seconds before checkpoint's last update, as "
+                             "clients finished their last jobs, aren't verified")
+    parser.add_argument('--all', action='store_true', help="Verify all entries, when the export wasn't changed "
+                                                            "after the checkpoint")
+    parser.add_argument('-o', '--output', type=str, help="Diff records file, stdout if not set")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    logger.info(f"Restoring directory tree from checkpoint {args.checkpoint}")
+    dir_tree = checkpoint.load(logger, args.checkpoint)
+    settled_time = None if args.all else checkpoint.last_update(args.checkpoint) - args.settle_time
+    verifier = NamespaceVerifier(dir_tree, args.mount_points, args.workers, settled_time)
+    started = time.time()
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for record in verifier.diff():
+            output.write(json.dumps(record) + '\n')
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.time() - started
+    logger.info(f"{verifier.dirs} directories, {verifier.entries} entries verified in {elapsed:.1f}s "
+                f"({verifier.entries / max(elapsed, 1e-6):.0f} entries/s), {verifier.diffs} differences, "
+                f"{verifier.unsettled} entries changed after the checkpoint")
+    return 1 if verifier.diffs else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
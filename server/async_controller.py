@@ -6,26 +6,31 @@ import multiprocessing
 import queue
 import timeit
 import json
-import random
 import time
-import uuid
 import os
 import zmq
 from threading import Thread
-from bisect import bisect
-from config import CTRL_MSG_PORT
+from config import CTRL_MSG_PORT, JOB_BATCH_MAX_SIZE, JOB_BATCH_MAX_DELAY, DYNAMO_MAX_CREDITS, \
+    WINDOW_UPDATE_INTERVAL, TOMBSTONE_COMPACTION_INTERVAL
 from logger import server_logger
 from server import helpers
 from server.CSVWriter import CSVWriter
+from server.checkpoint import Checkpoint
 from server.collector import Collector
-from server.request_actions import request_action
+from server.job_generator import JobGenerator, JobTable
+from server.reorder import ReorderBuffer
 from server.response_actions import response_action
+from server.scheduler import WorkerScheduler
+from utils import wire_codec
 
 timer = timeit.default_timer
 
 MAX_DIR_SIZE = 128 * 1024
 MAX_CONTROLLER_OUTGOING_WORKERS = 4
 MAX_CONTROLLER_INCOMING_WORKERS = 16
+PROXY_MAX_MESSAGES_PER_POLL = 128
+# Operations which target an existing file
+EXISTING_FILE_ACTIONS = ('delete', 'stat', 'read', 'write', 'rename', 'rename_exist', 'truncate')
 
 
 __author__ = 'samuels'
@@ -39,37 +44,21 @@ def timestamp(now=None):
     return time_stamp + millisecs[1:]
 
 
-def weighted_choice(choices):
-    values, weights = zip(*choices)
-    total = 0
-    cum_weights = []
-    for w in weights:
-        total += w
-        cum_weights.append(total)
-    x = random.random() * total
-    i = bisect(cum_weights, x)
-    return values[i]
-
-
 def load_workload(name):
     with open(os.path.join("workloads", name + ".json")) as f:
         test_config = json.load(f)
     return test_config
 
 
-class Job(object):
-    def __init__(self, work):
-        self.id = uuid.uuid4().hex
-        self.work = work
-
-
 class Controller(object):
-    def __init__(self, stop_event, dir_tree, test_config, clients_ready_event, port=CTRL_MSG_PORT):
+    def __init__(self, stop_event, dir_tree, test_config, clients_ready_event, port=CTRL_MSG_PORT,
+                 checkpoint_path=None):
         """
         Args:
             stop_event: Event
             dir_tree: DirTree
             port: int
+            checkpoint_path: str, directory of DirTree checkpoints, no checkpoints are taken if None
         """
         try:
             self.stop_event = stop_event
@@ -77,7 +66,6 @@ class Controller(object):
             self.logger = server_logger.Logger().logger
             self._dir_tree = dir_tree  # Controlled going to manage directory tree structure
             self.config = {}
-            self.client_workers = {}
             self.file_operations = {}  # Contains pre-loaded file operations priorities for weighted choice method
             self.config = test_config
             self.test_stats = {'total': 0, 'success': {
@@ -106,6 +94,15 @@ class Controller(object):
                 'rename_exist': 0,
                 'truncate': 0
 
+            }, 'dead_target': {  # Operations which were done on files already known not to be on disk
+                'total': 0,
+                'delete': 0,
+                'stat': 0,
+                'read': 0,
+                'write': 0,
+                'rename': 0,
+                'rename_exist': 0,
+                'truncate': 0
             }}
             self.logger.info(f"Loading workload: {self.config['workload']}")
             workload = load_workload(self.config['workload'])
@@ -125,34 +122,57 @@ class Controller(object):
             if weights_total != 100:
                 raise ValueError(f"Bad total weight of file operations. Got {weights_total}, 100 is expected")
             self.io_types = [(k, v) for k, v in io_types.items()]
-            # We won't assign more than 100 jobs to a worker at a time; this ensures
-            # reasonable memory usage, and less shuffling when a worker dies.
-            self.max_jobs_per_worker = 100000
+            # Jobs are generated ahead of demand while we're waiting for client messages, dispatch only pops them
+            self._job_table = JobTable()  # Live jobs by their compact ids
+            self._job_generator = JobGenerator(self.logger, self._dir_tree, self._job_table, self.file_operations,
+                                               self.io_types, namespace=workload.get('namespace'),
+                                               file_populations=workload.get('file_populations'))
+            # Every worker advertises on connect how many outstanding jobs it can accept, and we won't assign more
+            # jobs than the worker's window, which follows its completion rate; this ensures reasonable memory usage,
+            # bounded queueing delay and less shuffling when a worker dies.
+            self._scheduler = WorkerScheduler()
+            self._windows_updated = timer()
+            self._files_compacted = timer()
+            # Results are applied to the DirTree in client timestamp order, as they were executed
+            self._reorder_buffer = ReorderBuffer()
+            # DirTree snapshots plus journal of results applied since, so test run can be resumed after a crash
+            self._checkpoint = Checkpoint(self.logger, self._dir_tree, checkpoint_path) if checkpoint_path else None
             # When/if a client disconnects we'll put any unfinished work in here,
             # get_next_job() will return work from here as well.
             self._work_to_requeue = []
-            self._incoming_message_queue = queue.Queue()
-            self._outgoing_message_queue = queue.Queue()
             self._csv_writer_queue = multiprocessing.Queue()
-            self.logger.info("Starting Collector service thread...")
-            collector = Collector(self.test_stats, self.dir_tree, self.stop_event, workers=self.client_workers,
-                                  in_queue=self._incoming_message_queue, out_queue=self._outgoing_message_queue)
-            collector_thread = Thread(target=collector.run)
-            collector_thread.start()
             self.logger.info("Starting CSV writer process...")
             # csv_writer = CSVWriter(self._csv_writer_queue, self.stop_event)
             # csv_writer = Process(target=csv_writer.run)
             # csv_writer.start()
-            self.logger.info("Starting Async Server....")
-            proxy_device_thread = AsyncControllerServer(self.logger, self.stop_event, self._incoming_message_queue,
-                                                        self._outgoing_message_queue)
-            proxy_device_thread.start()
+            self._start_server()
         except KeyboardInterrupt:
             stop_event.set()
         except Exception as e:
             self.logger.exception(e)
             stop_event.set()
 
+    def _start_collector(self, **kwargs):
+        self.logger.info("Starting Collector service thread...")
+        collector = Collector(self.test_stats, self.dir_tree, self.stop_event, jobs=self._job_table,
+                              scheduler=self._scheduler, job_generator=self._job_generator,
+                              reorder_buffer=self._reorder_buffer, **kwargs)
+        collector_thread = Thread(target=collector.run)
+        collector_thread.start()
+
+    def _start_server(self):
+        """
+        Threaded messaging engine: ZMQ proxy thread dealing client messages to incoming workers threads, which are
+        queueing them for the Controller, and outgoing workers threads sending out jobs queued by the Controller
+        """
+        self._incoming_message_queue = queue.Queue()
+        self._outgoing_message_queue = queue.Queue()
+        self._start_collector(in_queue=self._incoming_message_queue, out_queue=self._outgoing_message_queue)
+        self.logger.info("Starting Async Server....")
+        proxy_device_thread = AsyncControllerServer(self.logger, self.stop_event, self._incoming_message_queue,
+                                                    self._outgoing_message_queue)
+        proxy_device_thread.start()
+
     @property
     def dir_tree(self):
         return self._dir_tree
@@ -160,15 +180,11 @@ class Controller(object):
     @property
     def get_next_job(self):
         while True:
-            action = weighted_choice(self.file_operations)
-            io_type = weighted_choice(self.io_types)
             # if some client disconnected, messages assigned to him won't be lost
             if self._work_to_requeue:
                 yield self._work_to_requeue.pop()
-            request_data = request_action(action, self.logger, self._dir_tree, io_type=io_type)
-            if not request_data:
-                continue  # there is no data to send, retrying
-            yield Job({'action': action, 'data': request_data})
+            else:
+                yield self._job_generator.pop()
 
     def collect_message_stats(self, incoming_message):
         self.test_stats['total'] += 1
@@ -179,41 +195,76 @@ class Controller(object):
         """Return the id of the next worker available to process work. Note
         that this will return None if no clients are available.
         """
-        # It isn't strictly necessary since we're limiting the amount of work
-        # we assign, but just to demonstrate that we're doing our own load
-        # balancing we'll find the worker with the least work
-        if self.client_workers:
-            worker_id, work = sorted(self.client_workers.items(),
-                                     key=lambda x: len(x[1]))[0]
-            if len(work) < self.max_jobs_per_worker:
-                return worker_id
-        # No worker is available. Our caller will have to handle this.
-        return None
+        # We're doing our own load balancing: the scheduler keeps track of the worker with most free credits
+        return self._scheduler.next_worker()
+
+    def _update_windows(self):
+        now = timer()
+        if now - self._windows_updated >= WINDOW_UPDATE_INTERVAL:
+            self._scheduler.update_windows(now - self._windows_updated)
+            self._windows_updated = now
+
+    def _compact_files(self):
+        """Reclaims a batch of expired deleted files tombstones from the directory tree, see DirTree.compact_files()
+        """
+        now = timer()
+        if now - self._files_compacted >= TOMBSTONE_COMPACTION_INTERVAL:
+            self._dir_tree.compact_files()
+            self._files_compacted = now
+
+    def _wait_worker_message(self, timeout):
+        """Block until a worker message arrives (which might free some credits) or timeout expires. Jobs buffer is
+        topped up first, unless a message is already there
+        """
+        if self._incoming_message_queue.empty():
+            self._job_generator.fill()
+        try:
+            _, (worker_id, message) = self._incoming_message_queue.get(timeout=timeout)
+            self._handle_worker_message(worker_id, message)
+        except queue.Empty:
+            pass
+        self._release_results()
 
     def _handle_worker_message(self, worker_id, message):
         """Handle a message from the worker identified by worker_id.
 
-        {'message': 'connect'}
+        {'message': 'connect', 'credits': 256}
         {'message': 'disconnect'}
-        {'message': 'job_done', 'job_id': 'xxx', 'result': 'yyy'}
+        {'message': 'job_done', 'job_id': 1234, 'result': 'yyy'}
+
+        Batched 'jobs_done' messages are unpacked into single 'job_done' messages by incoming workers. Worker's credit
+        is released right away, while result itself goes through the reorder buffer, see _release_results()
         """
         if message['message'] == 'connect':
-            assert worker_id not in self.client_workers
-            self.client_workers[worker_id] = {}
-            self.logger.info(f'[{worker_id}]: connect')
+            assert worker_id not in self._scheduler
+            self._scheduler.add_worker(worker_id, message.get('credits', DYNAMO_MAX_CREDITS))
+            self._reorder_buffer.add_worker(worker_id, timer())
+            self.logger.info(f'[{worker_id}]: connect, {message.get("credits", DYNAMO_MAX_CREDITS)} credits')
         elif message['message'] == 'disconnect':
             # Remove the worker so no more work gets added, and put any
             # remaining work into _work_to_requeue
-            remaining_work = self.client_workers.pop(worker_id)
-            self._work_to_requeue.extend(remaining_work.values())
+            remaining_work = self._job_table.unassign_worker(worker_id)
+            self._scheduler.remove_worker(worker_id)
+            self._reorder_buffer.remove_worker(worker_id)
+            self._work_to_requeue.extend(remaining_work)
             self.logger.info(f'[{worker_id}]: disconnect, {len(remaining_work)} jobs re-queued')
         elif message['message'] == 'job_done':
             result = message['result']
-            job = self.client_workers[worker_id].pop(message['job_id'])
-            self._process_results(worker_id, job, result)
+            job = self._job_table.pop(message['job_id'], worker_id)
+            self._scheduler.job_done(worker_id)
+            self._reorder_buffer.push(worker_id, result['timestamp'], (worker_id, job, result), timer())
         else:
             raise Exception(f"Unknown message: {message['message']}")
 
+    def _release_results(self):
+        """Process results the reorder buffer is done holding back
+        """
+        for worker_id, job, result in self._reorder_buffer.pop_ready(timer(), self._is_worker_busy):
+            self._process_results(worker_id, job, result)
+
+    def _is_worker_busy(self, worker_id):
+        return worker_id in self._scheduler and self._scheduler.load(worker_id) > 0
+
     def _process_results(self, worker_id, job, incoming_message):
         """
         Result message format:
@@ -224,8 +275,15 @@ class Controller(object):
         formatted_message = helpers.message_to_pretty_string(incoming_message)
         self.logger.debug(f'[{worker_id}]: finished {job.id}, result: {formatted_message}')
         self.collect_message_stats(incoming_message)
+        if job.work['action'] in EXISTING_FILE_ACTIONS:
+            target_file = self._dir_tree.get_file_by_path(job.work['data']['target'])
+            if not target_file or not target_file.ondisk:
+                self.test_stats['dead_target']['total'] += 1
+                self.test_stats['dead_target'][job.work['action']] += 1
         self._csv_writer_queue.put((worker_id, incoming_message))
         response_action(self.logger, incoming_message, self.dir_tree)
+        if self._checkpoint:
+            self._checkpoint.record(job.work, incoming_message)
 
     def run(self):
         while not self.clients_ready_event.is_set():
@@ -234,6 +292,11 @@ class Controller(object):
 
         try:
             for job in self.get_next_job:
+                if job is None:
+                    if self.stop_event.is_set():
+                        break
+                    self._wait_worker_message(0.1)
+                    continue
                 next_worker_id = None
 
                 while next_worker_id is None:
@@ -244,17 +307,23 @@ class Controller(object):
                     while not self._incoming_message_queue.empty():
                         _, (worker_id, message) = self._incoming_message_queue.get()
                         self._handle_worker_message(worker_id, message)
+                    self._release_results()
+                    self._update_windows()
+                    self._compact_files()
+                    if self._checkpoint:
+                        self._checkpoint.tick(timer())
                     next_worker_id = self._get_next_worker_id()
-                    if not next_worker_id:
-                        time.sleep(0.1)
+                    if next_worker_id is None:
+                        self._wait_worker_message(0.1)
                 # We've got a Job and an available worker_id, all we need to do
                 # is send it. Note that we're now using send_multipart(), the
                 # counterpart to recv_multipart(), to tell the ROUTER where our
                 # message goes.
                 # self.logger.debug('sending job %s to worker %s', job.id,
                 #                   next_worker_id)
-                self.client_workers[next_worker_id][job.id] = job
-                self._outgoing_message_queue.put((next_worker_id, job.id, job.work))
+                self._job_table.assign(job, next_worker_id)
+                self._scheduler.job_assigned(next_worker_id)
+                self._outgoing_message_queue.put((next_worker_id, job))
                 # self.logger.info("Incoming Queue: {0} Outgoing Queue: {1}".format(
                 # self._incoming_message_queue.qsize(), self._outgoing_message_queue.qsize()))
                 if self.stop_event.is_set():
@@ -265,6 +334,8 @@ class Controller(object):
             self.logger.error(generic_error)
             raise generic_error
         finally:
+            if self._checkpoint:
+                self._checkpoint.close()
             self.stop_event.set()
 
 
@@ -278,8 +349,13 @@ class AsyncControllerServer(Thread, object):
         self._context = zmq.Context()
         self._frontend = self._context.socket(zmq.ROUTER)
         self._frontend.bind("tcp://*:{0}".format(CTRL_MSG_PORT))
+        # Client messages are dealt to incoming workers only. Outgoing workers push jobs through their own socket:
+        # had they been connected to the backend, they'd get their share of client messages and drop it.
         self._backend = self._context.socket(zmq.DEALER)
         self._backend.bind('inproc://backend')
+        self._outgoing = self._context.socket(zmq.PULL)
+        self._outgoing.bind('inproc://outgoing')
+        self._worker_codecs = {}  # worker_id -> codec negotiated on connect
 
     def run(self):
         self._logger.info(
@@ -288,16 +364,16 @@ class AsyncControllerServer(Thread, object):
             workers = []
             for _ in range(MAX_CONTROLLER_INCOMING_WORKERS):
                 worker = IncomingAsyncControllerWorker(self._logger, self._context, self._incoming_queue,
-                                                       self._stop_event)
+                                                       self._worker_codecs, self._stop_event)
                 workers.append(worker)
                 worker.start()
             for _ in range(MAX_CONTROLLER_OUTGOING_WORKERS):
                 worker = OutgoingAsyncControllerWorker(self._logger, self._context, self._outgoing_queue,
-                                                       self._stop_event)
+                                                       self._worker_codecs, self._stop_event)
                 workers.append(worker)
                 worker.start()
             self._logger.info("Starting Proxy Device...")
-            zmq.proxy(self._frontend, self._backend)
+            self._proxy()
         except zmq.ZMQError as zmq_error:
             self._logger.exception(zmq_error)
             self._stop_event.set()
@@ -310,18 +386,46 @@ class AsyncControllerServer(Thread, object):
             self._logger.info("Closing sockets...")
             self._context.close()
             self._backend.close()
+            self._outgoing.close()
             self._context.term()
 
+    def _proxy(self):
+        """
+        Forwards client messages to incoming workers and outgoing workers messages to clients
+        """
+        poller = zmq.Poller()
+        poller.register(self._frontend, zmq.POLLIN)
+        poller.register(self._outgoing, zmq.POLLIN)
+        while not self._stop_event.is_set():
+            events = dict(poller.poll(100))
+            if self._frontend in events:
+                self._forward(self._frontend, self._backend)
+            if self._outgoing in events:
+                self._forward(self._outgoing, self._frontend)
+
+    @staticmethod
+    def _forward(source, destination, max_messages=PROXY_MAX_MESSAGES_PER_POLL):
+        for _ in range(max_messages):
+            try:
+                message = source.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            destination.send_multipart(message)
+
 
 class AsyncControllerWorker(Thread, object):
-    def __init__(self, logger, context, stop_event):
+    socket_type = zmq.DEALER
+    endpoint = 'inproc://backend'
+
+    def __init__(self, logger, context, worker_codecs, stop_event):
         super(AsyncControllerWorker, self).__init__()
         self._logger = logger
         self._context = context
+        self._worker_codecs = worker_codecs
         self.stop_event = stop_event
         try:
-            self._worker = self._context.socket(zmq.DEALER)
-            self._worker.connect('inproc://backend')
+            self._worker = self._context.socket(self.socket_type)
+            self._worker.connect(self.endpoint)
         except zmq.ZMQError as zmq_error:
             self._logger.exception(zmq_error)
             self.stop_event.set()
@@ -329,8 +433,8 @@ class AsyncControllerWorker(Thread, object):
 
 
 class IncomingAsyncControllerWorker(AsyncControllerWorker, object):
-    def __init__(self, logger, context, incoming_queue, stop_event):
-        super().__init__(logger, context, stop_event)
+    def __init__(self, logger, context, incoming_queue, worker_codecs, stop_event):
+        super().__init__(logger, context, worker_codecs, stop_event)
         self.incoming_queue = incoming_queue
 
     def run(self):
@@ -338,15 +442,24 @@ class IncomingAsyncControllerWorker(AsyncControllerWorker, object):
         while not self.stop_event.is_set():
             try:
                 # self._logger.debug("Waiting Incoming job...")
-                worker_id, message = self._worker.recv_multipart()  # flags=zmq.NOBLOCK)
+                worker_id, codec_name, message = wire_codec.split_route(self._worker.recv_multipart())
                 # self._logger.debug(f"Incoming job received: {worker_id}")
-                message = json.loads(message.decode('utf8'))
+                message = wire_codec.get_codec(codec_name).decode(message)
+                if message['message'] == 'connect':
+                    self._worker_codecs[worker_id] = wire_codec.negotiate(message.get('codecs', []))
+                if message['message'] == 'jobs_done':
+                    # Batch of results: {'message': 'jobs_done', 'results': [[job_id, result], ...]}
+                    for job_id, result in message['results']:
+                        self.incoming_queue.put(
+                            (result['timestamp'], (worker_id, {'message': 'job_done', 'job_id': job_id,
+                                                               'result': result})))
+                    continue
                 if message['message'] == 'connect' or message['message'] == 'disconnect':
                     time_stamp = timestamp()
                 else:
                     time_stamp = message['result']['timestamp']
-                self.incoming_queue.put(
-                    (time_stamp, (worker_id, message)))  # Putting messages to queue by timestamp priority
+                # Results are put in timestamp order by the Controller's reorder buffer
+                self.incoming_queue.put((time_stamp, (worker_id, message)))
                 # self._logger.debug(f"Putting incoming job {worker_id} to queue")
             except zmq.ZMQError as zmq_error:
                 self._logger.exception("ZMQ Error {0}".format(zmq_error))
@@ -366,21 +479,46 @@ class IncomingAsyncControllerWorker(AsyncControllerWorker, object):
 
 
 class OutgoingAsyncControllerWorker(AsyncControllerWorker, object):
-    def __init__(self, logger, context, outgoing_queue, stop_event):
-        super().__init__(logger, context, stop_event)
+    socket_type = zmq.PUSH
+    endpoint = 'inproc://outgoing'
+
+    def __init__(self, logger, context, outgoing_queue, worker_codecs, stop_event):
+        super().__init__(logger, context, worker_codecs, stop_event)
         self.outgoing_queue = outgoing_queue
+        self._batches = {}  # worker_id -> (flush deadline, [job, ...])
+
+    def _send_batch(self, worker_id):
+        _, jobs = self._batches.pop(worker_id)
+        codec = self._worker_codecs.get(worker_id, wire_codec.DEFAULT_CODEC)
+        self._worker.send_multipart(wire_codec.route(worker_id) + [
+            codec.name.encode('utf8'), codec.encode_list([job.encode(codec) for job in jobs])])
+
+    def _flush_expired_batches(self, now):
+        for worker_id in [w for w, (deadline, _) in self._batches.items() if deadline <= now]:
+            self._send_batch(worker_id)
+
+    def _next_flush_timeout(self, now):
+        if not self._batches:
+            return JOB_BATCH_MAX_DELAY
+        return max(0, min(deadline for deadline, _ in self._batches.values()) - now)
 
     def run(self):
         self._logger.info("Async Controller: outgoing messages worker {0} started".format(self.name))
         while not self.stop_event.is_set():
             try:
-                #  Sending out messages from outgoing message queue
+                self._flush_expired_batches(timer())
+                #  Jobs are packed into per-worker batches, batch is sent once it's full or its delay expired
                 # self._logger.debug("Going to get outgoing job from queue...")
-                next_worker_id, job_id, job_work = self.outgoing_queue.get()
-                # self._logger.debug(f"Going to send outgoing job {job_id}")
-                self._worker.send_multipart(
-                    [next_worker_id, json.dumps((job_id, job_work)).encode('utf8')])
-                # self._logger.debug(f"Outgoing job {job_id} is sent")
+                next_worker_id, job = self.outgoing_queue.get(timeout=self._next_flush_timeout(timer()))
+                # self._logger.debug(f"Going to batch outgoing job {job.id}")
+                try:
+                    jobs = self._batches[next_worker_id][1]
+                except KeyError:
+                    jobs = []
+                    self._batches[next_worker_id] = (timer() + JOB_BATCH_MAX_DELAY, jobs)
+                jobs.append(job)
+                if len(jobs) >= JOB_BATCH_MAX_SIZE:
+                    self._send_batch(next_worker_id)
             except queue.Empty:
                 pass
             except zmq.ZMQError as zmq_error:
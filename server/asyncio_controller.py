@@ -0,0 +1,113 @@
+"""
+Asyncio based Controller engine: receive, scheduling, job generation and response processing on a single event loop
+2018 samuels (c)
+"""
+import asyncio
+import time
+
+import zmq
+import zmq.asyncio
+
+from config import CTRL_MSG_PORT, JOB_BATCH_MAX_SIZE
+from server.async_controller import Controller, timer
+from utils import wire_codec
+
+__author__ = 'samuels'
+
+MAX_MESSAGES_PER_POLL = 128  # Max client messages handled before we're going back to dispatching
+POLL_TIMEOUT = 100  # ms
+
+
+class AsyncioController(Controller):
+    """
+    Same Controller logic, but instead of ZMQ proxy thread, incoming and outgoing workers threads and queues between
+    them, a single ROUTER socket is served by an asyncio loop: client messages are decoded and handled as soon as
+    they're received, and jobs are dispatched against free credits right after, packed into one batch per worker.
+    """
+
+    def _start_server(self):
+        self._worker_codecs = {}  # worker_id -> codec negotiated on connect
+        self._batches = {}  # worker_id -> [job, ...] to be sent out at the end of dispatch round
+        self._start_collector()
+
+    def run(self):
+        while not self.clients_ready_event.is_set():
+            self.logger.info("Waiting for all clients to start...")
+            time.sleep(1)
+
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            self.stop_event.set()
+        except Exception as generic_error:
+            self.logger.exception(generic_error)
+            raise generic_error
+        finally:
+            if self._checkpoint:
+                self._checkpoint.close()
+            self.stop_event.set()
+
+    async def _serve(self):
+        self.logger.info("Starting asyncio Controller engine....")
+        context = zmq.asyncio.Context()
+        router = context.socket(zmq.ROUTER)
+        router.bind("tcp://*:{0}".format(CTRL_MSG_PORT))
+        jobs = self.get_next_job
+        try:
+            while not self.stop_event.is_set():
+                if await router.poll(POLL_TIMEOUT, zmq.POLLIN):
+                    await self._receive(router)
+                self._release_results()
+                self._update_windows()
+                self._compact_files()
+                if self._checkpoint:
+                    self._checkpoint.tick(timer())
+                self._dispatch(jobs)
+                await self._send_batches(router)
+                # Jobs buffer is topped up while there's nothing to receive
+                if not await router.poll(0, zmq.POLLIN):
+                    self._job_generator.fill()
+        finally:
+            self.logger.info("Closing sockets...")
+            router.close()
+            context.term()
+
+    async def _receive(self, router):
+        for _ in range(MAX_MESSAGES_PER_POLL):
+            try:
+                worker_id, codec_name, payload = wire_codec.split_route(await router.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                return
+            message = wire_codec.get_codec(codec_name).decode(payload)
+            if message['message'] == 'jobs_done':
+                for job_id, result in message['results']:
+                    self._handle_worker_message(worker_id, {'message': 'job_done', 'job_id': job_id, 'result': result})
+                continue
+            if message['message'] == 'connect':
+                self._worker_codecs[worker_id] = wire_codec.negotiate(message.get('codecs', []))
+            self._handle_worker_message(worker_id, message)
+
+    def _dispatch(self, jobs):
+        """
+        Assigns jobs to workers as long as any of them has a free credit
+        """
+        next_worker_id = self._get_next_worker_id()
+        while next_worker_id is not None and not self.stop_event.is_set():
+            job = next(jobs)
+            if job is None:
+                break
+            self._job_table.assign(job, next_worker_id)
+            self._scheduler.job_assigned(next_worker_id)
+            try:
+                self._batches[next_worker_id].append(job)
+            except KeyError:
+                self._batches[next_worker_id] = [job]
+            next_worker_id = self._get_next_worker_id()
+
+    async def _send_batches(self, router):
+        batches, self._batches = self._batches, {}
+        for worker_id, batch in batches.items():
+            codec = self._worker_codecs.get(worker_id, wire_codec.DEFAULT_CODEC)
+            for i in range(0, len(batch), JOB_BATCH_MAX_SIZE):
+                await router.send_multipart(wire_codec.route(worker_id) + [codec.name.encode('utf8'), codec.encode_list(
+                    [job.encode(codec) for job in batch[i:i + JOB_BATCH_MAX_SIZE]])])
@@ -0,0 +1,291 @@
+"""
+Controller's DirTree checkpoints: periodic snapshots plus journal of results applied since, so test run can be resumed
+2018 samuels (c)
+"""
+import gc
+import glob
+import json
+import os
+import pickle
+import shutil
+import threading
+
+from config import CHECKPOINT_PATH, CHECKPOINT_INTERVAL, CHECKPOINT_JOURNAL_FLUSH_INTERVAL
+from server.response_actions import response_action
+from tree.dirtree import split_target
+
+__author__ = 'samuels'
+
+SNAPSHOT_NAME = 'snapshot.{0}'
+JOURNAL_NAME = 'journal.{0}'
+RUN_ARGS_NAME = 'run.json'  # test run arguments, resumed run has to go against the same export
+
+
+class Checkpoint(object):
+    """
+    Generation N of a checkpoint is DirTree snapshot N, and journal N of (job, result) pairs applied to the DirTree
+    after the snapshot was taken. Snapshot is written by a forked child, from its copy-on-write copy of the Controller's
+    memory, so the dispatch loop only pays for fork() itself; meanwhile results go to the journal of the new generation.
+    Once snapshot N is complete, older generations are removed. If Controller dies while the child is still writing,
+    the previous snapshot and all journals since are still there, see load().
+
+    Controller's process is multi-threaded (ZMQ proxy and workers, Collector), and fork() copies the calling thread
+    only: a lock another thread held at that moment (logging handlers', ReorderBuffer's, ZMQ's) stays locked in the
+    child for good. So the child does nothing but pickle the DirTree and write it with plain file calls, no logging and
+    no sockets; garbage collector is disabled there, so no finalizer of parent's objects runs, and os._exit() skips
+    atexit handlers. DirTree itself is consistent in the child as long as fork() is done by the only thread which
+    changes it, the dispatch loop which created the Checkpoint, snapshot() refuses to fork from any other thread.
+
+    Results are journaled in batches: record() only buffers them, and they are pickled once per flush interval, so the
+    dispatch loop doesn't pay for a pickle.dump() and a write per result. Results of the last flush interval are lost
+    if the Controller dies, the same as unflushed journal writes would be.
+    """
+
+    def __init__(self, logger, dir_tree, path, interval=CHECKPOINT_INTERVAL,
+                 flush_interval=CHECKPOINT_JOURNAL_FLUSH_INTERVAL):
+        """
+        Args:
+            logger: logger
+            dir_tree: DirTree
+            path: str, checkpoint directory, generations numbering continues from ones which are already there
+            interval: float, seconds between snapshots
+            flush_interval: float, seconds between journal flushes
+        """
+        self.logger = logger
+        self._dir_tree = dir_tree
+        self.path = path
+        self.interval = interval
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+        self._generation = max(list_generations(path) or [0])
+        self._journal = None
+        self._records = []  # (job, result) pairs applied since the last flush
+        self._owner = threading.get_ident()  # dispatch loop's thread, the only one which changes the DirTree
+        self._snapshot_pid = None
+        self._snapshot_generation = None
+        self._snapshot_started = None
+        self._flushed = None
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def record(self, work, result):
+        """
+        Journals result which was just applied to the DirTree
+
+        Args:
+            work: dict, job which produced the result
+            result: dict
+        """
+        self._records.append((work, result))
+
+    def tick(self, now):
+        """
+        Called from the Controller's loop: flushes the journal, reaps finished snapshot writer and starts a new one when
+        it's time to
+
+        Args:
+            now: float, timer() time
+        """
+        if self._snapshot_pid is not None:
+            self._reap(os.WNOHANG)
+        if self._snapshot_started is None or \
+                (self._snapshot_pid is None and now - self._snapshot_started >= self.interval):
+            self.snapshot(now)
+        elif now - self._flushed >= self.flush_interval:
+            self._flush()
+            self._flushed = now
+
+    def snapshot(self, now):
+        """
+        Starts a new generation: switches to a new journal and forks a child which writes the snapshot. Results
+        buffered so far are in the snapshot, they go to the journal of the previous generation
+
+        Args:
+            now: float, timer() time
+        """
+        if threading.get_ident() != self._owner:
+            raise RuntimeError("Checkpoint snapshot has to be forked by the thread which changes the DirTree")
+        if self._journal:
+            self._flush()
+            self._journal.close()
+        self._generation += 1
+        self._journal = open(os.path.join(self.path, JOURNAL_NAME.format(self._generation)), 'wb')
+        self._snapshot_started = self._flushed = now
+        pid = os.fork()
+        if pid == 0:
+            # Child owns nothing but a copy of the DirTree, so it leaves without any cleanup of parent's resources
+            gc.disable()
+            exit_code = 1
+            try:
+                write_snapshot(self._dir_tree, self.path, self._generation)
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        self._snapshot_pid = pid
+        self._snapshot_generation = self._generation
+        self.logger.info(f"Checkpoint: writing snapshot {self._generation}, pid {pid}")
+
+    def close(self):
+        """
+        Flushes the journal and waits for the snapshot writer
+        """
+        if self._journal:
+            self._flush()
+            self._journal.close()
+        if self._snapshot_pid is not None:
+            self._reap(0)
+
+    def _flush(self):
+        if self._records:
+            pickle.dump(self._records, self._journal, pickle.HIGHEST_PROTOCOL)
+            self._records = []
+        self._journal.flush()
+
+    def _reap(self, options):
+        pid, status = os.waitpid(self._snapshot_pid, options)
+        if not pid:
+            return
+        self._snapshot_pid = None
+        if status:
+            self.logger.error(f"Checkpoint: snapshot {self._snapshot_generation} writer failed, status {status}")
+            return
+        for generation in list_generations(self.path):
+            if generation < self._snapshot_generation:
+                os.remove(os.path.join(self.path, SNAPSHOT_NAME.format(generation)))
+        for journal in glob.glob(os.path.join(self.path, JOURNAL_NAME.format('*'))):
+            if int(journal.rsplit('.', 1)[1]) < self._snapshot_generation:
+                os.remove(journal)
+        self.logger.info(f"Checkpoint: snapshot {self._snapshot_generation} is complete")
+
+
+def list_generations(path):
+    """
+    Args:
+        path: str, checkpoint directory
+
+    Returns: list, sorted generations which have a complete snapshot
+    """
+    snapshots = glob.glob(os.path.join(path, SNAPSHOT_NAME.format('*')))
+    return sorted(int(snapshot.rsplit('.', 1)[1]) for snapshot in snapshots if not snapshot.endswith('.tmp'))
+
+
+def write_snapshot(dir_tree, path, generation):
+    snapshot_path = os.path.join(path, SNAPSHOT_NAME.format(generation))
+    with open(snapshot_path + '.tmp', 'wb') as f:
+        pickle.dump(dir_tree, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(snapshot_path + '.tmp', snapshot_path)
+
+
+def last_update(path=CHECKPOINT_PATH):
+    """
+    Returns: float, modification time of the newest snapshot or journal, seconds since epoch: DirTree restored by
+             load() has results of all operations done before it, None if there's no checkpoint
+    """
+    files = glob.glob(os.path.join(path, SNAPSHOT_NAME.format('*'))) + \
+        glob.glob(os.path.join(path, JOURNAL_NAME.format('*')))
+    return max((os.path.getmtime(f) for f in files), default=None)
+
+
+def clear(path=CHECKPOINT_PATH):
+    """
+    Removes checkpoint of a previous test run
+    """
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def save_run_args(run_args, path=CHECKPOINT_PATH):
+    """
+    Args:
+        run_args: dict
+        path: str, checkpoint directory
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, RUN_ARGS_NAME), 'w') as f:
+        json.dump(run_args, f)
+
+
+def load_run_args(path=CHECKPOINT_PATH):
+    """
+    Returns: dict, arguments saved by save_run_args(), None if there are none
+    """
+    try:
+        with open(os.path.join(path, RUN_ARGS_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load(logger, path=CHECKPOINT_PATH, file_names=None):
+    """
+    Restores DirTree from the latest complete snapshot and replays journals of it and of later generations. Journal's
+    last batch of results might be cut short by a crash, it's dropped.
+
+    Args:
+        logger: logger
+        path: str, checkpoint directory
+        file_names: list, pre-generated file names, same as for DirTree()
+
+    Returns: DirTree; FileNotFoundError if there's no complete snapshot
+    """
+    generations = list_generations(path)
+    if not generations:
+        raise FileNotFoundError(f"No DirTree snapshot in {path}")
+    with open(os.path.join(path, SNAPSHOT_NAME.format(generations[-1])), 'rb') as f:
+        dir_tree = pickle.load(f)
+    dir_tree.set_file_names(file_names)
+    journals = sorted((int(journal.rsplit('.', 1)[1]), journal)
+                      for journal in glob.glob(os.path.join(path, JOURNAL_NAME.format('*'))))
+    replayed = 0
+    for generation, journal in journals:
+        if generation < generations[-1]:
+            continue
+        with open(journal, 'rb') as f:
+            while True:
+                try:
+                    records = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                for work, result in records:
+                    replay(logger, dir_tree, work, result)
+                replayed += len(records)
+    dir_tree.file_table.reset_mutations()
+    logger.info(f"Checkpoint: DirTree restored from snapshot {generations[-1]}, {replayed} results replayed")
+    return dir_tree
+
+
+def replay(logger, dir_tree, work, result):
+    """
+    Re-applies journaled result. DirTree changes which were done when the job was generated are redone first, unless
+    the snapshot has them already: new directory or file, and target file's tid. Target file's uuid is random once
+    touch is confirmed, it's restored from jobs which target the file
+
+    Args:
+        logger: logger
+        dir_tree: DirTree
+        work: dict
+        result: dict
+    """
+    data = work['data']
+    if work['action'] == 'mkdir':
+        if not dir_tree.get_dir_by_name(data['target']):
+            # Parent might have been removed from the tree since, as it got full
+            parent_path, name = split_target(data['target'])
+            dir_tree.append_node(name, dir_tree.get_dir_by_name(parent_path) if parent_path else None, parent_path)
+            dir_tree.get_random_dir_not_synced()
+    elif work['action'] == 'touch':
+        dir_name, file_name = split_target(data['target'])
+        touch_dir = dir_tree.get_dir_by_name(dir_name)
+        if touch_dir and not touch_dir.data.get_file_by_name(file_name):
+            touch_dir.data.touch(file_name)
+    elif 'tid' in data:
+        target_file = dir_tree.get_file_by_path(data['target'])
+        if target_file and target_file.tid < data['tid']:
+            target_file.tid = data['tid']
+            target_file.uuid = data['uuid']
+    if work['action'] == 'read' and result['result'] == 'success':
+        return  # successful reads don't change the model, they were verified as they came
+    response_action(logger, result, dir_tree)
@@ -15,10 +15,13 @@ class Collector:
         self.stop_event = stop_event
         self.dir_tree = dir_tree
         self.kwargs = kwargs
+        self._last_report = time.time()
+        self._last_dead_target_total = 0
 
     def run(self):
         time.sleep(60)
         while not self.stop_event.is_set():
+            now = time.time()
             self.logger.info("{0}".format("############################"))
             self.logger.info("{0}".format("#### Test Runtime Stats ####"))
             self.logger.info("{0}".format("############################"))
@@ -35,16 +38,48 @@ class Collector:
             for k, v in self.test_stats['failed'].items():
                 if k != 'total':
                     self.logger.info("{0}".format("{0}: {1}".format(k, v)))
+            if 'dead_target' in self.test_stats:
+                dead_target_total = self.test_stats['dead_target']['total']
+                self.logger.info("{0}".format("=== Operations on files known not to be on disk ==="))
+                self.logger.info("Total: {0} ({1:.1f} ops/sec)".format(
+                    dead_target_total, (dead_target_total - self._last_dead_target_total) / (now - self._last_report)))
+                for k, v in self.test_stats['dead_target'].items():
+                    if k != 'total':
+                        self.logger.info("{0}".format("{0}: {1}".format(k, v)))
+                self._last_dead_target_total = dead_target_total
+            self._last_report = now
             self.logger.info("{0}".format("############################"))
             self.logger.info("{0}".format("#### Dir Tree Stats     ####"))
             self.logger.info("{0}".format("############################"))
             self.logger.info("NIDs: {} SYNCED_DIRS: {}".format(len(self.dir_tree.nids),
                                                                len(self.dir_tree.synced_nodes)))
-            self.logger.info(f"Incoming messages queue: {self.kwargs.get('in_queue').qsize()}")
-            self.logger.info(f"Outgoing messages queue: {self.kwargs.get('out_queue').qsize()}")
-            self.logger.info(f"Total workers: {len(self.kwargs.get('workers', {}))}")
-            total_work = 0
-            for worker_id, work in self.kwargs.get('workers', {}).items():
-                total_work += len(work)
-            self.logger.info(f"Total work items: {total_work}")
+            files_metrics = self.dir_tree.files_metrics()
+            self.logger.info(f"Files: {files_metrics['live']} live, {files_metrics['dead']} dead (tombstones), "
+                             f"{files_metrics['compacted']} tombstones reclaimed")
+            self.logger.info(f"Files with names the files table didn't generate: {files_metrics['explicit_names']}")
+            if self.kwargs.get('in_queue'):
+                self.logger.info(f"Incoming messages queue: {self.kwargs.get('in_queue').qsize()}")
+            if self.kwargs.get('out_queue'):
+                self.logger.info(f"Outgoing messages queue: {self.kwargs.get('out_queue').qsize()}")
+            scheduler = self.kwargs.get('scheduler')
+            if scheduler is not None:
+                self.logger.info(f"Total workers: {len(scheduler)}")
+                self.logger.info(f"Total credits window: {scheduler.total_window}")
+            jobs = self.kwargs.get('jobs')
+            if jobs is not None:
+                self.logger.info(f"Total work items: {jobs.in_flight}")
+            reorder_buffer = self.kwargs.get('reorder_buffer')
+            if reorder_buffer is not None:
+                metrics = reorder_buffer.metrics()
+                self.logger.info(f"Reorder buffer: {metrics['buffered']} results held back, "
+                                 f"{metrics['released']} released, {metrics['forced']} forced, {metrics['late']} late, "
+                                 f"{metrics['unordered']} out of their worker's order")
+                self.logger.info(f"Reorder delay: avg {metrics['delay_avg'] * 1000:.1f} ms, "
+                                 f"max {metrics['delay_max'] * 1000:.1f} ms")
+            job_generator = self.kwargs.get('job_generator')
+            if job_generator is not None:
+                self.logger.info(f"Jobs buffered: {len(job_generator)}/{job_generator.capacity}")
+                self.logger.info("{0}".format("=== Wasted job generation attempts ==="))
+                for k, v in job_generator.wasted_attempts.items():
+                    self.logger.info("{0}".format("{0}: {1}".format(k, v)))
             time.sleep(60)
@@ -0,0 +1,220 @@
+"""
+Job generation stage of the Controller: keeps a bounded buffer of ready to send jobs ahead of demand
+2018 samuels (c)
+"""
+from collections import deque
+
+from config import JOB_BUFFER_SIZE, JOB_BUFFER_REFILL_SIZE, JOB_SLOT_BITS
+from server.request_actions import request_action
+from server.sampling import WeightedSampler
+from tree.dirtree import ALL_FILES, ONDISK_FILES, PENDING_FILES
+from utils import wire_codec
+
+__author__ = 'samuels'
+
+MAX_ATTEMPTS_PER_JOB = 4  # Generation attempts per requested job before fill() gives up for now
+
+
+class Job(object):
+    __slots__ = ('id', 'work', 'worker_id', '_codec', '_encoded')
+
+    def __init__(self, job_id, work):
+        self.id = job_id
+        self.work = work
+        self.worker_id = None  # worker the job is in flight on
+        self._codec = None
+        self._encoded = None  # (id, work) pair encoded by _codec
+
+    def encode(self, codec):
+        """
+        Args:
+            codec: wire codec class
+
+        Returns: bytes, (id, work) pair encoded by codec, only encoded again if codec differs from the last one
+        """
+        if codec is not self._codec:
+            self._encoded = codec.encode((self.id, self.work))
+            self._codec = codec
+        return self._encoded
+
+
+class JobTable(object):
+    """
+    Live jobs (buffered, in flight or waiting to be re-queued), stored in a list by slot. Job id is a 64 bit integer:
+    per Controller sequence number in high bits, job's slot in low `slot_bits` bits, so looking a job up by id is
+    a list index plus a check that the slot wasn't reused by a newer job since. Slots are reused LIFO, so the list
+    only grows up to the max number of live jobs.
+    """
+
+    def __init__(self, slot_bits=JOB_SLOT_BITS):
+        """
+        Args:
+            slot_bits: int
+        """
+        self._slot_bits = slot_bits
+        self._slot_mask = (1 << slot_bits) - 1
+        self._jobs = []  # slot -> Job or None
+        self._free_slots = []
+        self._sequence = 0
+        self.in_flight = 0
+
+    def __len__(self):
+        return len(self._jobs) - len(self._free_slots)
+
+    def new_job(self, work):
+        """
+        Args:
+            work: dict
+
+        Returns: Job
+        """
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._jobs)
+            if slot > self._slot_mask:
+                raise OverflowError(f"More than {self._slot_mask + 1} live jobs")
+            self._jobs.append(None)
+        self._sequence += 1
+        job = self._jobs[slot] = Job(self._sequence << self._slot_bits | slot, work)
+        return job
+
+    def assign(self, job, worker_id):
+        job.worker_id = worker_id
+        self.in_flight += 1
+
+    def pop(self, job_id, worker_id):
+        """
+        Args:
+            job_id: int
+            worker_id: bytes
+
+        Returns: Job, in flight on worker `worker_id`; KeyError if there's no such job
+        """
+        slot = job_id & self._slot_mask
+        try:
+            job = self._jobs[slot]
+        except IndexError:
+            job = None
+        if job is None or job.id != job_id or job.worker_id != worker_id:
+            raise KeyError(job_id)
+        self._jobs[slot] = None
+        self._free_slots.append(slot)
+        self.in_flight -= 1
+        return job
+
+    def unassign_worker(self, worker_id):
+        """
+        Takes all jobs in flight on worker back, they stay in the table to be sent again
+
+        Args:
+            worker_id: bytes
+
+        Returns: list of Job
+        """
+        jobs = [job for job in self._jobs if job is not None and job.worker_id == worker_id]
+        for job in jobs:
+            job.worker_id = None
+        self.in_flight -= len(jobs)
+        return jobs
+
+
+class JobGenerator(object):
+    """
+    Picks operations by workload weights and turns them into jobs against the DirTree. Jobs are generated into
+    a bounded FIFO buffer whenever the Controller has nothing better to do (waiting for client messages), already
+    encoded by the preferred wire codec, so dispatch only pops them and sends them out.
+
+    DirTree can't satisfy every operation at any time (no synced dirs yet, no files to read, etc.), these attempts
+    are counted per operation in `wasted_attempts`: a growing count means the workload mix doesn't fit the tree.
+    When none can be satisfied, pop() returns None rather than retrying: the tree only changes once the caller
+    processes pending results, so it has to get control back and try again later.
+
+    Generation runs on the Controller thread, same as results processing which updates the DirTree, so both see
+    consistent tree, while buffer size bounds how stale a buffered job can get.
+    """
+
+    def __init__(self, logger, dir_tree, job_table, file_operations, io_types, capacity=JOB_BUFFER_SIZE,
+                 codec=wire_codec.get_codec(wire_codec.supported_codecs()[0]), namespace=None, file_populations=None):
+        """
+        Args:
+            logger: Logger
+            dir_tree: DirTree
+            job_table: JobTable
+            file_operations: list of (operation, weight) tuples
+            io_types: list of (io type, weight) tuples
+            capacity: int
+            codec: wire codec class jobs are encoded by in advance
+            namespace: dict, workload's directory tree shape: 'dir_depths' {depth: weight} of new directories,
+                'fanout' max subdirectories of a directory, 'max_dirs' synced directories mkdir is held back at
+            file_populations: dict, operation -> {population: weight}, which files operation's target is drawn from
+                (ALL_FILES, ONDISK_FILES or PENDING_FILES); ONDISK_FILES for operations which aren't there
+        """
+        self.logger = logger
+        self._dir_tree = dir_tree
+        self._job_table = job_table
+        # Operations and io types are drawn in batches from alias tables built once, exactly by workload weights
+        self._next_action = WeightedSampler(file_operations)
+        self._next_io_type = WeightedSampler(io_types)
+        namespace = namespace or {}
+        self._request_kwargs = {key: namespace[key] for key in ('fanout', 'max_dirs') if key in namespace}
+        if 'dir_depths' in namespace:
+            self._request_kwargs['dir_depth'] = WeightedSampler(
+                [(int(depth), weight) for depth, weight in namespace['dir_depths'].items()])
+        self._action_kwargs = {}  # operation -> its own request kwargs, the shared ones plus its files population
+        for action, populations in (file_populations or {}).items():
+            unknown = set(populations) - {ALL_FILES, ONDISK_FILES, PENDING_FILES}
+            if unknown:
+                raise ValueError(f"Unknown files populations of {action}: {', '.join(sorted(unknown))}")
+            self._action_kwargs[action] = dict(self._request_kwargs,
+                                               population=WeightedSampler(list(populations.items())))
+        self.capacity = capacity
+        self.codec = codec
+        self._buffer = deque()
+        self.wasted_attempts = {action: 0 for action, _ in file_operations}
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def fill(self, max_jobs=None):
+        """
+        Generates jobs until buffer is full or `max_jobs` jobs were added. Gives up earlier if DirTree can't satisfy
+        too many attempts in a row, so the caller is never stuck here
+
+        Args:
+            max_jobs: int, buffer free space if None
+
+        Returns: int, number of jobs added
+        """
+        free = self.capacity - len(self._buffer)
+        max_jobs = free if max_jobs is None else min(max_jobs, free)
+        added = 0
+        for _ in range(max_jobs * MAX_ATTEMPTS_PER_JOB):
+            if added == max_jobs:
+                break
+            job = self._generate()
+            if job:
+                self._buffer.append(job)
+                added += 1
+        return added
+
+    def pop(self):
+        """
+        Returns: Job, the oldest buffered one; when buffer is empty, generates a few jobs first. None if DirTree can't
+        satisfy any operation until pending results are processed (e.g. no synced directories yet)
+        """
+        if not self._buffer and not self.fill(JOB_BUFFER_REFILL_SIZE):
+            return None
+        return self._buffer.popleft()
+
+    def _generate(self):
+        action = self._next_action()
+        io_type = self._next_io_type()
+        request_data = request_action(action, self.logger, self._dir_tree, io_type=io_type,
+                                      **self._action_kwargs.get(action, self._request_kwargs))
+        if not request_data:
+            self.wasted_attempts[action] += 1
+            return None
+        job = self._job_table.new_job({'action': action, 'data': request_data})
+        job.encode(self.codec)
+        return job
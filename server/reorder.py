@@ -0,0 +1,145 @@
+"""
+Reorder stage of the Controller: results are processed in client timestamp order
+2018 samuels (c)
+"""
+import heapq
+import itertools
+import threading
+
+from config import REORDER_BUFFER_SIZE, REORDER_MAX_DELAY, REORDER_RELEASE_INTERVAL
+
+__author__ = 'samuels'
+
+
+class ReorderBuffer(object):
+    """
+    Results from different client workers arrive through batching on clients and several receiving threads, so
+    they're out of timestamp order. Results are held in a heap by their timestamp, and released once every busy
+    client worker has reported a result with the same or later timestamp (watermark): each worker reports its results
+    in timestamp order (Dynamo executes its jobs one after another, AsyncDynamo queues its results sorted), so it
+    can't report anything older than its last result anymore. A result which is older than its worker's previous one
+    anyway doesn't move the watermark, it's counted as `unordered` rather than `late` when it's released.
+
+    Workers with no jobs in flight don't hold the watermark back, and neither do workers which haven't reported for
+    `max_delay` seconds. Results waiting longer than `max_delay` seconds, or beyond `capacity`, are released anyway
+    (forced release), so both latency and memory are bounded.
+
+    Timestamps are client's '%Y/%m/%d %H:%M:%S.%f' strings, they sort in time order as they are. Ordering across
+    clients is as good as clients' clock synchronisation.
+
+    The Collector thread reads metrics() while the Controller thread releases results, reorder delay statistics it
+    resets are guarded by a lock.
+    """
+
+    def __init__(self, capacity=REORDER_BUFFER_SIZE, max_delay=REORDER_MAX_DELAY,
+                 release_interval=REORDER_RELEASE_INTERVAL):
+        """
+        Args:
+            capacity: int
+            max_delay: float
+            release_interval: float
+        """
+        self.capacity = capacity
+        self.max_delay = max_delay
+        self.release_interval = release_interval
+        self._heap = []  # (timestamp, sequence number, receive time, in worker's order, item)
+        self._sequence = itertools.count()  # keeps results with equal timestamps in arrival order
+        self._watermarks = {}  # worker_id -> timestamp of the latest result
+        self._last_seen = {}  # worker_id -> receive time of the latest result
+        self._last_release = 0
+        self._last_released_timestamp = ''
+        self.released = 0
+        self.forced = 0  # results released before watermark passed them
+        self.late = 0  # results released after a result with later timestamp
+        self.unordered = 0  # results older than their worker's previous result
+        self._lock = threading.Lock()  # guards delay statistics, which metrics() resets
+        self._delay_total = 0
+        self._delay_count = 0
+        self._delay_max = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add_worker(self, worker_id, now):
+        self._watermarks[worker_id] = ''
+        self._last_seen[worker_id] = now
+
+    def remove_worker(self, worker_id):
+        del self._watermarks[worker_id]
+        del self._last_seen[worker_id]
+
+    def push(self, worker_id, time_stamp, item, now):
+        """
+        Args:
+            worker_id: bytes
+            time_stamp: str
+            item: result to be released
+            now: float
+        """
+        in_order = time_stamp >= self._watermarks[worker_id]
+        if in_order:
+            self._watermarks[worker_id] = time_stamp
+        else:
+            self.unordered += 1
+        self._last_seen[worker_id] = now
+        heapq.heappush(self._heap, (time_stamp, next(self._sequence), now, in_order, item))
+
+    def pop_ready(self, now, is_busy):
+        """
+        Watermark is computed over all workers, so it's only done once per `release_interval`, unless buffer is full
+
+        Args:
+            now: float
+            is_busy: callable, worker_id -> bool, whether worker has jobs in flight
+
+        Returns: list of items ready for processing, in timestamp order
+        """
+        heap = self._heap
+        if not heap or (len(heap) <= self.capacity and now - self._last_release < self.release_interval):
+            return []
+        self._last_release = now
+        watermark = self._watermark(now, is_busy)
+        ready = []
+        with self._lock:
+            while heap:
+                time_stamp, _, received, in_order, item = heap[0]
+                if watermark is not None and time_stamp > watermark:
+                    if len(heap) <= self.capacity and now - received < self.max_delay:
+                        break
+                    self.forced += 1
+                heapq.heappop(heap)
+                self._released(time_stamp, now - received, in_order)
+                ready.append(item)
+        return ready
+
+    def metrics(self):
+        """
+        Returns: dict, counters since start and reorder delay since previous call
+        """
+        with self._lock:
+            delay_avg = self._delay_total / self._delay_count if self._delay_count else 0
+            metrics = {'buffered': len(self._heap), 'released': self.released, 'forced': self.forced,
+                       'late': self.late, 'unordered': self.unordered, 'delay_avg': delay_avg,
+                       'delay_max': self._delay_max}
+            self._delay_total = self._delay_count = self._delay_max = 0
+        return metrics
+
+    def _watermark(self, now, is_busy):
+        """
+        Returns: str, oldest latest timestamp among busy workers, None if no worker holds results back
+        """
+        watermarks = [time_stamp for worker_id, time_stamp in self._watermarks.items()
+                      if now - self._last_seen[worker_id] < self.max_delay and is_busy(worker_id)]
+        return min(watermarks) if watermarks else None
+
+    def _released(self, time_stamp, delay, in_order):
+        if time_stamp < self._last_released_timestamp:
+            if in_order:
+                self.late += 1
+        else:
+            self._last_released_timestamp = time_stamp
+        self.released += 1
+        self._delay_total += delay
+        self._delay_count += 1
+        if delay > self._delay_max:
+            self._delay_max = delay
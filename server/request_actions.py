@@ -1,11 +1,16 @@
 import os
 
-from utils import shell_utils
+from config import MAX_ACTIVE_DIRS
+from tree.dirtree import ONDISK_FILES
 
 __author__ = "samuels"
 
 
 def request_action(action, logger, dir_tree, **kwargs):
+    """
+    Operations on existing files draw their target from the population kwargs['population']() names (see
+    Directory.get_random_file()), files on disk if there's no kwargs['population']
+    """
     return {
         "mkdir": mkdir_request,
         "list": list_request,
@@ -20,19 +25,33 @@ def request_action(action, logger, dir_tree, **kwargs):
     }[action](logger, dir_tree, **kwargs)
 
 
+def _population(kwargs):
+    return kwargs['population']() if 'population' in kwargs else ONDISK_FILES
+
+
 def mkdir_request(logger, dir_tree, **kwargs):
+    """
+    New directory's depth is drawn by kwargs['dir_depth'](), its parent is a random synced directory one level up
+    which has less than kwargs['fanout'] subdirectories. There's no request if there's no such directory yet, so tree
+    follows the depth distribution, rather than growing shallow until deeper levels get their parents
+    """
     data = {}
     target = 'None'
-    if len(dir_tree.synced_nodes) > 10 or len(dir_tree.nids) > 10:
+    # Directories which mkdir is in flight for are counted as well, jobs are generated well ahead of results
+    if dir_tree.get_size() > kwargs.get('max_dirs', MAX_ACTIVE_DIRS) or len(dir_tree.nids) > 10:
         return None
     logger.debug(f"DEBUG NIDS: dir_tree.nids")
     logger.debug(f"DEBUG SYNCED_DIRS: {dir_tree.synced_nodes}")
-    dir_tree.append_node()
+    depth = kwargs['dir_depth']() if 'dir_depth' in kwargs else 1
+    parent = dir_tree.get_random_parent(depth - 1, kwargs.get('fanout'))
+    if not parent:
+        return None
+    dir_tree.append_node(parent=parent)
     logger.debug(
         f"Controller: New dir appended to list {dir_tree.get_last_node_tag()}")
     target_dir = dir_tree.get_random_dir_not_synced()
     if target_dir:
-        target = target_dir.data.name
+        target = target_dir.data.path
         logger.debug(
             f"Controller: Dir {target} current size is {dir_tree.get_last_node_data().size}")
     data['target'] = target
@@ -44,7 +63,7 @@ def list_request(logger, dir_tree, **kwargs):
     rdir = dir_tree.get_random_dir_synced()
     if not rdir:
         return None
-    target = rdir.data.name
+    target = rdir.tag
     data['target'] = "/".join(['', target])
     return data
 
@@ -54,7 +73,7 @@ def delete_request(logger, dir_tree, **kwargs):
     rdir = dir_tree.get_random_dir_synced()
     if not rdir:
         return None
-    file_to_delete = rdir.data.get_random_file()
+    file_to_delete = rdir.data.get_random_file(_population(kwargs))
     if not file_to_delete:
         return None
     fname = file_to_delete.name
@@ -83,7 +102,7 @@ def stat_request(logger, dir_tree, **kwargs):
     rdir = dir_tree.get_random_dir_synced()
     if not rdir:
         return None
-    rfile = rdir.data.get_random_file()
+    rfile = rdir.data.get_random_file(_population(kwargs))
     if not rfile:
         return None
     fname = rfile.name
@@ -101,7 +120,7 @@ def read_request(logger, dir_tree, **kwargs):
     rdir = dir_tree.get_random_dir_synced()
     if not rdir:
         return None
-    rfile = rdir.data.get_random_file()
+    rfile = rdir.data.get_random_file(_population(kwargs))
     if not rfile:
         return None
     fname = rfile.name
@@ -109,10 +128,7 @@ def read_request(logger, dir_tree, **kwargs):
     rfile.tid += 1
     data['tid'] = rfile.tid
     data['target'] = target
-    data['data_pattern'] = rfile.data_pattern
-    data['repeats'] = rfile.data_pattern_len
-    data['hash'] = rfile.data_pattern_hash
-    data['offset'] = rfile.data_pattern_offset
+    data['offset'], data['chunk_size'], data['write_tid'] = rfile.start_read()
     data['uuid'] = rfile.uuid
     return data
 
@@ -122,12 +138,13 @@ def write_request(logger, dir_tree, **kwargs):
     wdir = dir_tree.get_random_dir_synced()
     if not wdir:
         return None
-    wfile = wdir.data.get_random_file()
+    wfile = wdir.data.get_random_file(_population(kwargs))
     if not wfile:
         return None
     fname = wfile.name
     target = "/".join(['', wdir.tag, fname])
     wfile.tid += 1
+    wfile.start_mutation()
     data['tid'] = wfile.tid
     data['target'] = target
     data['offset'] = wfile.data_pattern_offset
@@ -142,7 +159,7 @@ def rename_request(logger, dir_tree, **kwargs):
     rdir = dir_tree.get_random_dir_synced()
     if not rdir:
         return None
-    file_to_rename = rdir.data.get_random_file()
+    file_to_rename = rdir.data.get_random_file(_population(kwargs))
     if not file_to_rename:
         return None
     fname = file_to_rename.name
@@ -152,7 +169,7 @@ def rename_request(logger, dir_tree, **kwargs):
     data['tid'] = file_to_rename.tid
     data['target'] = target
     data['uuid'] = uuid
-    data['rename_dest'] = shell_utils.StringUtils.get_random_string_nospec(64)
+    data['rename_dest'] = next(dir_tree.rename_names)
     return data
 
 
@@ -162,8 +179,8 @@ def rename_exist_request(logger, dir_tree, **kwargs):
     rdir_dst = dir_tree.get_random_dir_synced()
     if not rdir_src or not rdir_dst:
         return None
-    src_file_to_rename = rdir_src.data.get_random_file()
-    dst_file = rdir_src.data.get_random_file()
+    src_file_to_rename = rdir_src.data.get_random_file(_population(kwargs))
+    dst_file = rdir_dst.data.get_random_file(ONDISK_FILES)  # destination exists, whatever source's population is
     if not src_file_to_rename or not dst_file:
         return None
     src_fname = src_file_to_rename.name
@@ -184,13 +201,14 @@ def truncate_request(logger, dir_tree, **kwargs):
     tdir = dir_tree.get_random_dir_synced()
     if not tdir:
         return None
-    file_to_truncate = tdir.data.get_random_file()
+    file_to_truncate = tdir.data.get_random_file(_population(kwargs))
     if not file_to_truncate:
         return None
     fname = file_to_truncate.name
     target = "/".join(['', tdir.tag, fname])
     uuid = file_to_truncate.uuid
     file_to_truncate.tid += 1
+    file_to_truncate.start_mutation()
     data['tid'] = file_to_truncate.tid
     data['target'] = target
     data['uuid'] = uuid
@@ -3,14 +3,11 @@ import os
 import datetime
 import logging
 
-import xxhash
-
 import errno
 import uuid
 
-from treelib.tree import NodeIDAbsentError
-
-from config import error_codes, MAX_FILES_PER_DIR
+from config import error_codes, MAX_FILES_PER_DIR, TOUCH_FILE_SIZE
+from tree.dirtree import split_target
 
 __author__ = "samuels"
 
@@ -25,20 +22,21 @@ def generic_error_handler(logger, incoming_message):
     Returns:
 
     """
-    rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-    try:
-        rfile_name = incoming_message['target'].split('/')[4]
-    except IndexError:
+    mount_point = incoming_message.get('mount_point', '')
+    if incoming_message['action'] in ('mkdir', 'list'):
         logger.error(
-            'Operation {0} FAILED UNEXPECTEDLY on Directory {1} due to {2}'.format(
+            'Operation {0} FAILED UNEXPECTEDLY on Directory {1}/{2} due to {3}'.format(
                 incoming_message['action'],
-                rdir_name,
+                mount_point,
+                incoming_message['target'].lstrip('/'),
                 incoming_message[
                     'error_message']))
     else:
+        rdir_name, rfile_name = split_target(incoming_message['target'])
         logger.error(
-            'Operation {0} FAILED UNEXPECTEDLY on File {1}/{2} due to {3}'.format(
+            'Operation {0} FAILED UNEXPECTEDLY on File {1}/{2}/{3} due to {4}'.format(
                 incoming_message['action'],
+                mount_point,
                 rdir_name,
                 rfile_name,
                 incoming_message[
@@ -67,6 +65,19 @@ def response_action(logger, incoming_message, dir_tree):
         failed_response_actions(incoming_message['action'])(logger, incoming_message, dir_tree)
 
 
+def end_mutation(dir_tree, target):
+    """
+    Result of a write or truncate came, whatever it is, see FileTable.settled()
+
+    Args:
+        dir_tree: DirTree
+        target: str, '/dir/file'
+    """
+    target_file = dir_tree.get_file_by_path(target)
+    if target_file:
+        target_file.end_mutation()
+
+
 def success_response_actions(action):
     """
 
@@ -96,8 +107,7 @@ def mkdir_success(logger, incoming_message, dir_tree):
     syncdir.data.ondisk = True
     syncdir.creation_time = datetime.datetime.strptime(incoming_message['timestamp'],
                                                        '%Y/%m/%d %H:%M:%S.%f')
-    dir_hash = xxhash.xxh64(syncdir.data.name).hexdigest()
-    dir_tree.synced_nodes[dir_hash] = syncdir.data.name
+    dir_tree.mark_synced(syncdir)
     logger.debug(
         f"Directory {syncdir.data.name} was created at: {syncdir.creation_time}")
     logger.debug(
@@ -106,9 +116,8 @@ def mkdir_success(logger, incoming_message, dir_tree):
 
 def touch_success(logger, incoming_message, dir_tree):
     logger.debug(f"Successful touch arrived incoming_message['target']")
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    path = split_target(incoming_message['target'])  # folder:file
     syncdir = dir_tree.get_dir_by_name(path[0])
-    dir_index = xxhash.xxh64(path[0]).hexdigest()
     if not syncdir:
         logger.debug(
             f"Directory {path[0]} already removed from active dirs list, dropping touch {path[1]}")
@@ -117,10 +126,15 @@ def touch_success(logger, incoming_message, dir_tree):
     # So we won't check here if dir is already synced
 
     f = syncdir.data.get_file_by_name(path[1])
+    if f is None or not (f.pending or f.ondisk):
+        # A delete or rename of the pending file got in between creation and this result
+        logger.debug(f"File {path[0]}/{path[1]} went off disk before its touch result arrived")
+        return
     #  Now, when we got reply from client that file was created,
     #  we can mark it as synced
     syncdir.data.size += 1
-    f.ondisk = True
+    syncdir.data.mark_ondisk(f)
+    f.size = TOUCH_FILE_SIZE
     f.creation_time = datetime.datetime.strptime(incoming_message['timestamp'],
                                                  '%Y/%m/%d %H:%M:%S.%f')
     f.uuid = uuid.uuid4().hex[-5:]  # Unique session ID, will be modified on each file modify action
@@ -129,14 +143,11 @@ def touch_success(logger, incoming_message, dir_tree):
     logger.debug(
         f"File {path[0]}/{path[1]} is synced. Directory size updated to {syncdir.data.size} bytes")
     if syncdir.data.size > MAX_FILES_PER_DIR:
-        try:
-            logger.debug(f"Directory {path[0]} going to be removed from dir tree")
-            dir_tree.remove_dir_by_name(path[0])
-            del dir_tree.synced_nodes[dir_index]
-            del dir_tree.nids[dir_index]
+        logger.debug(f"Directory {path[0]} going to be removed from dir tree")
+        if dir_tree.remove_dir_by_name(path[0]):
             logger.debug(
                 f"Directory {path[0]} is reached its size limit and removed from active dirs list")
-        except (NodeIDAbsentError, KeyError):
+        else:
             logger.debug(
                 f"Directory {path[0]} already removed from active dirs list, skipping....")
 
@@ -150,7 +161,8 @@ def stat_success(logger, incoming_message, dir_tree):
 
 
 def truncate_success(logger, incoming_message, dir_tree):
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    end_mutation(dir_tree, incoming_message['target'])
+    path = split_target(incoming_message['target'])  # folder:file
     writedir = dir_tree.get_dir_by_name(path[0])
     if not writedir:
         logger.debug(
@@ -161,14 +173,7 @@ def truncate_success(logger, incoming_message, dir_tree):
             wfile = writedir.data.get_file_by_name(path[1])
             if wfile and wfile.ondisk:
                 logger.debug(f"File {path[0]}/{path[1]} is found, truncating")
-                wfile.modify_time = datetime.datetime.strptime(incoming_message['timestamp'],
-                                                               '%Y/%m/%d %H:%M:%S.%f')
-                wfile.size = incoming_message['data']['size']
-                # recalculating the offset after truncate:
-                if wfile.data_pattern_offset + wfile.data_pattern_len >= wfile.size:
-                    wfile.data_pattern_offset = wfile.size
-                    wfile.data_pattern_hash = 'ef46db3751d8e999'
-                    wfile.data_pattern_len = 0
+                wfile.record_truncate(incoming_message['data']['size'])
                 logger.debug(f"Truncating file {path[0]}/{path[1]} to {wfile.size} bytes")
             else:
                 logger.debug(f"File {path[0]}/{path[1]} is not on disk, nothing to update")
@@ -177,7 +182,7 @@ def truncate_success(logger, incoming_message, dir_tree):
 
 
 def read_success(logger, incoming_message, dir_tree):
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    path = split_target(incoming_message['target'])  # folder:file
     readdir = dir_tree.get_dir_by_name(path[0])
     if not readdir:
         logger.debug(
@@ -187,14 +192,20 @@ def read_success(logger, incoming_message, dir_tree):
         if readdir.data.ondisk:
             rfile = readdir.data.get_file_by_name(path[1])
             if rfile and rfile.ondisk:
-                read_time = datetime.datetime.strptime(incoming_message['timestamp'], '%Y/%m/%d %H:%M:%S.%f')
-                if rfile.data_pattern_hash != incoming_message['data']['hash'] and read_time < rfile.modify_time:
+                # Client verified the blocks it read, and reported bad ones only
+                data = incoming_message['data']
+                if not data.get('bad_blocks'):
+                    logger.debug(f"Read of file {path[0]}/{path[1]} at {data['offset']} verified by client")
+                elif not rfile.settled(data['tid']):
+                    logger.debug(f"File {path[0]}/{path[1]} was written or truncated during read, "
+                                 f"{data['bad_blocks']} bad blocks ignored")
+                else:
                     logger.error(
-                        f"Hash mismatch on Read! File {rfile.name} - "
-                        f"stored hash: {rfile.data_pattern_hash} "
-                        f"incoming hash: {incoming_message['data']['hash']} "
-                        f"offset: {incoming_message['data']['offset']} "
-                        f"chunk size: {incoming_message['data']['chunk_size']} ")
+                        f"Block verify FAILED on Read! File {path[0]}/{path[1]} - "
+                        f"offset: {data['offset']} "
+                        f"chunk size: {data['chunk_size']} "
+                        f"bad blocks: {data['bad_blocks']} "
+                        f"first bad blocks: {data['block_errors']}")
             else:
                 logger.debug(f"File {path[0]}/{path[1]} is not on disk, nothing to update")
         else:
@@ -202,7 +213,8 @@ def read_success(logger, incoming_message, dir_tree):
 
 
 def write_success(logger, incoming_message, dir_tree):
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    end_mutation(dir_tree, incoming_message['target'])
+    path = split_target(incoming_message['target'])  # folder:file
     writedir = dir_tree.get_dir_by_name(path[0])
     if not writedir:
         logger.debug(
@@ -213,31 +225,18 @@ def write_success(logger, incoming_message, dir_tree):
             wfile = writedir.data.get_file_by_name(path[1])
             if wfile and wfile.ondisk:
                 logger.debug(f"File {path[0]}/{path[1]} is found, writing")
-                wfile.ondisk = True
-                wfile.modify_time = datetime.datetime.strptime(incoming_message['timestamp'],
-                                                               '%Y/%m/%d %H:%M:%S.%f')
-                wfile.data_pattern = incoming_message['data']['data_pattern']
-                wfile.data_pattern_len = incoming_message['data']['chunk_size']
-                wfile.data_pattern_hash = incoming_message['data']['hash']
-                wfile.data_pattern_offset = incoming_message['data']['offset']
-                # recalculating file size
-                if wfile.size < wfile.data_pattern_offset + wfile.data_pattern_len:
-                    wfile.size = wfile.data_pattern_offset + wfile.data_pattern_len
+                writedir.data.mark_ondisk(wfile)
+                wfile.record_write(incoming_message['data']['offset'], incoming_message['data']['chunk_size'],
+                                   incoming_message['data']['pattern_id'], incoming_message['data']['tid'])
                 logger.debug(f"Write to file {path[0]}/{path[1]} at {wfile.data_pattern_offset}")
             # In case there is raise and write arrived before touch we'll sync the file here
-            elif wfile:
+            elif wfile and wfile.pending:
                 logger.debug(f"File {path[0]}/{path[1]} Write OP arrived before touch, syncing...")
-                wfile.ondisk = True
-                wfile.data_pattern = incoming_message['data']['data_pattern']
-                wfile.data_pattern_len = incoming_message['data']['chunk_size']
-                wfile.data_pattern_hash = incoming_message['data']['hash']
-                wfile.data_pattern_offset = incoming_message['data']['offset']
+                writedir.data.mark_ondisk(wfile)
+                wfile.record_write(incoming_message['data']['offset'], incoming_message['data']['chunk_size'],
+                                   incoming_message['data']['pattern_id'], incoming_message['data']['tid'])
                 wfile.creation_time = datetime.datetime.strptime(incoming_message['timestamp'],
                                                                  '%Y/%m/%d %H:%M:%S.%f')
-                wfile.modify_time = wfile.creation_time
-                # recalculating file size
-                if wfile.size < wfile.data_pattern_offset + wfile.data_pattern_len:
-                    wfile.size = wfile.data_pattern_offset + wfile.data_pattern_len
                 logger.debug(f"Write to file {path[0]}/{path[1]} at {wfile.data_pattern_offset}")
             else:
                 logger.debug(f"File {path[0]}/{path[1]} is not on disk, nothing to update")
@@ -246,7 +245,7 @@ def write_success(logger, incoming_message, dir_tree):
 
 
 def delete_success(logger, incoming_message, dir_tree):
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    path = split_target(incoming_message['target'])  # folder:file
     deldir = dir_tree.get_dir_by_name(path[0])
     if not deldir:
         logger.debug(
@@ -255,9 +254,10 @@ def delete_success(logger, incoming_message, dir_tree):
         logger.debug(f"Directory exists {deldir.data.name}, going to delete {path[1]}")
         if deldir.data.ondisk:
             rfile = deldir.data.get_file_by_name(path[1])
-            if rfile and rfile.ondisk:
+            # Pending file was created already, even if its touch result didn't arrive yet
+            if rfile and (rfile.ondisk or rfile.pending):
                 logger.debug(f"File {path[0]}/{path[1]} is found, removing")
-                rfile.ondisk = False
+                deldir.data.mark_not_ondisk(rfile)
                 logger.debug(f"File {path[0]}/{path[1]} is removed form disk")
             else:
                 logger.debug(f"File {path[0]}/{path[1]} is not on disk, nothing to update")
@@ -266,7 +266,7 @@ def delete_success(logger, incoming_message, dir_tree):
 
 
 def rename_success(logger, incoming_message, dir_tree):
-    path = incoming_message['target'].split('/')[1:]  # folder:file
+    path = split_target(incoming_message['target'])  # folder:file
     rename_dir = dir_tree.get_dir_by_name(path[0])
     if not rename_dir:
         logger.debug(
@@ -279,7 +279,7 @@ def rename_success(logger, incoming_message, dir_tree):
         if rfile:
             logger.debug(f"File {path[0]}/{path[1]} is found, renaming")
             rfile = rename_dir.data.rename_file(rfile.name, incoming_message['data']['rename_dest'])
-            rfile.ondisk = True
+            rename_dir.data.mark_ondisk(rfile)
             rfile.creation_time = datetime.datetime.strptime(incoming_message['timestamp'],
                                                              '%Y/%m/%d %H:%M:%S.%f')
             logger.debug(f"File {path[0]}/{path[1]} is renamed to {rfile.name}")
@@ -291,8 +291,8 @@ def rename_success(logger, incoming_message, dir_tree):
 
 
 def rename_exist_success(logger, incoming_message, dir_tree):
-    src_path = incoming_message['data']['rename_source'].split('/')[1:]  # folder:file
-    dst_path = incoming_message['data']['rename_dest'].split('/')[1:]  # folder:file
+    src_path = split_target(incoming_message['data']['rename_source'])  # folder:file
+    dst_path = split_target(incoming_message['data']['rename_dest'])  # folder:file
     src_rename_dir = dir_tree.get_dir_by_name(src_path[0])
     dst_rename_dir = dir_tree.get_dir_by_name(dst_path[0])
     if not src_rename_dir:
@@ -302,11 +302,12 @@ def rename_exist_success(logger, incoming_message, dir_tree):
     logger.debug(
         f"Directory exists {src_path[0]}, going to delete renamed file {src_path[1]} from directory")
     #  Firs we delete the source file
+    file_to_delete = None
     if src_rename_dir.data.ondisk:
         file_to_delete = src_rename_dir.data.get_file_by_name(src_path[1])
         if file_to_delete and file_to_delete.ondisk:
             logger.debug(f"File {src_path[0]}/{src_path[1]} is found, removing")
-            file_to_delete.ondisk = False
+            src_rename_dir.data.mark_not_ondisk(file_to_delete)
             logger.debug(f"File {src_path[0]}/{src_path[1]} is removed form disk")
         else:
             logger.debug(f"File {src_path[0]}/{src_path[1]} is not on disk, nothing to update")
@@ -325,8 +326,8 @@ def rename_exist_success(logger, incoming_message, dir_tree):
         file_to_rename = dst_rename_dir.data.get_file_by_name(dst_path[1])
         if file_to_rename:
             logger.debug(f"File {dst_path[0]}/{dst_path[1]} is found, renaming")
-            file_to_rename = dst_rename_dir.data.rename_file(file_to_rename.name, dst_path[1])
-            file_to_rename.ondisk = True
+            file_to_rename = dst_rename_dir.data.rename_file(file_to_rename.name, dst_path[1], file_to_delete)
+            dst_rename_dir.data.mark_ondisk(file_to_rename)
             file_to_rename.creation_time = datetime.datetime.strptime(incoming_message['timestamp'],
                                                                       '%Y/%m/%d %H:%M:%S.%f')
             logger.debug(f"File {src_path[0]}/{src_path[1]} is renamed to {dst_path[1]}")
@@ -364,8 +365,7 @@ def touch_fail(logger, incoming_message, dir_tree):
     if incoming_message['error_code'] == error_codes.MAX_DIR_SIZE:
         pass
     elif incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir and rdir.data.ondisk:
             error_time = datetime.datetime.strptime(incoming_message['timestamp'], '%Y/%m/%d %H:%M:%S.%f')
@@ -393,8 +393,7 @@ def stat_fail(logger, incoming_message, dir_tree):
             incoming_message['error_code'] == errno.ESTALE:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -405,7 +404,7 @@ def stat_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         f"Result Verify FAILED: Operation {incoming_message['action']} "
                         f"failed on file {rdir_name}{os.path.sep}{rfile_name} which is on disk. Invalidating")
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug(f"Result verify OK: File {rfile_name} is not on disk")
         else:
@@ -415,12 +414,12 @@ def stat_fail(logger, incoming_message, dir_tree):
 
 
 def truncate_fail(logger, incoming_message, dir_tree):
+    end_mutation(dir_tree, incoming_message['target'])
     if incoming_message['error_code'] == error_codes.NO_TARGET or incoming_message['error_code'] == errno.EEXIST or \
             incoming_message['error_code'] == errno.ESTALE or incoming_message['error_code'] == errno.EAGAIN:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -431,7 +430,7 @@ def truncate_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         f"Result Verify FAILED: Operation {incoming_message['action']} "
                         f"failed on file {rdir_name}{os.path.sep}{rfile_name} which is on disk. Invalidating")
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug(f"Result verify OK: File {rfile_name} is not on disk")
         else:
@@ -446,8 +445,7 @@ def read_fail(logger, incoming_message, dir_tree):
             incoming_message['error_code'] == errno.ESTALE:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -458,7 +456,7 @@ def read_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         "Result Verify FAILED: Operation {0} failed on file {1} which is on disk. Invalidating".format(
                             incoming_message['action'], rdir_name + "/" + rfile_name))
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug('Result verify OK: File {0} is not on disk'.format(rfile_name))
         else:
@@ -468,13 +466,13 @@ def read_fail(logger, incoming_message, dir_tree):
 
 
 def write_fail(logger, incoming_message, dir_tree):
+    end_mutation(dir_tree, incoming_message['target'])
     if incoming_message['error_code'] == error_codes.NO_TARGET or incoming_message['error_code'] == errno.EEXIST or \
             incoming_message['error_code'] == errno.ESTALE or incoming_message['error_code'] == errno.EAGAIN:
         return
 
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -485,7 +483,7 @@ def write_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         "Result Verify FAILED: Operation {0} failed on file {1} which is on disk. Invalidating".format(
                             incoming_message['action'], rdir_name + "/" + rfile_name))
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug('Result verify OK: File {0} is not on disk'.format(rfile_name))
         else:
@@ -499,8 +497,7 @@ def delete_fail(logger, incoming_message, dir_tree):
             incoming_message['error_code'] == errno.ESTALE:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -511,7 +508,7 @@ def delete_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         "Result Verify FAILED: Operation {0} failed on file {1} which is on disk. Invalidating".format(
                             incoming_message['action'], rdir_name + "/" + rfile_name))
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug('Result verify OK: File {0} is not on disk'.format(rfile_name))
         else:
@@ -525,8 +522,7 @@ def rename_fail(logger, incoming_message, dir_tree):
             incoming_message['error_code'] == errno.ESTALE:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -537,7 +533,7 @@ def rename_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         f"Result Verify FAILED: Operation {incoming_message['action']} "
                         f"failed on file {rdir_name}{os.path.sep}{rfile_name} which is on disk. Invalidating")
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug(f"Result verify OK: File {rfile_name} is not on disk")
         else:
@@ -553,8 +549,7 @@ def rename_exist_fail(logger, incoming_message, dir_tree):
     if incoming_message['error_code'] == error_codes.SAMEFILE:
         return
     if incoming_message['error_code'] == errno.ENOENT:
-        rdir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        rfile_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        rdir_name, rfile_name = split_target(incoming_message['target'])  # get target folder and file names
 
         rdir = dir_tree.get_dir_by_name(rdir_name)
         if rdir:
@@ -565,7 +560,7 @@ def rename_exist_fail(logger, incoming_message, dir_tree):
                     logger.error(
                         f"Result Verify FAILED: Operation {incoming_message['action']} "
                         f"failed on file {rdir_name}{os.path.sep}{rfile_name} which is on disk. Invalidating")
-                    rfile.ondisk = False
+                    rdir.data.mark_not_ondisk(rfile)
             else:
                 logger.debug(f"Result verify OK: File {rfile_name} is not on disk")
         else:
@@ -592,8 +587,7 @@ def handle_noent(dir_name, file_name, incoming_tid, timestamp, dir_tree):
 
 def method_fail(logger, incoming_message, dir_tree):
     if incoming_message['error_code'] == errno.ENOENT:
-        dir_name = incoming_message['target'].split('/')[3]  # get target folder name from path
-        file_name = incoming_message['target'].split('/')[4]  # get target file name from path
+        dir_name, file_name = split_target(incoming_message['target'])  # get target folder and file names
         notondisk_error_mgs = "Result Verify FAILED: " \
                               "Operation {0} failed on file {1} which is on disk. Invalidating".format(
                                 incoming_message['action'], dir_name + "/" + file_name)
@@ -0,0 +1,98 @@
+"""
+Weighted sampling of workload operations and io types
+2018 samuels (c)
+"""
+import random
+from fractions import Fraction
+from math import gcd
+
+__author__ = 'samuels'
+
+SAMPLE_BATCH_SIZE = 10000  # Values drawn at once by WeightedSampler
+
+
+class AliasTable(object):
+    """
+    Walker's alias method: every draw is one uniform random integer and one comparison, whatever the number of
+    values is. Weights are turned into integers (workload weights may be any int or float), and table is built with
+    integer arithmetic, so sampled distribution is exactly the given weights, no float rounding involved.
+    """
+
+    def __init__(self, choices):
+        """
+        Args:
+            choices: list of (value, weight) tuples, weights are non negative, at least one is positive
+        """
+        values, weights = zip(*choices)
+        weights = [Fraction(w) for w in weights]
+        if any(w < 0 for w in weights) or not any(weights):
+            raise ValueError(f"Bad weights: {weights}")
+        denominator = 1
+        for w in weights:
+            denominator = denominator * w.denominator // gcd(denominator, w.denominator)
+        weights = [int(w * denominator) for w in weights]
+        divisor = 0
+        for w in weights:
+            divisor = gcd(divisor, w)
+        weights = [w // divisor for w in weights]
+        self.values = values
+        self._size = len(weights)
+        self._total = sum(weights)  # every column of the table holds `_total` units of probability
+        self._threshold = [w * self._size for w in weights]
+        self._alias = list(values)
+        small = [i for i, w in enumerate(self._threshold) if w < self._total]
+        large = [i for i, w in enumerate(self._threshold) if w >= self._total]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            self._alias[s] = values[l]
+            self._threshold[l] -= self._total - self._threshold[s]
+            if self._threshold[l] < self._total:
+                small.append(large.pop())
+        for i in small + large:
+            self._threshold[i] = self._total
+
+    def sample(self, k):
+        """
+        Args:
+            k: int
+
+        Returns: list of `k` values
+        """
+        total = self._total
+        values = self.values
+        alias = self._alias
+        threshold = self._threshold
+        getrandbits = random.getrandbits
+        space = self._size * total
+        bits = space.bit_length()
+        samples = []
+        append = samples.append
+        # Uniform integers below `space` by rejection, draws out of range (less than half) are thrown away
+        while len(samples) < k:
+            for x in [getrandbits(bits) for _ in range(k - len(samples))]:
+                if x < space:
+                    column, u = divmod(x, total)
+                    append(values[column] if u < threshold[column] else alias[column])
+        return samples
+
+
+class WeightedSampler(object):
+    """
+    Hands out values of an AliasTable one by one, drawing them in batches
+    """
+
+    def __init__(self, choices, batch_size=SAMPLE_BATCH_SIZE):
+        """
+        Args:
+            choices: list of (value, weight) tuples
+            batch_size: int
+        """
+        self._table = AliasTable(choices)
+        self._batch_size = batch_size
+        self._samples = []
+
+    def __call__(self):
+        if not self._samples:
+            self._samples = self._table.sample(self._batch_size)
+        return self._samples.pop()
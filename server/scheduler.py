@@ -0,0 +1,168 @@
+"""
+Credit based worker scheduler for the Controller
+2018 samuels (c)
+"""
+import math
+
+from config import CONTROLLER_INITIAL_WINDOW, CONTROLLER_MIN_WINDOW, TARGET_QUEUE_DELAY
+
+__author__ = 'samuels'
+
+RATE_SMOOTHING = 0.5  # Weight of the last interval in completion rate moving average
+
+
+class WorkerScheduler(object):
+    """
+    Credit based flow control: every worker advertises how many outstanding jobs it can accept, and the Controller
+    only dispatches against the worker's window, which never exceeds advertised credits. The window follows the
+    observed completion rate of the worker, so it holds about TARGET_QUEUE_DELAY seconds of work: enough to keep
+    the worker saturated, but bounded in memory and in queueing delay.
+
+    Workers are kept grouped into buckets by number of free credits (window - in-flight jobs), so the worker with
+    most free credits is found without sorting all workers on every dispatch. Every operation is O(1), except
+    removing or resizing the worker which was the last one in the top bucket: it has to look up the next non-empty
+    bucket (O(number of distinct free credits values)), which happens on disconnect and window update only.
+
+    Totals of windows and loads are kept up to date as they change, so other threads (the Collector's stats) read
+    them without iterating per-worker tables the Controller thread is mutating.
+    """
+
+    def __init__(self, initial_window=CONTROLLER_INITIAL_WINDOW, min_window=CONTROLLER_MIN_WINDOW,
+                 target_queue_delay=TARGET_QUEUE_DELAY):
+        """
+        Args:
+            initial_window: int
+            min_window: int
+            target_queue_delay: float
+        """
+        self.initial_window = initial_window
+        self.min_window = min_window
+        self.target_queue_delay = target_queue_delay
+        self._load = {}  # worker_id -> number of in-flight jobs
+        self._window = {}  # worker_id -> number of jobs we allow in flight
+        self._credits = {}  # worker_id -> number of outstanding jobs worker advertised it can accept
+        self._completed = {}  # worker_id -> jobs completed since last window update
+        self._rate = {}  # worker_id -> completion rate moving average, jobs/sec
+        self._buckets = {}  # free credits -> {worker_id: None}, dict is used as ordered set
+        self._max_free = 0
+        self._total_window = 0
+        self._total_load = 0
+
+    def __len__(self):
+        return len(self._load)
+
+    def __contains__(self, worker_id):
+        return worker_id in self._load
+
+    def load(self, worker_id):
+        return self._load[worker_id]
+
+    def window(self, worker_id):
+        return self._window[worker_id]
+
+    @property
+    def total_window(self):
+        return self._total_window
+
+    @property
+    def total_load(self):
+        return self._total_load
+
+    def add_worker(self, worker_id, credits):
+        self._load[worker_id] = 0
+        self._credits[worker_id] = credits
+        self._window[worker_id] = max(1, min(credits, self.initial_window))
+        self._total_window += self._window[worker_id]
+        self._completed[worker_id] = 0
+        self._rate[worker_id] = None
+        self._bucket_add(self._window[worker_id], worker_id)
+        if self._window[worker_id] > self._max_free:
+            self._max_free = self._window[worker_id]
+
+    def remove_worker(self, worker_id):
+        free = self._free(worker_id)
+        self._total_window -= self._window[worker_id]
+        self._total_load -= self._load[worker_id]
+        for table in (self._load, self._window, self._credits, self._completed, self._rate):
+            del table[worker_id]
+        self._bucket_remove(free, worker_id)
+        if free == self._max_free and free not in self._buckets:
+            self._seek_max_free()
+
+    def job_assigned(self, worker_id):
+        free = self._free(worker_id)
+        self._move(worker_id, free, free - 1)
+        self._load[worker_id] += 1
+        self._total_load += 1
+        if free == self._max_free and free not in self._buckets:
+            self._max_free = free - 1
+
+    def job_done(self, worker_id):
+        free = self._free(worker_id)
+        self._move(worker_id, free, free + 1)
+        self._load[worker_id] -= 1
+        self._total_load -= 1
+        self._completed[worker_id] += 1
+        if free + 1 > self._max_free:
+            self._max_free = free + 1
+
+    def next_worker(self):
+        """Return the id of the worker with most free credits, or None if there are no workers or none of them
+        has a free credit
+        """
+        if not self._load or self._max_free <= 0:
+            return None
+        return next(iter(self._buckets[self._max_free]))
+
+    def update_windows(self, elapsed):
+        """
+        Adapts every worker's window to its completion rate observed during the last `elapsed` seconds
+
+        Args:
+            elapsed: float
+        """
+        if elapsed <= 0:
+            return
+        for worker_id in list(self._load):
+            rate = self._completed[worker_id] / elapsed
+            self._completed[worker_id] = 0
+            if self._rate[worker_id] is not None:
+                rate = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self._rate[worker_id]
+            self._rate[worker_id] = rate
+            window = int(math.ceil(rate * self.target_queue_delay))
+            self._set_window(worker_id, max(self.min_window, min(self._credits[worker_id], window)))
+
+    def _set_window(self, worker_id, window):
+        old_free = self._free(worker_id)
+        self._total_window += window - self._window[worker_id]
+        self._window[worker_id] = window
+        new_free = self._free(worker_id)
+        if new_free == old_free:
+            return
+        self._move(worker_id, old_free, new_free)
+        if new_free > self._max_free:
+            self._max_free = new_free
+        elif old_free == self._max_free and old_free not in self._buckets:
+            self._seek_max_free()
+
+    def _free(self, worker_id):
+        return self._window[worker_id] - self._load[worker_id]
+
+    def _move(self, worker_id, old_free, new_free):
+        self._bucket_remove(old_free, worker_id)
+        self._bucket_add(new_free, worker_id)
+
+    def _bucket_add(self, free, worker_id):
+        try:
+            self._buckets[free][worker_id] = None
+        except KeyError:
+            self._buckets[free] = {worker_id: None}
+
+    def _bucket_remove(self, free, worker_id):
+        bucket = self._buckets[free]
+        del bucket[worker_id]
+        if not bucket:
+            del self._buckets[free]
+
+    def _seek_max_free(self):
+        self._max_free = max(self._buckets) if self._buckets else 0
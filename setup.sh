@@ -32,6 +32,7 @@ sudo pip3.6 install treelib || SUCCESS=0
 sudo pip3.6 install paramiko || SUCCESS=0
 sudo pip3.6 install xxhash || SUCCESS=0
 sudo pip3.6 install pexpect || SUCCESS=0
+sudo pip3.6 install msgpack || SUCCESS=0
 
 echo -n "$TEST_NAME setup "
 if [ $SUCCESS = 1 ]
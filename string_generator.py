@@ -1,38 +1,90 @@
 """
 Alphanumeric string generator
+Hash collision names are searched in-process: every worker hashes batches of candidates which share a random prefix,
+so prefix's hash state is computed once per batch, see utils.dir_hash
 """
 import argparse
 import multiprocessing
-from multiprocessing import Manager
+import sqlite3
 import sys
 import traceback
 import uuid
-from time import sleep
 
-import utils.shell_utils
+import redis
+
+from config import FILE_NAMES_PATH
+from config.redis_config import redis_config
+from utils.dir_hash import DIR_HASHERS, DIR_HASH_BITS
+from utils.name_generator import NameGenerator, random_base62
 
 __author__ = 'samuels'
 
-PATH_TO_HASH_TOOL = "hash_tool"
+HC_LEVEL_BITS = {1: 6, 2: None}  # high hash bits which have to collide, by --level, all of them if None
+HC_SUFFIX_LENGTH = 8  # characters which differ between candidates of a batch
+HC_BATCH_SIZE = 4096  # candidates hashed per batch
+REDIS_NAMES_KEY = 'filenames'
 
 stop_event = None
 
 
-def store_console(string):
-    print(string)
+class ConsoleStore(object):
+    def put(self, names):
+        for name in names:
+            print(name)
+
+    def close(self):
+        pass
+
+
+class FileStore(object):
+    """
+    One name per line, which is what fileops_server reads from config.FILE_NAMES_PATH. Names are flushed as they
+    come, so a long search may be stopped at any time
+    """
+
+    def __init__(self, path=FILE_NAMES_PATH):
+        self._file = open(path, 'a')
+
+    def put(self, names):
+        self._file.write(''.join(name + '\n' for name in names))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
 
+class SqliteStore(object):
+    def __init__(self, path='filenames.db'):
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS filenames (name TEXT PRIMARY KEY)')
 
-def store_file(string):
-    with open('filenames.dat', 'a+') as f:
-        f.write(string + '\n')
+    def put(self, names):
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO filenames VALUES (?)', ((name,) for name in names))
 
+    def close(self):
+        self._db.close()
 
-def store_sqlite():
-    pass
 
+class RedisStore(object):
+    def __init__(self, key=REDIS_NAMES_KEY):
+        self._db = redis.StrictRedis(**redis_config)
+        self._key = key
 
-def store_redis():
-    pass
+    def put(self, names):
+        if names:
+            self._db.rpush(self._key, *names)
+
+    def close(self):
+        pass
+
+
+STORES = {
+    'console': ConsoleStore,
+    'file': FileStore,
+    'sqlite': SqliteStore,
+    'redis': RedisStore
+}
 
 
 def pool_setup(_event):
@@ -40,15 +92,34 @@ def pool_setup(_event):
     stop_event = _event
 
 
-def hc_worker(hc_value, names_queue, level):
+def find_collisions(hash_name, hc_value, bits, length, batch_size=HC_BATCH_SIZE):
+    """
+    Hashes one batch of candidates
+
+    Args:
+        hash_name: str, one of utils.dir_hash.DIR_HASHERS
+        hc_value: int, hash value names have to collide on
+        bits: int, high bits of the hash which have to be equal to hc_value: directories keep entries ordered by hash,
+              so names which share them end up in the same leaf
+        length: int, names length
+        batch_size: int, candidates in the batch
+
+    Returns: list, candidates which collide
+    """
+    prefix = random_base62(length - HC_SUFFIX_LENGTH).encode()
+    chars = random_base62(batch_size * HC_SUFFIX_LENGTH).encode()
+    suffixes = [chars[i:i + HC_SUFFIX_LENGTH] for i in range(0, len(chars), HC_SUFFIX_LENGTH)]
+    shift = DIR_HASH_BITS[hash_name] - bits
+    hashes = DIR_HASHERS[hash_name](prefix)(suffixes)
+    return [(prefix + suffix).decode() for suffix, value in zip(suffixes, hashes) if value >> shift == hc_value]
+
+
+def hc_worker(hash_name, hc_value, bits, length, names_queue):
     print("Worker {0} started...".format(uuid.uuid4()))
     while not stop_event.is_set():
-        generated_string = utils.shell_utils.StringUtils.get_random_string_nospec(64)
-        generated_hash = utils.shell_utils.ShellUtils.run_shell_command("/zebra/qa/samuels/misc/hash_tool",
-                                                                        '{0} 6'.format(generated_string, level))
-        generated_hash = int(generated_hash)
-        if hc_value == generated_hash:
-            names_queue.put(generated_string)
+        names = find_collisions(hash_name, hc_value, bits, length)
+        if names:
+            names_queue.put(names)
 
 
 def get_args():
@@ -58,15 +129,25 @@ def get_args():
 
     parser = argparse.ArgumentParser(
         description='String generator')
-    parser.add_argument('--length', type=str, default=64, help="String Length")
+    parser.add_argument('--length', type=int, default=64, help="String Length")
     parser.add_argument('--hc', action='store_true', help="Force hash collision")
     parser.add_argument('--level', type=int, choices=[1, 2], default=1,
-                        help="Level of hash collision. Depends on --hc flag")
+                        help="Level of hash collision: high 6 bits or full hash. Depends on --hc flag")
+    parser.add_argument('--bits', type=int, help="High hash bits which have to collide, overrides --level")
+    parser.add_argument('--hash', type=str, choices=sorted(DIR_HASHERS), default='xfs',
+                        help="Directory hash function of the file system under test")
     parser.add_argument('--count', type=int, default=10, help="Number of strings to generate")
     parser.add_argument('--hc_val', type=int, default=45, help="Hash collision value")
-    parser.add_argument('--store', type=str, required=True, choices=['console', 'file', 'sqlite', 'redis'],
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="Hash collision workers")
+    parser.add_argument('--store', type=str, required=True, choices=sorted(STORES),
                         default="console", help="Where to store generated data")
     args = parser.parse_args()
+    if args.hc:
+        if args.length <= HC_SUFFIX_LENGTH:
+            parser.error(f"--length has to be above {HC_SUFFIX_LENGTH} for hash collisions")
+        args.bits = args.bits or HC_LEVEL_BITS[args.level] or DIR_HASH_BITS[args.hash]
+        if not 0 < args.bits <= DIR_HASH_BITS[args.hash] or not 0 <= args.hc_val < 2 ** args.bits:
+            parser.error(f"--hc_val {args.hc_val} doesn't fit in {args.bits} bits of {args.hash} hash")
     return args
 
 
@@ -76,29 +157,28 @@ def main():
     stop_event = multiprocessing.Event()
     manager = multiprocessing.Manager()
     names_queue = manager.Queue()
-    store_method = {
-        'console': store_console,
-        'file': store_file,
-        'sqlite': store_sqlite,
-        'redis': store_redis
-    }
+    store = STORES[args.store]()
     try:
         if args.hc:
-            levels = {1: 6, 2: ""}
-            num_cores = multiprocessing.cpu_count()
-            print("{0} CPU/s detected".format(num_cores))
-            workers_pool = multiprocessing.Pool(num_cores, pool_setup, (stop_event,))
-            for _ in range(num_cores):
-                workers_pool.apply_async(hc_worker, args=(args.hc_val, names_queue, levels[args.level]))
-            for _ in range(args.count):
-                store_method[args.store](names_queue.get())
+            print("{0} workers, {1} hash, {2} bits".format(args.workers, args.hash, args.bits))
+            workers_pool = multiprocessing.Pool(args.workers, pool_setup, (stop_event,))
+            for _ in range(args.workers):
+                workers_pool.apply_async(hc_worker, args=(args.hash, args.hc_val, args.bits, args.length, names_queue))
+            stored = 0
+            while stored < args.count:
+                names = names_queue.get()[:args.count - stored]
+                store.put(names)
+                stored += len(names)
             stop_event.set()
-
+            workers_pool.close()
+            workers_pool.join()
         else:
-            for _ in range(args.count):
-                store_method[args.store](utils.shell_utils.StringUtils.get_random_string_nospec(64))
+            names = NameGenerator(min_length=args.length, max_length=args.length)
+            store.put(names.batch(args.count))
     except KeyboardInterrupt:
         stop_event.set()
+    finally:
+        store.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,27 @@
+"""
+FDCache tests, run from repository root: python3 -m pytest tests
+2018 samuels (c)
+"""
+import os
+
+from client.fd_cache import CACHED, FDCache
+
+__author__ = 'samuels'
+
+
+def test_write_after_another_handle_renamed_over_the_file(tmp_path):
+    mount_point = str(tmp_path)
+    with open(os.path.join(mount_point, 'file'), 'wb') as f:
+        f.write(b'old')
+    fd_cache = FDCache(CACHED)
+    with fd_cache.open(mount_point, '/file', os.O_RDWR) as fd:
+        assert os.pread(fd, 3, 0) == b'old'
+    # Another worker replaces the file, this one's cached descriptor still has the old one open
+    with open(os.path.join(mount_point, 'other'), 'wb') as f:
+        f.write(b'new')
+    os.rename(os.path.join(mount_point, 'other'), os.path.join(mount_point, 'file'))
+    with fd_cache.open(mount_point, '/file', os.O_RDWR) as fd:
+        os.pwrite(fd, b'NEW', 0)
+    fd_cache.close()
+    with open(os.path.join(mount_point, 'file'), 'rb') as f:
+        assert f.read() == b'NEW'
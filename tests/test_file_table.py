@@ -0,0 +1,36 @@
+"""
+FileTable tests, run from repository root: python3 -m pytest tests
+2018 samuels (c)
+"""
+import datetime
+
+from tree.file_table import FileTable, INDEX_INITIAL_SIZE
+
+__author__ = 'samuels'
+
+
+def test_remove_which_shrinks_index():
+    table = FileTable()
+    names = table.names()
+    rows = {next(names): None for _ in range(5000)}
+    for name in rows:
+        rows[name] = table.add(1, name)
+    removed = list(rows)[:4800]
+    index_size = len(table._index)
+    for name in removed:
+        table.remove(rows.pop(name))
+    assert INDEX_INITIAL_SIZE <= len(table._index) < index_size
+    for name in removed:
+        assert table.find(1, name) is None
+    for name, row in rows.items():
+        assert table.find(1, name) == row
+    assert table._index_used == len(rows)
+
+
+def test_creation_time_of_long_runs():
+    table = FileTable()
+    row = table.add(1, next(table.names()))
+    creation_time = table.epoch + datetime.timedelta(days=400, seconds=10, milliseconds=250)
+    table.creation_time[row] = table.to_ticks(creation_time)
+    assert datetime.timedelta(0) <= table.from_ticks(table.creation_time[row]) - creation_time < \
+        datetime.timedelta(seconds=1)
@@ -1,13 +1,32 @@
 import datetime
 import xxhash
 import random
-
-import uuid
+from array import array
 
 import treelib
 
+from config import TOMBSTONE_GRACE_PERIOD, TOMBSTONE_COMPACTION_BATCH
+from tree.file_table import FileTable, ONDISK, PENDING, MAX_MUTATIONS, OFFSET_UNIT
+from tree.indexed_dict import IndexedDict
+from utils.name_generator import NameGenerator
 from utils.shell_utils import StringUtils
 
+# Files populations Directory.get_random_file() picks from
+ALL_FILES = 'all'  # files which aren't deleted, on disk or pending
+ONDISK_FILES = 'ondisk'  # client confirmed file is on disk
+PENDING_FILES = 'pending'  # touched, but client didn't confirm yet
+
+
+def split_target(target):
+    """
+    Args:
+        target: str, '/dir/file', '/dir/subdir/file', or directory path 'dir/subdir' as mkdir has it
+
+    Returns: tuple, (directory path, last path component): ('dir/subdir', 'file')
+    """
+    dir_path, _, name = target.lstrip('/').rpartition('/')
+    return dir_path, name
+
 
 class TreeNode:
     def __init__(self, tag, identifier, data, parent=None):
@@ -47,21 +66,77 @@ class DirTree(object):
         self._dir_tree = Tree()#treelib.Tree()
         self._tree_base = self._dir_tree.create_node('Root', 'root')
         self._last_node = self._tree_base
+        self._nids = IndexedDict()  # Nodes IDs pool for easy random sampling
+        self.synced_nodes = IndexedDict()  # Nodes IDs list which already Synced with storage
+        self._synced_by_depth = {}  # depth -> IndexedDict of synced nodes IDs at that depth
+        self._parents_by_depth = {}  # depth -> IndexedDict of synced nodes IDs which may get more subdirectories
+        self.file_table = FileTable()  # Files of all directories
+        self._directories = {}  # Directory ID -> Directory, to find tombstones directories
+        self.compacted_files = 0  # tombstones reclaimed so far
+        self.retired_dirs = set()  # paths of directories removed from the model, they and their files stay on disk
+        self.file_names = None
+        self.names = None  # names of new directories
+        self.rename_names = None  # names of rename destinations
+        self.set_file_names(file_names)
+
+    def __getstate__(self):
+        # Names iterators can't be pickled, and names buffered by a snapshot's generator may be used already by the
+        # time it's restored, see set_file_names()
+        state = self.__dict__.copy()
+        state['file_names'] = state['names'] = state['rename_names'] = None
+        return state
+
+    def set_file_names(self, file_names=None):
+        """
+        Sets files names iterator of the tree and all its directories, and new generators of directory and rename
+        destination names
+
+        Args:
+            file_names: list, pre-generated file names, names generated by the files table if None
+        """
         if file_names:
             self.file_names = StringUtils.string_from_file_generator(file_names)  # pre-generated file_names iterator
         else:
-            self.file_names = StringUtils.random_string_generator()
-        self._nids = {}  # Nodes IDs pool for easy random sampling
-        self.synced_nodes = {}  # Nodes IDs list which already Synced with storage
+            self.file_names = self.file_table.names()
+        self.names = NameGenerator(min_length=64, max_length=64)
+        self.rename_names = self.file_table.names(min_length=64, max_length=64)
+        for directory in self._directories.values():
+            directory.file_names_generator = self.file_names
 
-    def append_node(self):
-        directory = Directory(self.file_names)
-        name = directory.name
-        nid = xxhash.xxh64(name).hexdigest()
-        self._nids[nid] = name
-        new_node = self._dir_tree.create_node(name, nid, parent=self._tree_base.identifier, data=directory)
+    def append_node(self, name=None, parent=None, parent_path=None):
+        """
+        Nodes are keyed by xxhash of directory's path, and tagged by it, so any directory is resolved by its full path
+        in O(1), see get_dir_by_name()
+
+        Args:
+            name: str, directory name, random if None
+            parent: Node, root if None
+            parent_path: str, path of a parent which was removed from the tree already, instead of `parent`
+        """
+        parent = parent or self._tree_base
+        if parent_path is None:
+            parent_path = parent.tag if parent.data is not None else ''
+        directory = Directory(self.file_names, self.file_table, name or next(self.names), parent_path)
+        self._directories[directory.id] = directory
+        if parent.data is not None:
+            parent.data.subdirs += 1
+        nid = xxhash.xxh64(directory.path).hexdigest()
+        self._nids[nid] = directory.path
+        new_node = self._dir_tree.create_node(directory.path, nid, parent=parent.identifier, data=directory)
         self._last_node = new_node
 
+    def mark_synced(self, node):
+        """
+        Directory is confirmed on disk: files and subdirectories may be created in it from now on
+
+        Args:
+            node: Node
+        """
+        depth = node.data.depth
+        self.synced_nodes[node.identifier] = node.tag
+        self._synced_by_depth.setdefault(depth, IndexedDict())[node.identifier] = node.tag
+        self._parents_by_depth.setdefault(depth, IndexedDict())[node.identifier] = node.tag
+
     @property
     def last_node(self):
         return self._last_node
@@ -81,14 +156,92 @@ class DirTree(object):
         return self._last_node.tag
 
     def get_dir_by_name(self, name):
+        """
+        Args:
+            name: str, directory path, 'dir' or 'dir/subdir/...'
+
+        Returns: Node, None if there's no such directory
+        """
         return self._dir_tree.get_node(xxhash.xxh64(name).hexdigest())
 
+    def get_file_by_path(self, path):
+        """
+
+        Args:
+            path: str, '/dir/file' or '/dir/subdir/.../file'
+
+        Returns: File, None if there's no such directory or file
+
+        """
+        dir_name, file_name = split_target(path)
+        dir_node = self.get_dir_by_name(dir_name)
+        if not dir_node:
+            return None
+        return dir_node.data.get_file_by_name(file_name)
+
     def remove_dir_by_name(self, name):
-        try:
-            cnt = self._dir_tree.remove_node(xxhash.xxh64(name).hexdigest())
-        except Exception:
-            raise
-        return cnt
+        """
+        Removes directory from the model with its files, it's not picked for any further operation. Its subdirectories
+        stay
+
+        Args:
+            name: str, directory path
+
+        Returns: int, number of removed nodes
+        """
+        nid = xxhash.xxh64(name).hexdigest()
+        node = self._dir_tree.get_node(nid)
+        if node:
+            node.data.drop_files()
+            self._directories.pop(node.data.id, None)
+            self.retired_dirs.add(name)
+            self._synced_by_depth.get(node.data.depth, {}).pop(nid, None)
+            self._parents_by_depth.get(node.data.depth, {}).pop(nid, None)
+        self.synced_nodes.pop(nid, None)
+        self._nids.pop(nid, None)
+        return self._dir_tree.remove_node(nid)
+
+    def compact_files(self, max_files=TOMBSTONE_COMPACTION_BATCH, now=None):
+        """
+        Reclaims rows of files which went off disk more than TOMBSTONE_GRACE_PERIOD ago. Tombstones are queued in
+        the order they were created, so a pass stops at the first one which isn't expired yet; it's cheap enough to
+        be called from the Controller's loop.
+        Queue entries of files which were reclaimed otherwise (directory removed, name reused) are skipped: their row
+        is free, or has another file's uuid.
+
+        Args:
+            max_files: int, max tombstones to reclaim in this pass
+            now: datetime, current time if None
+
+        Returns: int, number of reclaimed tombstones
+
+        """
+        table = self.file_table
+        tombstones = table.tombstones
+        expiry_time = table.to_ticks((now or datetime.datetime.now()) -
+                                     datetime.timedelta(seconds=TOMBSTONE_GRACE_PERIOD))
+        compacted = 0
+        while tombstones and compacted < max_files:
+            deletion_time, row, uuid = tombstones[0]
+            if deletion_time > expiry_time:
+                break
+            tombstones.popleft()
+            if table.flags[row] == 0 and table.uuid[row] == uuid:
+                self._directories[table.directory_id[row]].remove_file(row)
+                compacted += 1
+        self.compacted_files += compacted
+        return compacted
+
+    def files_metrics(self):
+        """
+
+        Returns: dict, numbers of live and dead (tombstones) files, reclaimed tombstones and files which have names the
+                 table didn't generate
+
+        """
+        table = self.file_table
+        return {'live': len(table) - table.dead, 'dead': table.dead, 'compacted': self.compacted_files,
+                'explicit_names': table.explicit_names}
 
     def get_last_node_data(self):
         """
@@ -105,20 +258,46 @@ class DirTree(object):
 
         """
         try:
-            return self._dir_tree.get_node(random.choice(list(self._nids.keys())))
+            return self._dir_tree.get_node(self._nids.random_key())
         except IndexError:
             return None
 
-    def get_random_dir_synced(self):
+    def get_random_dir_synced(self, depth=None):
         """
 
+        Args:
+            depth: int, any depth if None, top level directories are at depth 1
+
         Returns: Node
 
         """
-        try:
-            return self._dir_tree.get_node(random.choice(list(self.synced_nodes.keys())))
-        except IndexError:
+        synced_nodes = self.synced_nodes if depth is None else self._synced_by_depth.get(depth)
+        if not synced_nodes:
             return None
+        return self._dir_tree.get_node(synced_nodes.random_key())
+
+    def get_random_parent(self, depth, fanout=None):
+        """
+        Synced directories which reached `fanout` subdirectories are dropped from parent candidates on the way, so this
+        is O(1) amortized
+
+        Args:
+            depth: int, depth of the parent, root is at depth 0
+            fanout: int, max subdirectories of a directory, no limit if None
+
+        Returns: Node, random synced directory at `depth` which can get another subdirectory; None if there's none
+
+        """
+        if depth == 0:
+            return self._tree_base
+        parents = self._parents_by_depth.get(depth)
+        while parents:
+            nid = parents.random_key()
+            node = self._dir_tree.get_node(nid)
+            if fanout is None or node.data.subdirs < fanout:
+                return node
+            del parents[nid]
+        return None
 
     def get_random_dir_not_synced(self):
         """
@@ -137,7 +316,7 @@ class DirTree(object):
         Returns: str
 
         """
-        return self._dir_tree.get_node(random.choice(list(self._nids.keys()))).tag
+        return self._dir_tree.get_node(self._nids.random_key()).tag
 
     def get_random_dir_files(self):
         """
@@ -188,46 +367,138 @@ def build_recursive_tree(tree, base, depth, width):
 
 
 class Directory(object):
-    def __init__(self, file_names_generator):
+    def __init__(self, file_names_generator, file_table=None, name=None, parent_path=''):
+        """
+        Args:
+            file_names_generator: iterator of file names
+            file_table: FileTable, shared by all directories of a DirTree, own one if None
+            name: str, random if None
+            parent_path: str, empty for top level directories
+        """
         self.file_names_generator = file_names_generator
-        self._name = StringUtils.get_random_string_nospec(64)
+        self._name = name or StringUtils.get_random_string_nospec(64)
+        self.path = f"{parent_path}/{self._name}" if parent_path else self._name  # relative to mount point
+        self.depth = self.path.count('/') + 1
+        self.subdirs = 0
         self.ondisk = False
         self.checksum = 0
         self.creation_time = None
         self.size = 0  # Size of dir entry
         self.files = []
-        self.files_dict = {}
+        self._table = file_table if file_table is not None else FileTable()
+        self._id = self._table.new_directory_id()
+        # Rows of directory's files in FileTable by file state. Files which went off disk (state 0) are kept as
+        # tombstones for tid checks of late results, until DirTree.compact_files() reclaims them.
+        # File state has to be changed by mark_ondisk()/mark_not_ondisk(), so these stay in sync
+        self._rows = {ONDISK: array('I'), PENDING: array('I'), 0: array('I')}
+        self._populations = {ALL_FILES: (self._rows[ONDISK], self._rows[PENDING]),
+                             ONDISK_FILES: (self._rows[ONDISK],), PENDING_FILES: (self._rows[PENDING],)}
 
     @property
     def name(self):
         return self._name
 
-    def touch(self):
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def tombstones(self):
+        return len(self._rows[0])
+
+    def __len__(self):
+        """
+        Returns: int, number of files which aren't deleted
         """
+        return len(self._rows[ONDISK]) + len(self._rows[PENDING])
 
-        Returns: list
+    def __getstate__(self):
+        # Names iterator is shared with DirTree, which sets it back, see DirTree.set_file_names()
+        state = self.__dict__.copy()
+        state['file_names_generator'] = None
+        return state
+
+    def touch(self, name=None):
+        """
+
+        Args:
+            name: str, next generated name if None
+
+        Returns: str, name of the new pending file
 
         """
-        new_file = File(self.file_names_generator)
-        self.files_dict[xxhash.xxh64(new_file.name).hexdigest()] = new_file
-        return new_file.name
+        if name is None:
+            name = next(self.file_names_generator)
+        self._add_file(name)
+        return name
+
+    def mark_ondisk(self, file):
+        """
+        Args:
+            file: File
+        """
+        self._set_state(file.row, ONDISK)
+
+    def mark_not_ondisk(self, file):
+        """
+        Args:
+            file: File
+        """
+        self._set_state(file.row, 0)
 
     def get_file_by_name(self, name):
-        try:
-            return self.files_dict[xxhash.xxh64(name).hexdigest()]
-        except KeyError:
-            return None
+        row = self._table.find(self._id, name)
+        return None if row is None else File(self._table, row)
 
-    def get_random_file(self):
+    def find_row(self, name):
         """
+        Args:
+            name: str
 
-        Returns: list
+        Returns: int, FileTable row of the file, None if there's no such file
+        """
+        return self._table.find(self._id, name)
 
+    def get_random_file(self, population=ALL_FILES):
         """
-        try:
-            return random.choice(list(self.files_dict.values()))
-        except IndexError:
+
+        Args:
+            population: str, one of ALL_FILES, ONDISK_FILES, PENDING_FILES
+
+        Returns: File
+
+        """
+        row = self.get_random_row(population)
+        return None if row is None else File(self._table, row)
+
+    def get_random_row(self, population=ALL_FILES):
+        """
+        Same as get_random_file(), without a File view of the row
+
+        Args:
+            population: str, one of ALL_FILES, ONDISK_FILES, PENDING_FILES
+
+        Returns: int, FileTable row, None if the population is empty
+        """
+        populations = self._populations[population]
+        if len(populations) == 1:
+            rows = populations[0]
+            return rows[int(random.random() * len(rows))] if rows else None
+        total = sum(len(rows) for rows in populations)
+        if not total:
             return None
+        return self._population_row(populations, int(random.random() * total))
+
+    def iter_files(self, population=ALL_FILES):
+        """
+        Args:
+            population: str, one of ALL_FILES, ONDISK_FILES, PENDING_FILES
+
+        Returns: iterator of File
+        """
+        for rows in self._populations[population]:
+            for row in rows:
+                yield File(self._table, row)
 
     def get_random_files(self, f_number=10):
         """
@@ -238,48 +509,241 @@ class Directory(object):
         Returns: list
 
         """
+        populations = self._populations[ALL_FILES]
         try:
-            return random.sample(set(self.files_dict.values()), f_number)
-        except IndexError:
+            positions = random.sample(range(sum(len(rows) for rows in populations)), f_number)
+        except ValueError:
             return None
+        return [File(self._table, self._population_row(populations, position)) for position in positions]
 
     def delete_file_by_name(self, name):
-        del self.files_dict[xxhash.xxh64(name).hexdigest()]
+        row = self._table.find(self._id, name)
+        if row is not None:
+            self._remove_row(row)
+
+    def rename_file(self, source_name, dest_name, source=None):
+        """
+        Source file goes off disk, new file is pending until caller marks it on disk, and has source's data
 
-    def rename_file(self, source_name, dest_name):
-        new_file = File(name=dest_name)
-        self.files_dict[xxhash.xxh64(new_file.name).hexdigest()] = new_file
-        self.files_dict[xxhash.xxh64(source_name).hexdigest()].ondisk = False
-        return new_file
+        Args:
+            source_name: str
+            dest_name: str
+            source: File, file of any directory which was moved over `source_name`, its data goes to the new file
+
+        Returns: File
+        """
+        table = self._table
+        source_row = table.find(self._id, source_name)
+        if source_row is None:
+            raise KeyError(source_name)
+        self._set_state(source_row, 0)
+        data_row = source.row if source is not None else source_row
+        # Results of writes and truncates in flight to data's old name won't come for the new one, though they might
+        # have changed its data, so its data isn't verified anymore
+        unsettled = table.mutations[data_row]
+        tid, mutations = table.tid[source_row], table.mutations[source_row]
+        row = self._add_file(dest_name)
+        table.move_data(data_row, row)
+        if dest_name == source_name:
+            # Data of the name is replaced, jobs in flight to it carry on with the new file: it goes on with name's
+            # tids, and reads sent before aren't verified. Writes in flight stamp their blocks with the replaced
+            # file's uuid, whichever data they land in
+            table.tid[row] = table.unsettled_tid[row] = tid
+            table.mutations[row] = mutations
+            unsettled = unsettled or mutations
+        if unsettled:
+            table.mutations[row] = MAX_MUTATIONS
+        return File(table, row)
 
     def delete_random_file(self):
-        del self.files_dict[random.choice(list(self.files_dict.keys()))]
+        self.delete_random_files(1)
 
     def delete_random_files(self, f_number):
-        for f in random.sample(set(self.files_dict.keys()), f_number):
-            del self.files_dict[f]
+        for f in self.get_random_files(f_number):
+            self._remove_row(f.row)
+
+    def remove_file(self, row):
+        """
+        Args:
+            row: int, FileTable row of directory's file
+        """
+        self._remove_row(row)
+
+    def drop_files(self):
+        """
+        Frees all directory's files rows, once directory is removed from the tree
+        """
+        self._table.dead -= len(self._rows[0])
+        for rows in self._rows.values():
+            for row in rows:
+                self._table.remove(row)
+            del rows[:]
+
+    def _add_file(self, name):
+        existing_row = self._table.find(self._id, name)
+        if existing_row is not None:
+            self._remove_row(existing_row)
+        row = self._table.add(self._id, name)
+        self._append_row(row, PENDING)
+        return row
+
+    def _remove_row(self, row):
+        self._pop_row(row, self._table.flags[row])
+        self._table.remove(row)
+
+    def _set_state(self, row, state):
+        table = self._table
+        if table.flags[row] != state:
+            self._pop_row(row, table.flags[row])
+            self._append_row(row, state)
+            table.flags[row] = state
+            if not state:
+                table.tombstones.append((table.to_ticks(datetime.datetime.now()), row, table.uuid[row]))
+
+    def _append_row(self, row, state):
+        rows = self._rows[state]
+        self._table.position[row] = len(rows)
+        rows.append(row)
+        if not state:
+            self._table.dead += 1
+
+    def _pop_row(self, row, state):
+        if not state:
+            self._table.dead -= 1
+        rows = self._rows[state]
+        position = self._table.position[row]
+        last_row = rows.pop()
+        if position < len(rows):
+            rows[position] = last_row
+            self._table.position[last_row] = position
+
+    @staticmethod
+    def _population_row(populations, position):
+        for rows in populations:
+            if position < len(rows):
+                return rows[position]
+            position -= len(rows)
+        raise IndexError(position)
 
 
 class File(object):
-    def __init__(self, file_name_generator=None, name=None):
-        # self._name = StringUtils.get_random_string_nospec(64)
-        self._name = next(file_name_generator) if file_name_generator else name
-        self.data_pattern = 0
-        self.data_pattern_len = 0
-        self.data_pattern_hash = 'ef46db3751d8e999'  # zero xxhash hash
-        self.data_pattern_offset = 0
-        self.uuid = uuid.uuid4().hex[-5:]  # Unique session ID, will be modified on each file modify action
-        self.tid = 0  # incremental transaction id for each file
-        self.last_actions = []
-        self.creation_time = None
-        self.modify_time = datetime.datetime.now()
-        self.ondisk = False
-        self.size = 0
+    """
+    View of a FileTable row, attributes are read from and written to table's columns
+    """
+    __slots__ = ('_table', 'row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self.row = row
+
+    def __eq__(self, other):
+        return isinstance(other, File) and self._table is other._table and self.row == other.row
+
+    def __hash__(self):
+        return self.row
 
     @property
     def name(self):
-        return self._name
+        return self._table.name(self.row)
+
+    @property
+    def ondisk(self):
+        return self._table.flags[self.row] == ONDISK
+
+    @property
+    def pending(self):
+        return self._table.flags[self.row] == PENDING
+
+    @property
+    def size(self):
+        return self._table.size[self.row]
+
+    @size.setter
+    def size(self, value):
+        self._table.size[self.row] = value
+
+    @property
+    def data_pattern_id(self):
+        return self._table.data_pattern_id[self.row]
+
+    @data_pattern_id.setter
+    def data_pattern_id(self, value):
+        self._table.data_pattern_id[self.row] = value
+
+    @property
+    def data_pattern_len(self):
+        return self._table.data_pattern_len[self.row]
+
+    @data_pattern_len.setter
+    def data_pattern_len(self, value):
+        self._table.data_pattern_len[self.row] = value
+
+    @property
+    def data_pattern_offset(self):
+        return self._table.data_pattern_offset[self.row] * OFFSET_UNIT
+
+    @data_pattern_offset.setter
+    def data_pattern_offset(self, value):
+        self._table.data_pattern_offset[self.row] = value // OFFSET_UNIT
+
+    @property
+    def mutations(self):
+        """
+        Writes and truncates in flight, file's data is unknown if it's MAX_MUTATIONS
+        """
+        return self._table.mutations[self.row]
+
+    @property
+    def extents(self):
+        """
+        ExtentMap of file's writes, None if file has one written extent at most, it's inline
+        """
+        return self._table.extents.get(self.row)
+
+    def record_write(self, offset, length, pattern_id, tid):
+        self._table.record_write(self.row, offset, length, pattern_id, tid)
+
+    def record_truncate(self, size):
+        self._table.record_truncate(self.row, size)
+
+    def start_mutation(self):
+        self._table.start_mutation(self.row)
+
+    def end_mutation(self):
+        self._table.end_mutation(self.row)
+
+    def start_read(self):
+        return self._table.start_read(self.row)
+
+    def settled(self, tid):
+        return self._table.settled(self.row, tid)
+
+    @property
+    def uuid(self):
+        """
+        Unique session ID, 5 hex digits, modified on each file modify action
+        """
+        return '%05x' % self._table.uuid[self.row]
+
+    @uuid.setter
+    def uuid(self, value):
+        self._table.uuid[self.row] = int(value, 16)
+
+    @property
+    def tid(self):
+        """
+        Incremental transaction id
+        """
+        return self._table.tid[self.row]
+
+    @tid.setter
+    def tid(self, value):
+        self._table.tid[self.row] = value
+
+    @property
+    def creation_time(self):
+        return self._table.from_ticks(self._table.creation_time[self.row])
 
-    @name.setter
-    def name(self, new_name):
-        self._name = new_name
+    @creation_time.setter
+    def creation_time(self, value):
+        self._table.creation_time[self.row] = self._table.to_ticks(value)
@@ -0,0 +1,84 @@
+"""
+Per-file map of written extents, so reads of any range the file ever had written can be verified
+2018 samuels (c)
+"""
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+
+__author__ = 'samuels'
+
+
+class ExtentMap(object):
+    """
+    Written ranges of a file as sorted, non overlapping extents, in four typed arrays (struct-of-arrays, same as
+    FileTable): [start, end) file range, tid of the write job which wrote it, and data pattern id. Written blocks are
+    stamped with the write's tid (see client/block_format.py), so that's what client verifies a range against; only
+    22 bytes per extent are kept, whatever the data.
+
+    Write over existing extents splits the partially overwritten ones and drops the ones it covers, truncate drops and
+    clips extents past the new size. Both are a binary search and one slice assignment, which moves array's tail.
+    """
+    __slots__ = ('starts', 'ends', 'tids', 'pattern_ids')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.tids = array('I')
+        self.pattern_ids = array('H')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends, self.tids, self.pattern_ids)
+
+    def write(self, offset, length, tid, pattern_id):
+        """
+        Args:
+            offset: int
+            length: int, bytes written
+            tid: int, write job's tid
+            pattern_id: int
+        """
+        if length <= 0:
+            return
+        end = offset + length
+        starts, ends, tids, pattern_ids = self.starts, self.ends, self.tids, self.pattern_ids
+        first = bisect_right(ends, offset)  # first extent which ends past the write's offset
+        last = bisect_left(starts, end, first)  # first extent which starts at or after write's end
+        new_starts, new_ends, new_tids, new_ids = [offset], [end], [tid], [pattern_id]
+        if first < last and starts[first] < offset:
+            new_starts.insert(0, starts[first])
+            new_ends.insert(0, offset)
+            new_tids.insert(0, tids[first])
+            new_ids.insert(0, pattern_ids[first])
+        if first < last and ends[last - 1] > end:
+            new_starts.append(end)
+            new_ends.append(ends[last - 1])
+            new_tids.append(tids[last - 1])
+            new_ids.append(pattern_ids[last - 1])
+        starts[first:last] = array('q', new_starts)
+        ends[first:last] = array('q', new_ends)
+        tids[first:last] = array('I', new_tids)
+        pattern_ids[first:last] = array('H', new_ids)
+
+    def truncate(self, size):
+        """
+        Args:
+            size: int, new file size
+        """
+        first = bisect_left(self.starts, size)  # first extent which starts at or past the new size
+        for column in (self.starts, self.ends, self.tids, self.pattern_ids):
+            del column[first:]
+        if first and self.ends[first - 1] > size:
+            self.ends[first - 1] = size
+
+    def random_extent(self):
+        """
+        Returns: tuple, (start, end, tid) of a random extent, None if there are no extents
+        """
+        if not self.starts:
+            return None
+        index = int(random.random() * len(self.starts))
+        return self.starts[index], self.ends[index], self.tids[index]
@@ -0,0 +1,415 @@
+"""
+Compact struct-of-arrays storage for the files of the Controller's namespace model
+2018 samuels (c)
+"""
+import datetime
+import random
+from array import array
+from collections import deque
+
+import xxhash
+
+from config import UNWRITTEN_READ_SIZE
+from tree.extents import ExtentMap
+from utils.name_generator import random_base62
+
+__author__ = 'samuels'
+
+EMPTY = -1  # free slot in the names index
+NO_TIME = 0  # creation time which was never set
+TIME_MARGIN = datetime.timedelta(days=1)  # times are kept from that long before the table was made, for clocks skew
+OFFSET_UNIT = 4096  # data_pattern_offset unit, writes are whole blocks, see client/block_format.py
+INDEX_INITIAL_SIZE = 1024
+INDEX_GROWTH = 1.5  # index is resized by this factor, not to powers of two, so it's 50% full at least once it grows
+INDEX_MAX_LOAD = 0.75
+INDEX_MIN_LOAD = 0.2
+MAX_MUTATIONS = 255  # file with that many writes and truncates in flight, its data is unknown and never verified
+
+NAME_TAG_WIDTH = 10  # hex digits generated names start with: their key, then their number
+NAMES_POOL_SIZE = 4096  # random base62 characters of a names key, generated names are tag + a slice of them
+NAME_NUMBERS = 2 ** 32  # names a key generates
+EXPLICIT_NAME = 255  # name_key of a row which has a name from elsewhere, kept as is
+MAX_NAME_KEYS = EXPLICIT_NAME
+
+ONDISK = 1  # flags bits
+PENDING = 2
+FREE = 4  # row isn't used by any file
+
+
+class FileTable(object):
+    """
+    Every file of every directory is a row in a set of typed arrays (one per File attribute), instead of a Python
+    object with its own dict, datetime and strings: about 65 bytes per file, names and index included.
+
+    Names aren't stored: files get their names from the table's generators (see names()), and a generated name is a
+    function of the generator's key and of the name's number, so a row keeps just these two. Name starts with a hex
+    tag of both, so it's resolved back to them and checked against its key's pool. Names which weren't generated by
+    the table (e.g. pre-generated names list) are kept as is, per row.
+
+    Files are found by (directory id, name) through an open addressing hash index which holds just row numbers:
+    generated names are compared by their key and number. Freed rows are reused.
+
+    Directory keeps its own arrays of rows by file state, row's position in them is in `position` column, so
+    File states can be changed and sampled in O(1).
+
+    Files which went off disk are tombstones: their rows are kept for a grace period, so late results still find
+    them. `tombstones` queues (time the file went off disk, row, file's uuid) in that order for
+    DirTree.compact_files(); uuid tells whether the row is still the same tombstone.
+
+    Written extents are kept, so reads of any range are verified, not just of the last write. Most files have a
+    single one, it's kept inline: `data_pattern_offset`, `data_pattern_len`, `data_pattern_tid` and `data_pattern_id`
+    of the last write. File's ExtentMap (`extents`) is made only once a write leaves a second extent, from then on it
+    has all of them, and the inline columns are just the last write, where next sequential write goes from. Written
+    blocks are stamped with the file's `uuid`, so it moves with file's data on renames. Read which might race a write
+    or a truncate isn't verified: each job sent bumps file's tid, writes and truncates are counted in `mutations`
+    until their result comes, and `unsettled_tid` is the tid of the last job which file's data might not be settled
+    for - last write or truncate sent, or a read sent while any of them was in flight. Only reads with a greater tid
+    are verified.
+    """
+
+    def __init__(self):
+        self.size = array('q')
+        self.data_pattern_offset = array('I')  # in OFFSET_UNIT
+        self.data_pattern_len = array('I')
+        self.data_pattern_id = array('B')  # id in clients' pattern registry, 0 if never written
+        self.data_pattern_tid = array('I')  # tid of the last write
+        self.tid = array('I')
+        self.unsettled_tid = array('I')
+        self.mutations = array('B')  # writes and truncates in flight
+        self.uuid = array('I')  # 5 hex digits session ID
+        self.flags = array('B')
+        self.creation_time = array('I')  # seconds since `epoch`, rounded up, 136 years of them
+        self.directory_id = array('I')
+        self.position = array('I')  # position in the directory's array of rows in the same state
+        self.name_key = array('B')  # index of generator's key in `_name_keys`, EXPLICIT_NAME if the name isn't one
+        self.name_number = array('I')
+        self._name_keys = []  # (random base62 characters, min name length, number of name lengths)
+        self._explicit_names = {}  # row -> name, of rows which have an EXPLICIT_NAME
+        self.extents = {}  # row -> ExtentMap of files which have more than one written extent
+        self._free_rows = array('I')
+        self.tombstones = deque()
+        self.dead = 0  # rows of files which are off disk
+        self.epoch = datetime.datetime.now() - TIME_MARGIN
+        self._index = array('i', [EMPTY]) * INDEX_INITIAL_SIZE
+        self._index_used = 0
+        self._directories = 0
+
+    def __len__(self):
+        return len(self.size) - len(self._free_rows)
+
+    @property
+    def explicit_names(self):
+        return len(self._explicit_names)
+
+    def new_directory_id(self):
+        self._directories += 1
+        return self._directories
+
+    def names(self, min_length=16, max_length=64):
+        """
+        Generator of new file names, names generated by different calls never repeat. Its key is kept in the table,
+        so names it generated are found as long as the table lives, a checkpoint's copy of the table included
+
+        Args:
+            min_length: int, at least NAME_TAG_WIDTH + 1
+            max_length: int
+
+        Returns: iterator of str, lengths are uniform in the range
+        """
+        if min_length <= NAME_TAG_WIDTH or max_length < min_length:
+            raise ValueError(f"Bad generated names lengths: {min_length} - {max_length}")
+        return self._generate_names(self._new_name_key(min_length, max_length), min_length, max_length)
+
+    def _new_name_key(self, min_length, max_length):
+        if len(self._name_keys) >= MAX_NAME_KEYS:
+            raise ValueError(f"Files table has {MAX_NAME_KEYS} names keys already")
+        self._name_keys.append((random_base62(NAMES_POOL_SIZE + max_length), min_length, max_length - min_length + 1))
+        return len(self._name_keys) - 1
+
+    def _generate_names(self, key, min_length, max_length):
+        while True:
+            for number in range(NAME_NUMBERS):
+                yield self._generated_name(key, number)
+            key = self._new_name_key(min_length, max_length)
+
+    def to_ticks(self, time):
+        """
+        Args:
+            time: datetime, None if it isn't known
+
+        Returns: int, `creation_time` column value. Rounded up: results are checked against file's creation_time, so
+            an error up to a second after the file was created is taken as a late one, not as a failure
+        """
+        return NO_TIME if time is None else -((self.epoch - time) // datetime.timedelta(seconds=1))
+
+    def from_ticks(self, ticks):
+        return None if ticks == NO_TIME else self.epoch + datetime.timedelta(seconds=ticks)
+
+    def add(self, directory_id, name):
+        """
+        Args:
+            directory_id: int
+            name: str
+
+        Returns: int, row of the new file, file is pending
+        """
+        key, number = self._parse_name(name)
+        if key == EXPLICIT_NAME and len(name.encode('utf8')) > 255:
+            raise ValueError(f"File name is too long: {name}")
+        if self._index_used + 1 > len(self._index) * INDEX_MAX_LOAD:
+            self._index_resize(int(len(self._index) * INDEX_GROWTH))
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self.size[row] = self.data_pattern_offset[row] = self.data_pattern_len[row] = 0
+            self.data_pattern_id[row] = self.data_pattern_tid[row] = self.tid[row] = self.unsettled_tid[row] = 0
+            self.mutations[row] = 0
+            self.uuid[row] = random.getrandbits(20)
+            self.flags[row] = PENDING
+            self.creation_time[row] = NO_TIME
+            self.directory_id[row] = directory_id
+            self.position[row] = 0
+            self.name_key[row] = key
+            self.name_number[row] = number
+        else:
+            row = len(self.size)
+            for column in (self.size, self.data_pattern_offset, self.data_pattern_len, self.data_pattern_id,
+                           self.data_pattern_tid, self.tid, self.unsettled_tid, self.mutations, self.position):
+                column.append(0)
+            self.uuid.append(random.getrandbits(20))
+            self.flags.append(PENDING)
+            self.creation_time.append(NO_TIME)
+            self.directory_id.append(directory_id)
+            self.name_key.append(key)
+            self.name_number.append(number)
+        if key == EXPLICIT_NAME:
+            self._explicit_names[row] = name
+        self._index_insert(row)
+        return row
+
+    def remove(self, row):
+        # Row is freed first: an index shrink on removal re-inserts every row which isn't free
+        self.flags[row] = FREE
+        self._index_remove(row)
+        self._explicit_names.pop(row, None)
+        self.extents.pop(row, None)
+        self._free_rows.append(row)
+
+    def move_data(self, source_row, row):
+        """
+        Moves file's data attributes and extents, as file's contents move to another name
+
+        Args:
+            source_row: int
+            row: int
+        """
+        if source_row == row:
+            return
+        for column in (self.size, self.data_pattern_offset, self.data_pattern_len, self.data_pattern_id,
+                       self.data_pattern_tid, self.uuid):
+            column[row] = column[source_row]
+        extents = self.extents.pop(source_row, None)
+        if extents is not None:
+            self.extents[row] = extents
+
+    def record_write(self, row, offset, length, pattern_id, tid):
+        """
+        Args:
+            row: int
+            offset: int, multiple of OFFSET_UNIT
+            length: int, bytes written
+            pattern_id: int, id of the written data pattern
+            tid: int, write job's tid
+        """
+        if length <= 0:
+            return
+        extents = self.extents.get(row)
+        last_offset, last_length = self.data_pattern_offset[row] * OFFSET_UNIT, self.data_pattern_len[row]
+        if extents is None and last_length and (last_offset < offset or last_offset + last_length > offset + length):
+            # Inline extent isn't fully overwritten, file has two extents now
+            extents = self.extents[row] = ExtentMap()
+            extents.write(last_offset, last_length, self.data_pattern_tid[row], self.data_pattern_id[row])
+        if extents is not None:
+            extents.write(offset, length, tid, pattern_id)
+        self.data_pattern_id[row] = pattern_id
+        self.data_pattern_offset[row] = offset // OFFSET_UNIT
+        self.data_pattern_len[row] = length
+        self.data_pattern_tid[row] = tid
+        if self.size[row] < offset + length:
+            self.size[row] = offset + length
+
+    def record_truncate(self, row, size):
+        """
+        Args:
+            row: int
+            size: int, new file size
+        """
+        self.size[row] = size
+        # Last write is clipped, so next sequential write goes to the new end of the file
+        offset = self.data_pattern_offset[row] * OFFSET_UNIT
+        if offset >= size:
+            self.data_pattern_offset[row] = -(-size // OFFSET_UNIT)
+            self.data_pattern_len[row] = 0
+        elif offset + self.data_pattern_len[row] > size:
+            self.data_pattern_len[row] = size - offset
+        extents = self.extents.get(row)
+        if extents is not None:
+            extents.truncate(size)
+            if not extents:
+                del self.extents[row]
+
+    def start_mutation(self, row):
+        """
+        Write or truncate of the file is sent, with file's current tid
+        """
+        self.unsettled_tid[row] = self.tid[row]
+        if self.mutations[row] < MAX_MUTATIONS:
+            self.mutations[row] += 1
+
+    def end_mutation(self, row):
+        """
+        Result of file's write or truncate came, success or failure
+        """
+        if 0 < self.mutations[row] < MAX_MUTATIONS:
+            self.mutations[row] -= 1
+
+    def start_read(self, row):
+        """
+        Read of the file is sent, with file's current tid
+
+        Returns: tuple, (offset, length, tid of the write which wrote it) to read: a random extent, or file's head,
+                 tid 0, if it was never written
+        """
+        if self.mutations[row]:
+            self.unsettled_tid[row] = self.tid[row]
+        extents = self.extents.get(row)
+        if extents is not None:
+            start, end, tid = extents.random_extent()
+            return start, end - start, tid
+        if self.data_pattern_len[row]:
+            return self.data_pattern_offset[row] * OFFSET_UNIT, self.data_pattern_len[row], self.data_pattern_tid[row]
+        return 0, min(self.size[row], UNWRITTEN_READ_SIZE), 0
+
+    def settled(self, row, tid):
+        """
+        Returns: bool, True if file's data couldn't change while the read with `tid` was in flight
+        """
+        return tid > self.unsettled_tid[row]
+
+    def reset_mutations(self):
+        """
+        Results of writes and truncates in flight won't come anymore, as after restore from a checkpoint. They might
+        have been done though, so data of their files isn't verified anymore
+        """
+        self.mutations = array('B', (mutations and MAX_MUTATIONS for mutations in self.mutations))
+
+    def find(self, directory_id, name):
+        """
+        Args:
+            directory_id: int
+            name: str
+
+        Returns: int, row of the file, None if there's no such file
+        """
+        key, number = self._parse_name(name)
+        index = self._index
+        size = len(index)
+        directory_ids, name_keys = self.directory_id, self.name_key
+        if key == EXPLICIT_NAME:
+            slot = xxhash.xxh64(name, seed=directory_id).intdigest() % size
+            while True:
+                row = index[slot]
+                if row == EMPTY:
+                    return None
+                if name_keys[row] == EXPLICIT_NAME and directory_ids[row] == directory_id and \
+                        self._explicit_names[row] == name:
+                    return row
+                slot = slot + 1 if slot + 1 < size else 0
+        name_numbers = self.name_number
+        slot = hash((directory_id, key, number)) % size
+        while True:
+            row = index[slot]
+            if row == EMPTY:
+                return None
+            if name_numbers[row] == number and name_keys[row] == key and directory_ids[row] == directory_id:
+                return row
+            slot = slot + 1 if slot + 1 < size else 0
+
+    def name(self, row):
+        key = self.name_key[row]
+        if key == EXPLICIT_NAME:
+            return self._explicit_names[row]
+        return self._generated_name(key, self.name_number[row])
+
+    def _generated_name(self, key, number):
+        pool, min_length, lengths = self._name_keys[key]
+        mixed = number * 0x9e3779b1 & 0xffffffff  # Fibonacci hashing, consecutive numbers are far apart
+        start = mixed % NAMES_POOL_SIZE
+        return f'{key << 32 | number:010x}{pool[start:start + min_length - NAME_TAG_WIDTH + (mixed >> 16) % lengths]}'
+
+    def _parse_name(self, name):
+        """
+        Returns: tuple, (key, number) of a name the table generated, (EXPLICIT_NAME, 0) of any other name
+        """
+        if len(name) > NAME_TAG_WIDTH:
+            try:
+                tag = int(name[:NAME_TAG_WIDTH], 16)
+            except ValueError:
+                return EXPLICIT_NAME, 0
+            key, number = tag >> 32, tag & 0xffffffff
+            if key < len(self._name_keys):
+                # Same as comparing to _generated_name(), without building the name
+                pool, min_length, lengths = self._name_keys[key]
+                mixed = number * 0x9e3779b1 & 0xffffffff
+                if len(name) == min_length + (mixed >> 16) % lengths and \
+                        pool.startswith(name[NAME_TAG_WIDTH:], mixed % NAMES_POOL_SIZE):
+                    return key, number
+        return EXPLICIT_NAME, 0
+
+    def _home_slot(self, row, size):
+        key = self.name_key[row]
+        if key == EXPLICIT_NAME:
+            return xxhash.xxh64(self._explicit_names[row], seed=self.directory_id[row]).intdigest() % size
+        return hash((self.directory_id[row], key, self.name_number[row])) % size
+
+    def _index_insert(self, row):
+        index = self._index
+        size = len(index)
+        slot = self._home_slot(row, size)
+        while index[slot] != EMPTY:
+            slot = slot + 1 if slot + 1 < size else 0
+        index[slot] = row
+        self._index_used += 1
+
+    def _index_remove(self, row):
+        """
+        Linear probing deletion: entries following the removed one are shifted back into the hole unless their home
+        slot lies between the hole and themselves, so lookups never need tombstones
+        """
+        index = self._index
+        size = len(index)
+        hole = self._home_slot(row, size)
+        while index[hole] != row:
+            hole = hole + 1 if hole + 1 < size else 0
+        slot = hole
+        while True:
+            slot = slot + 1 if slot + 1 < size else 0
+            other = index[slot]
+            if other == EMPTY:
+                break
+            home = self._home_slot(other, size)
+            if (hole < slot and hole < home <= slot) or (hole > slot and (home > hole or home <= slot)):
+                continue
+            index[hole] = other
+            hole = slot
+        index[hole] = EMPTY
+        self._index_used -= 1
+        if size > INDEX_INITIAL_SIZE and self._index_used < size * INDEX_MIN_LOAD:
+            self._index_resize(max(int(size / INDEX_GROWTH), INDEX_INITIAL_SIZE))
+
+    def _index_resize(self, size):
+        self._index = array('i', [EMPTY]) * size
+        self._index_used = 0
+        flags = self.flags
+        for row in range(len(self.size)):
+            if flags[row] != FREE:
+                self._index_insert(row)
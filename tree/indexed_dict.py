@@ -0,0 +1,113 @@
+"""
+Dictionary with O(1) uniform random sampling
+2018 samuels (c)
+"""
+import random
+from collections.abc import MutableMapping
+
+__author__ = 'samuels'
+
+
+class IndexedDict(MutableMapping):
+    """
+    Keys and values are kept in two lists, with a key -> position map. Deleting swaps the last entry into the freed
+    position, so insert, delete, lookup and picking a random entry are all O(1), while random.choice() over a plain
+    dict requires copying its keys into a list first. Sampling k distinct entries is O(k). Iteration order isn't
+    insertion order once something was deleted; popitem() removes the last entry in iteration order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._keys = []
+        self._values = []
+        self._positions = {}  # key -> position in _keys and _values
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._values[self._positions[key]]
+
+    def __setitem__(self, key, value):
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self._keys)
+            self._keys.append(key)
+            self._values.append(value)
+        else:
+            self._values[position] = value
+
+    def __delitem__(self, key):
+        self._remove(self._positions.pop(key))
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, dict(zip(self._keys, self._values)))
+
+    def pop(self, key, *default):
+        position = self._positions.pop(key, None)
+        if position is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        return self._remove(position)
+
+    def popitem(self):
+        """
+        Returns: (key, value) tuple of the last entry; KeyError if empty
+        """
+        if not self._keys:
+            raise KeyError('popitem(): dictionary is empty')
+        key = self._keys.pop()
+        del self._positions[key]
+        return key, self._values.pop()
+
+    def random_key(self):
+        """
+        Returns: key picked uniformly at random; IndexError if empty, same as random.choice()
+        """
+        return self._keys[self._random_position()]
+
+    def random_value(self):
+        return self._values[self._random_position()]
+
+    def random_item(self):
+        position = self._random_position()
+        return self._keys[position], self._values[position]
+
+    def sample_keys(self, k):
+        """
+        Args:
+            k: int
+
+        Returns: list of `k` distinct keys picked at random, O(k); ValueError if there are less than `k` keys
+        """
+        return [self._keys[position] for position in random.sample(range(len(self._keys)), k)]
+
+    def sample_values(self, k):
+        return [self._values[position] for position in random.sample(range(len(self._values)), k)]
+
+    def _remove(self, position):
+        """
+        Moves the last entry to `position`
+
+        Returns: value which was at `position`
+        """
+        value = self._values[position]
+        last_key = self._keys.pop()
+        last_value = self._values.pop()
+        if position < len(self._keys):
+            self._keys[position] = last_key
+            self._values[position] = last_value
+            self._positions[last_key] = position
+        return value
+
+    def _random_position(self):
+        if not self._keys:
+            raise IndexError('Cannot choose from an empty dictionary')
+        return random.randrange(len(self._keys))
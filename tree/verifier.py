@@ -0,0 +1,189 @@
+"""
+Namespace verifier: walks mounted export in parallel and diffs it against the DirTree model
+2018 samuels (c)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import NAMESPACE_VERIFIER_WORKERS
+from tree.dirtree import ONDISK_FILES
+from tree.file_table import MAX_MUTATIONS
+
+__author__ = 'samuels'
+
+# Diff records kinds
+MISSING_FILE = 'missing_file'  # model has the file on disk, export doesn't
+UNEXPECTED_FILE = 'unexpected_file'  # export has a file the model doesn't know of or has deleted
+SIZE_MISMATCH = 'size_mismatch'
+ENTRY_COUNT = 'entry_count'  # files count of a directory is out of the range the model allows
+MISSING_DIR = 'missing_dir'
+UNEXPECTED_DIR = 'unexpected_dir'  # not walked any further
+ERROR = 'error'  # directory couldn't be listed
+
+IN_FLIGHT_PER_WORKER = 2  # directories listings queued per worker
+
+
+class NamespaceVerifier(object):
+    """
+    Directories are listed by a pool of threads with os.scandir(), round robin over the mount points, so all VIPs
+    serve the walk. Every worker diffs its directory against the model, and only its diff records and subdirectories
+    come back, so memory holds listings of in-flight directories only, never the whole namespace.
+
+    Model is read only, verifier has to run while nothing changes the DirTree: on a DirTree restored from the
+    checkpoint, or on Controller's tree once the test run is over. Files which are pending in the model, and
+    directories which aren't synced yet, may or may not be on disk, so they aren't reported. Directories removed from
+    the model (see DirTree.retired_dirs) are walked, but their files aren't checked.
+
+    Clients finish their outstanding jobs after the Controller stops taking results, so entries changed (ctime, which
+    renames update too) after the model's last update (`settled_time`) aren't reported, nor missing files and entry
+    counts of directories changed after it; they are counted in `unsettled`, as are sizes of files whose data the
+    model doesn't know (see FileTable.mutations).
+
+    A directory which is missing or can't be listed is reported once: its subdirectories aren't reported as missing
+    on top of it.
+    """
+
+    def __init__(self, dir_tree, mount_points, workers=NAMESPACE_VERIFIER_WORKERS, settled_time=None):
+        """
+        Args:
+            dir_tree: DirTree
+            mount_points: list, mount points of the export under test
+            workers: int, parallel directory listings
+            settled_time: float, seconds since epoch, model has all results of operations done before, all entries
+                          are checked if None
+        """
+        self._dir_tree = dir_tree
+        self.mount_points = mount_points
+        self.workers = workers
+        self.settled_time = settled_time if settled_time is not None else float('inf')
+        self.dirs = 0  # directories listed
+        self.entries = 0  # directory entries seen
+        self.diffs = 0  # diff records
+        self.unsettled = 0  # entries and directories which changed after settled_time
+
+    def diff(self):
+        """
+        Walks the export
+
+        Returns: iterator of dict, diff records: 'kind', 'path' relative to mount point, and kind's details
+        """
+        visited = set()
+        failed = set()  # directories reported missing or which couldn't be listed
+        pending = ['']
+        in_flight = set()
+        with ThreadPoolExecutor(self.workers) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.workers * IN_FLIGHT_PER_WORKER:
+                    mount_point = self.mount_points[self.dirs % len(self.mount_points)]
+                    in_flight.add(executor.submit(self._diff_dir, pending.pop(), mount_point))
+                    self.dirs += 1
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, entries, unsettled, records, subdirs = future.result()
+                    visited.add(path)
+                    if records and records[0]['kind'] in (MISSING_DIR, ERROR):
+                        failed.add(path)
+                    self.entries += entries
+                    self.unsettled += unsettled
+                    pending.extend(subdirs)
+                    for record in records:
+                        self.diffs += 1
+                        yield record
+        # Parents sort before their subdirectories
+        for path in sorted(self._dir_tree.synced_nodes.values()):
+            if path in visited or self._under(path, failed):
+                continue
+            failed.add(path)
+            self.diffs += 1
+            yield {'kind': MISSING_DIR, 'path': path}
+
+    @staticmethod
+    def _under(path, dirs):
+        """
+        Returns: bool, whether path is a subdirectory, at any depth, of one of dirs
+        """
+        parent = path.rpartition('/')[0]
+        while parent:
+            if parent in dirs:
+                return True
+            parent = parent.rpartition('/')[0]
+        return False
+
+    def _diff_dir(self, path, mount_point):
+        """
+        Args:
+            path: str, directory path relative to mount point, empty for the mount point itself
+            mount_point: str
+
+        Returns: tuple, (path, number of entries, number of unsettled entries, diff records, subdirectories paths to
+                 walk)
+        """
+        dir_tree = self._dir_tree
+        settled_time = self.settled_time
+        node = dir_tree.get_dir_by_name(path) if path else None
+        directory = node.data if node else None
+        records = []
+        subdirs = []
+        on_disk = set()
+        entries = files = unsettled = 0
+        dir_path = os.path.join(mount_point, path)
+        try:
+            dir_settled = os.stat(dir_path).st_ctime <= settled_time
+            with os.scandir(dir_path) as dir_entries:
+                for entry in dir_entries:
+                    entries += 1
+                    entry_path = f"{path}/{entry.name}" if path else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        subdir = dir_tree.get_dir_by_name(entry_path)
+                        if subdir:
+                            if subdir.identifier in dir_tree.synced_nodes:
+                                subdirs.append(entry_path)
+                        elif entry_path in dir_tree.retired_dirs:
+                            subdirs.append(entry_path)
+                        elif entry.stat(follow_symlinks=False).st_ctime <= settled_time:
+                            records.append({'kind': UNEXPECTED_DIR, 'path': entry_path})
+                        else:
+                            unsettled += 1
+                        continue
+                    files += 1
+                    if directory is None:
+                        if path:
+                            continue
+                        if entry.stat(follow_symlinks=False).st_ctime > settled_time:
+                            unsettled += 1
+                        else:
+                            records.append({'kind': UNEXPECTED_FILE, 'path': entry_path})
+                        continue
+                    f = directory.get_file_by_name(entry.name)
+                    if f is not None and f.pending:
+                        continue
+                    if f is not None and f.ondisk:
+                        on_disk.add(entry.name)
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_ctime > settled_time:
+                        unsettled += 1
+                    elif f is None or not f.ondisk:
+                        records.append({'kind': UNEXPECTED_FILE, 'path': entry_path})
+                    elif f.mutations == MAX_MUTATIONS:
+                        unsettled += 1
+                    elif stat.st_size != f.size:
+                        records.append({'kind': SIZE_MISMATCH, 'path': entry_path, 'disk': stat.st_size,
+                                        'model': f.size})
+        except FileNotFoundError:
+            return path, entries, unsettled, [{'kind': MISSING_DIR, 'path': path}], []
+        except OSError as os_error:
+            return path, entries, unsettled, [{'kind': ERROR, 'path': path, 'error': str(os_error)}], []
+        if directory is not None and not dir_settled:
+            unsettled += 1
+        elif directory is not None:
+            model_files = 0
+            for f in directory.iter_files(ONDISK_FILES):
+                model_files += 1
+                name = f.name
+                if name not in on_disk:
+                    records.append({'kind': MISSING_FILE, 'path': f"{path}/{name}"})
+            pending = len(directory) - model_files
+            if not model_files <= files <= model_files + pending:
+                records.append({'kind': ENTRY_COUNT, 'path': path, 'disk': files, 'model': model_files,
+                                'pending': pending})
+        return path, entries, unsettled, records, subdirs
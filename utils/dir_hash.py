@@ -0,0 +1,111 @@
+"""
+In-process file systems directory hash functions, for hash collision names search
+2018 samuels (c)
+"""
+import xxhash
+
+__author__ = 'samuels'
+
+MASK32 = 0xffffffff
+
+
+def _rol32(value, bits):
+    return ((value << bits) | (value >> (32 - bits))) & MASK32
+
+
+def _xfs_update(value, name):
+    """
+    xfs_da_hashname() over `name`, starting from `value` instead of 0
+
+    Returns: int
+    """
+    full = len(name) - len(name) % 4
+    for i in range(0, full, 4):
+        value = (name[i] << 21) ^ (name[i + 1] << 14) ^ (name[i + 2] << 7) ^ name[i + 3] ^ _rol32(value, 28)
+    rest = len(name) - full
+    if rest == 3:
+        return (name[full] << 14) ^ (name[full + 1] << 7) ^ name[full + 2] ^ _rol32(value, 21)
+    if rest == 2:
+        return (name[full] << 7) ^ name[full + 1] ^ _rol32(value, 14)
+    if rest == 1:
+        return name[full] ^ _rol32(value, 7)
+    return value
+
+
+def xfs_hasher(prefix):
+    """
+    XFS directory entries hash, xfs_da_hashname()
+
+    Args:
+        prefix: bytes, common prefix of the names to hash
+
+    Returns: function, list of names suffixes (bytes) -> list of hashes (int)
+    """
+    full = len(prefix) - len(prefix) % 4
+    prefix_value = _xfs_update(0, prefix[:full])
+    tail = prefix[full:]
+    return lambda suffixes: [_xfs_update(prefix_value, tail + suffix) for suffix in suffixes]
+
+
+def _dx_hack_update(hash0, hash1, name):
+    for char in name:
+        value = (hash1 + (hash0 ^ (char * 7152373))) & MASK32
+        if value & 0x80000000:
+            value = (value - 0x7fffffff) & MASK32
+        hash0, hash1 = value, hash0
+    return hash0, hash1
+
+
+def ext4_legacy_hasher(prefix):
+    """
+    ext3/ext4 htree 'legacy_unsigned' hash, dx_hack_hash_unsigned()
+
+    Args:
+        prefix: bytes, common prefix of the names to hash
+
+    Returns: function, list of names suffixes (bytes) -> list of hashes (int)
+    """
+    hash0, hash1 = _dx_hack_update(0x12a3fe2d, 0x37abe8f9, prefix)
+    return lambda suffixes: [(_dx_hack_update(hash0, hash1, suffix)[0] << 1) & MASK32 for suffix in suffixes]
+
+
+def xxh64_hasher(prefix):
+    """
+    xxHash64, which Controller keys directories and files by
+
+    Args:
+        prefix: bytes, common prefix of the names to hash
+
+    Returns: function, list of names suffixes (bytes) -> list of hashes (int)
+    """
+    prefix_state = xxhash.xxh64(prefix)
+
+    def hash_batch(suffixes):
+        hashes = []
+        for suffix in suffixes:
+            state = prefix_state.copy()
+            state.update(suffix)
+            hashes.append(state.intdigest())
+        return hashes
+
+    return hash_batch
+
+
+# Names of a batch share a prefix, so hashers compute prefix's hash state once, and only hash suffixes per name
+DIR_HASHERS = {
+    'xfs': xfs_hasher,
+    'ext4_legacy': ext4_legacy_hasher,
+    'xxh64': xxh64_hasher,
+}
+DIR_HASH_BITS = {'xfs': 32, 'ext4_legacy': 32, 'xxh64': 64}
+
+
+def dir_hash(hash_name, name):
+    """
+    Args:
+        hash_name: str, one of DIR_HASHERS
+        name: str
+
+    Returns: int, hash of a single name
+    """
+    return DIR_HASHERS[hash_name](b'')([name.encode('utf8')])[0]
@@ -0,0 +1,120 @@
+"""
+Batch generator of random base62 file and directory names
+2018 samuels (c)
+"""
+import itertools
+import os
+import random
+from string import digits, ascii_letters
+
+__author__ = 'samuels'
+
+ALPHABET = (digits + ascii_letters).encode()
+# Random bytes are mapped onto the alphabet by value modulo 62, bytes of 248 and above are dropped, so every
+# character is equally likely
+_REJECTED = bytes(range(len(ALPHABET) * (256 // len(ALPHABET)), 256))
+_TO_ALPHABET = bytes(ALPHABET[value % len(ALPHABET)] for value in range(256))
+UNIQUE_COUNTER_WIDTH = 8  # base62 digits of the sequence number in unique names, 62 ** 8 names per generator
+UNIQUE_SESSION_WIDTH = 4  # random base62 digits which tell unique names of different generators apart
+DEFAULT_BATCH_SIZE = 4096
+
+
+def random_base62(length):
+    """
+    Args:
+        length: int
+
+    Returns: str, `length` random base62 characters
+    """
+    chars = b''
+    while len(chars) < length:
+        # ~3% of the bytes are rejected, so a bit more than needed is drawn
+        chars += os.urandom(length + length // 16 + 8).translate(None, _REJECTED)
+    return chars[:length].translate(_TO_ALPHABET).decode('ascii')
+
+
+def to_base62(number, width):
+    """
+    Args:
+        number: int
+        width: int, result is zero padded to it
+
+    Returns: str
+    """
+    chars = []
+    while number:
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return bytes(reversed(chars)).decode('ascii').rjust(width, '0')
+
+
+class NameGenerator(object):
+    """
+    Iterator of random base62 names, which are made `batch_size` at a time: characters come from one os.urandom()
+    call mapped onto the alphabet by bytes.translate(), lengths from one random.choices() call, so there's no Python
+    level work per character.
+
+    Name is `prefix` + random part + `suffix`, random part length is drawn from `lengths`. In unique mode random part
+    starts with a per generator session tag and a sequence number, so a generator never repeats a name and generators
+    hardly repeat names of one another.
+    """
+
+    def __init__(self, min_length=16, max_length=64, lengths=None, prefix='', suffix='', unique=False,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            min_length: int, random part length range, lengths are uniform in it unless `lengths` is given
+            max_length: int
+            lengths: dict, {random part length: weight}
+            prefix: str
+            suffix: str
+            unique: bool
+            batch_size: int, names made at once
+        """
+        if lengths is None:
+            lengths = {length: 1 for length in range(min_length, max_length + 1)}
+        self._lengths = [int(length) for length in lengths]
+        self._cum_weights = list(itertools.accumulate(lengths.values()))
+        self.prefix = prefix
+        self.suffix = suffix
+        self.unique = unique
+        if unique:
+            if min(self._lengths) < UNIQUE_SESSION_WIDTH + UNIQUE_COUNTER_WIDTH:
+                raise ValueError(f"Unique names are at least {UNIQUE_SESSION_WIDTH + UNIQUE_COUNTER_WIDTH} "
+                                 f"characters long, lengths: {self._lengths}")
+            self._session = random_base62(UNIQUE_SESSION_WIDTH)
+        self._counter = 0
+        self.batch_size = batch_size
+        self._batch = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._batch:
+            self._batch = self.batch(self.batch_size)
+            self._batch.reverse()
+        return self._batch.pop()
+
+    def batch(self, count):
+        """
+        Args:
+            count: int
+
+        Returns: list, `count` new names
+        """
+        lengths = random.choices(self._lengths, cum_weights=self._cum_weights, k=count)
+        if self.unique:
+            tag_width = UNIQUE_SESSION_WIDTH + UNIQUE_COUNTER_WIDTH
+            lengths = [length - tag_width for length in lengths]
+        chars = random_base62(sum(lengths))
+        ends = list(itertools.accumulate(lengths))
+        starts = [0] + ends[:-1]
+        prefix, suffix = self.prefix, self.suffix
+        if self.unique:
+            first, self._counter = self._counter, self._counter + count
+            tags = [self._session + to_base62(number, UNIQUE_COUNTER_WIDTH) for number in range(first, first + count)]
+            return [f"{prefix}{tag}{chars[start:end]}{suffix}" for tag, start, end in zip(tags, starts, ends)]
+        if prefix or suffix:
+            return [f"{prefix}{chars[start:end]}{suffix}" for start, end in zip(starts, ends)]
+        return [chars[start:end] for start, end in zip(starts, ends)]